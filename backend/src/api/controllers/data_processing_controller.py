@@ -17,17 +17,39 @@ class DataProcessingController(ABC):
         req: PlacedObjectsRequest,
         session_id: Optional[str] 
     ):
+        """
+        Submits the PET update as a job to the QGIS container. Returns the job id right away,
+        the status is polled with get_update_status.
+        """
         endpoint = f"{self.QGIS_API_BASE_URL}/pet/update"
         payload = req.model_dump(mode="json")
 
-        async with httpx.AsyncClient(timeout=200.0) as client:
+        return await self._forward(
+            "POST", endpoint, json=payload, params={"session_id": session_id}
+        )
+
+    async def get_update_status(
+        self,
+        job_id: str,
+        session_id: Optional[str]
+    ):
+        """Returns the status (queued/running/done/failed) and, once done, the output of a PET update job."""
+        endpoint = f"{self.QGIS_API_BASE_URL}/pet/jobs/{job_id}"
+
+        return await self._forward("GET", endpoint, params={"session_id": session_id})
+
+    async def _forward(self, method: str, endpoint: str, **kwargs):
+        async with httpx.AsyncClient(timeout=10.0) as client:
             try:
-                response = await client.post(endpoint, json=payload, params={"session_id": session_id})
-                response.raise_for_status()
+                response = await client.request(method, endpoint, **kwargs)
 
+                # The status of the QGIS container (202, 404, 503...) is passed on as is
                 return JSONResponse(
                     status_code=response.status_code,
-                    content=response.json()
+                    content=response.json(),
+                    headers={
+                        key: value for key, value in response.headers.items() if key.lower() == "retry-after"
+                    },
                 )
             except ValueError:
                 return JSONResponse(
@@ -65,6 +65,16 @@ async def update_pet_map_based_on_objects(
         session_id=session_id
     )
 
+@api_router.get("/update-pet/{job_id}")
+async def get_update_pet_status(
+    job_id: str,
+    session_id: Optional[str] = Cookie(default=None)
+):
+    return await dpc_controller.get_update_status(
+        job_id,
+        session_id=session_id
+    )
+
 @metadata_3dbag_router.get("/search-pand", response_model=AggregatedBagResponse)
 async def read_3dbag_by_coordinates(
     x_coord: float = Query(..., description="X coordinate (Rijksdriehoeksstelsel, EPSG:28992)"),
@@ -6,6 +6,41 @@ import { lonLatToRd } from '../../map/utils/crs';
 
 type LayerMap = Record<string, Layer>;
 
+type PetJobStatus = 'queued' | 'running' | 'done' | 'failed' | 'cancelled';
+
+const PET_JOB_POLL_INTERVAL_MS = 1000;
+const PET_JOB_TIMEOUT_MS = 10 * 60 * 1000;
+
+/**
+ * Polls a PET update job until it is done. Resolves to false when the job was cancelled because a newer
+ * update of the session superseded it. Throws when the job failed or takes too long.
+ */
+async function waitForPetJob(jobId: string): Promise<boolean> {
+    const deadline = Date.now() + PET_JOB_TIMEOUT_MS;
+
+    while (Date.now() < deadline) {
+        const response = await fetch(`/backend/update-pet/${encodeURIComponent(jobId)}`);
+        if (!response.ok) {
+            throw new Error(`Failed to get the status of pet update ${jobId}: ${response.status} ${response.statusText}`);
+        }
+
+        const job: { job_status: PetJobStatus; error?: string | null } = await response.json();
+        if (job.job_status === 'done') {
+            return true;
+        }
+        if (job.job_status === 'cancelled') {
+            return false;
+        }
+        if (job.job_status === 'failed') {
+            throw new Error(`Pet update failed: ${job.error ?? 'unknown error'}`);
+        }
+
+        await new Promise(resolve => setTimeout(resolve, PET_JOB_POLL_INTERVAL_MS));
+    }
+
+    throw new Error(`Pet update ${jobId} did not finish in time`);
+}
+
 export function useUserObjectsLayer(
     showObjects: boolean,
     isEditingMode: boolean,
@@ -207,6 +242,13 @@ export function useUserObjectsLayer(
                 throw new Error(`Failed to update pet: ${response.status} ${response.statusText}`);
             }
 
+            const { job_id: jobId } = await response.json();
+            const done = await waitForPetJob(jobId);
+            if (!done) {
+                // A newer save of the objects replaced this one, that save updates the state
+                return;
+            }
+
             await Promise.resolve().then(() => {
                 localStorage.setItem(LOCAL_STORAGE_KEY, JSON.stringify(objectsToSave));
                 setUserObjects(objectsToSave);
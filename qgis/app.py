@@ -2,6 +2,7 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from src.configs.preflight import init_qgis
 from src.api.router import api_router
+from src.api.controllers.pet_controller import job_service
 
 qgs = init_qgis() 
 app = FastAPI()
@@ -33,6 +34,11 @@ async def unexpected_exception_handler(request: Request, exc: Exception):
 
 app.include_router(api_router)
 
+@app.on_event("startup")
+def start_workers():
+    """Boots the QGIS worker processes before the first request arrives."""
+    job_service.start()
+
 @app.get("/ping")
 def ping():
     return {"status": "ok", "message": "QGIS container is alive"}
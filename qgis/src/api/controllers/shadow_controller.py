@@ -1,6 +1,8 @@
+import os
 from fastapi import APIRouter, HTTPException
 from src.api.requests import ShadowMapRequest
 from src.services.shadow_service import ShadowService
+from src.configs import settings
 
 router = APIRouter()
 shadow_service = ShadowService()
@@ -11,14 +13,38 @@ def create_hillshade(req: ShadowMapRequest):
         output_folder = "/data/shadow-maps"
         lat, lon = 51.498, 3.613
 
-        shadow_service.generate_hillshade_maps(
-            req.dem_path, output_folder, lat, lon, req.start_dt, req.end_dt
+        shadow_service.generate_shadow_maps(
+            req.dem_path, output_folder, lat, lon, req.start_dt, req.end_dt, req.method or settings.SHADOW_METHOD
         )
 
         return {
             "status": "success",
             "output_folder": output_folder,
-            "message": "Hillshade(s) generated successfully",
+            "message": "Shadow map(s) generated successfully",
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating hillshade: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating shadow map: {str(e)}")
+
+
+@router.post("/stack")
+def create_shadow_stack(req: ShadowMapRequest):
+    try:
+        output_folder = "/data/shadow-maps"
+        lat, lon = 51.498, 3.613
+        method = req.method or settings.SHADOW_METHOD
+        output_path = os.path.join(
+            output_folder,
+            f"shadow_stack_{method}_{req.start_dt.strftime('%Y%m%d_%H%M')}_{req.end_dt.strftime('%Y%m%d_%H%M')}.tif",
+        )
+
+        shadow_service.generate_shadow_stack(
+            req.dem_path, output_path, lat, lon, req.start_dt, req.end_dt, method=method
+        )
+
+        return {
+            "status": "success",
+            "output": output_path,
+            "message": "Shadow stack generated successfully",
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating shadow stack: {str(e)}")
@@ -1,5 +1,10 @@
 from .point import Point
+from .weather_params import WeatherParams
+from .job import Job, JobStatus
 
 __all__ = [
     "Point",
-]
\ No newline at end of file
+    "WeatherParams",
+    "Job",
+    "JobStatus",
+]
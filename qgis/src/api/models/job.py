@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+from enum import Enum
+from datetime import datetime
+from typing import Optional
+
+class JobStatus(Enum):
+    Queued = 'queued'
+    Running = 'running'
+    Done = 'done'
+    Failed = 'failed'
+    Cancelled = 'cancelled'             # Superseded by a newer job before it finished
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    session_id: Optional[str] = None
+    status: JobStatus = JobStatus.Queued
+    output: Optional[str] = None                    # Path of the output layer, once done
+    error: Optional[str] = None
+    submitted_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
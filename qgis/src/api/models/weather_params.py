@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+class WeatherParams(BaseModel):
+    ff10: float = 7.677                             # Wind speed at 10m (KNMI / 10)
+    t_min: float = 27.2                             # Minimum air temperature of the day
+    t_max: float = 29.1                             # Maximum air temperature of the day
+    average_wind_speed: float = 7.5                 # Average wind speed used for the UHI
+    base_temperature: float = 28.3                  # Air temperature before the UHI correction
+    date_time: datetime = datetime(2017, 7, 1, 18, 0)  # Moment (UTC) used for the UHI factor
+    r_h: float = 44.0                               # Relative humidity
+    phi: float = 44.0                               # Sun angle
+    q_gl: float = 663.0                             # Global radiation (KNMI)
@@ -1,7 +1,9 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Literal, Optional
 
 class ShadowMapRequest(BaseModel):
     dem_path:   str
     start_dt:   datetime
-    end_dt:     datetime
\ No newline at end of file
+    end_dt:     datetime
+    method:     Optional[Literal["hillshade", "cast", "cast_fractional"]] = None
\ No newline at end of file
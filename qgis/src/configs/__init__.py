@@ -1,5 +1,7 @@
 from .preflight import init_qgis
+from . import settings
 
 __all__ = [
     "init_qgis",
-]
\ No newline at end of file
+    "settings",
+]
@@ -20,4 +20,4 @@ def init_qgis(prefix_path: str = "/usr"):
     QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
 
     print("✅ QGIS environment initialized.")
-    return qgs
\ No newline at end of file
+    return qgs
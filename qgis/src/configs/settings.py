@@ -0,0 +1,51 @@
+import os
+
+# Backend used for the raster calculator steps of the PET pipeline: "numpy" (in-process) or "gdal" (gdal:rastercalculator)
+RASTER_CALCULATOR_BACKEND = os.getenv("RASTER_CALCULATOR_BACKEND", "numpy")
+
+# Backend used for the zonal statistics (svf_mean, veg_mean): "numpy" (one pass over a zone-label raster)
+# or "qgis" (QgsZonalStatistics per raster)
+ZONAL_STATISTICS_BACKEND = os.getenv("ZONAL_STATISTICS_BACKEND", "numpy")
+
+# The warp that aligns the shadow map to the PET grid writes a VRT, warped lazily when the raster calculator
+# reads it, instead of a new GeoTIFF ("true"/"false")
+VIRTUAL_RASTERS = os.getenv("VIRTUAL_RASTERS", "true").lower() == "true"
+
+# Memory (in MB) a single window of a block-wise raster stage may use
+RASTER_MEMORY_BUDGET_MB = float(os.getenv("RASTER_MEMORY_BUDGET_MB", "256"))
+
+# Number of worker processes used by the block-wise raster stages (1 runs them in the API process)
+RASTER_WORKERS = int(os.getenv("RASTER_WORKERS", str(os.cpu_count() or 1)))
+
+# Folder with the manifests of the cached pipeline stages
+CACHE_DIR = os.getenv("CACHE_DIR", "/data/cache")
+
+# Shadow maps used to decide sun or shade: "hillshade" (gdal:hillshade), "cast" (cast shadows of the DSM)
+# or "cast_fractional" (cast shadows with the lit fraction of the pixels along the shadow edges)
+SHADOW_METHOD = os.getenv("SHADOW_METHOD", "hillshade")
+
+# Background jobs of /pet/update: the number of jobs that run at the same time, the number of jobs that may
+# wait (more submits are refused with 503) and how long (in seconds) the status of a finished job is kept
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "16"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+# Warm pool of worker processes with QGIS and Processing initialized that run the pipeline jobs (0 runs them in
+# the API process, one at a time whatever JOB_WORKERS is). A worker is replaced after QGIS_WORKER_MAX_JOBS jobs or once its resident memory passes
+# QGIS_WORKER_MAX_MEMORY_MB, which counts the worker and its raster processes
+QGIS_WORKERS = int(os.getenv("QGIS_WORKERS", "2"))
+QGIS_WORKER_MAX_JOBS = int(os.getenv("QGIS_WORKER_MAX_JOBS", "50"))
+QGIS_WORKER_MAX_MEMORY_MB = float(os.getenv("QGIS_WORKER_MAX_MEMORY_MB", "4096"))
+
+# Processes of the block-wise raster stages within one QGIS worker (RASTER_WORKERS applies to the API process):
+# by default the cores are split between the QGIS workers
+QGIS_WORKER_RASTER_WORKERS = int(os.getenv(
+    "QGIS_WORKER_RASTER_WORKERS", str(max(1, (os.cpu_count() or 1) // max(1, QGIS_WORKERS)))
+))
+
+# Seed of the leaf patterns of burned trees, the same seed gives the same DSM (and cache key) for the same objects
+LEAF_CLOUD_SEED = int(os.getenv("LEAF_CLOUD_SEED", "0"))
+
+# A session PET map is the base PET map with a small overlay tile per update on top; once a session has more
+# than SESSION_MAX_TILES tiles they are merged into a base PET map of the session
+SESSION_MAX_TILES = int(os.getenv("SESSION_MAX_TILES", "32"))
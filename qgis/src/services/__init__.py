@@ -2,10 +2,18 @@ from .pet_service import PETService
 from .raster_service import RasterService
 from .shadow_service import ShadowService
 from .geojson_service import GeoJSONService
+from .attribute_service import AttributeService
+from .pipeline_service import PipelineService
+from .zonal_service import ZonalService
+from .job_service import JobService
 
 __all__ = [
     "PETService",
     "ShadowService",
     "RasterService",
-    "GeoJSONService"
+    "GeoJSONService",
+    "AttributeService",
+    "PipelineService",
+    "ZonalService",
+    "JobService",
 ]
@@ -0,0 +1,79 @@
+import math
+import numpy as np
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import QgsVectorLayer, QgsField, QgsFeatureRequest
+
+class AttributeService:
+    """
+    Columnar access to the attribute table of a vector layer.
+
+    Fields are read once into NumPy arrays (NULL -> NaN) so formulas can be
+    evaluated as array expressions, and results are written back with a single
+    changeAttributeValues batch (NaN -> NULL).
+    """
+    def read_columns(self, layer: QgsVectorLayer, field_names: list[str]) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+        """
+        Reads the given fields of every feature into float arrays.
+
+        :param QgsVectorLayer layer: The layer to read from
+        :param list[str] field_names: The fields to read
+        :return: The feature ids and a dict of field name -> float64 array (NaN where NULL)
+        """
+        fields = layer.fields()
+        indices = [fields.indexOf(name) for name in field_names]
+        for name, index in zip(field_names, indices):
+            if index == -1:
+                raise Exception(f"Field '{name}' does not exist in layer {layer.name()}")
+
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(indices)
+
+        fids = []
+        columns = [[] for _ in field_names]
+        for feature in layer.getFeatures(request):
+            fids.append(feature.id())
+            attributes = feature.attributes()
+            for column, index in zip(columns, indices):
+                column.append(self._to_float(attributes[index]))
+
+        return (
+            np.asarray(fids, dtype=np.int64),
+            {name: np.asarray(column, dtype=np.float64) for name, column in zip(field_names, columns)},
+        )
+
+    def write_columns(self, layer: QgsVectorLayer, fids: np.ndarray, columns: dict[str, np.ndarray]) -> QgsVectorLayer:
+        """
+        Writes float arrays back into the given fields in one batch, adding missing fields as Double.
+
+        :param QgsVectorLayer layer: The layer to write to
+        :param np.ndarray fids: The feature ids, in the same order as the values
+        :param dict columns: Field name -> array of values (NaN is written as NULL)
+        :return: The updated layer
+        """
+        provider = layer.dataProvider()
+
+        missing = [QgsField(name, QVariant.Double) for name in columns if layer.fields().indexOf(name) == -1]
+        if missing:
+            provider.addAttributes(missing)
+            layer.updateFields()
+
+        fields = layer.fields()
+        indexed_values = [
+            (fields.indexOf(name), [None if math.isnan(v) else v for v in np.asarray(values, dtype=np.float64).tolist()])
+            for name, values in columns.items()
+        ]
+
+        changes = {}
+        for row, fid in enumerate(np.asarray(fids).tolist()):
+            changes[fid] = {index: values[row] for index, values in indexed_values}
+
+        if changes and not provider.changeAttributeValues(changes):
+            raise Exception(f"Failed to write attributes {list(columns)} to layer {layer.name()}")
+
+        return layer
+
+    def _to_float(self, value) -> float:
+        if value is None or (isinstance(value, QVariant) and value.isNull()):
+            return math.nan
+        return float(value)
@@ -1,11 +1,11 @@
-import os
-import math
-from qgis.PyQt.QtCore import QVariant
-from qgis.core import (
-    QgsVectorLayer, QgsField, QgsRasterLayer, QgsProcessingFeedback
-)
+from qgis.core import QgsVectorLayer
+from src.services.attribute_service import AttributeService
+from src.utils import pet_formulas
 
 class GeoJSONService:
+    def __init__(self):
+        self.attribute_service = AttributeService()
+
     def calculate_wind_speed_1_2(self, zonal_layer: QgsVectorLayer, u_1_2_field="u_1.2", ff10=7.677) -> QgsVectorLayer:
         """
         Adds a 'geschaalde_u_1_2' field to the given vector layer and calculates it using:
@@ -17,23 +17,7 @@ class GeoJSONService:
         :return: The updated QgsVectorLayer with the new field added
         """
         field_name = "geschaalde_u_1_2"
-        provider = zonal_layer.dataProvider()
-
-        if field_name not in [field.name() for field in zonal_layer.fields()]:
-            provider.addAttributes([QgsField(field_name, QVariant.Double)])
-            zonal_layer.updateFields()
-
-        zonal_layer.startEditing()
-        for feature in zonal_layer.getFeatures():
-            u_1_2 = feature[u_1_2_field]
-            if u_1_2 is None:
-                geschaalde_val = None
-            else:
-                geschaalde_val = ff10 * ((u_1_2 - 0.0796) * 0.9175 + 0.1254)
-                if geschaalde_val < 0.5:
-                    geschaalde_val = ff10 - geschaalde_val
-            feature[field_name] = geschaalde_val
-            zonal_layer.updateFeature(feature)
+        fids, columns = self.attribute_service.read_columns(zonal_layer, [u_1_2_field])
+        geschaalde_val = pet_formulas.scaled_wind_speed(columns[u_1_2_field], ff10)
 
-        zonal_layer.commitChanges()
-        return zonal_layer
+        return self.attribute_service.write_columns(zonal_layer, fids, {field_name: geschaalde_val})
@@ -0,0 +1,220 @@
+import os
+import queue
+import threading
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable
+from src.api.models import Job, JobStatus
+from src.configs import settings
+from src.services import pipeline_tasks
+from src.utils.worker_pool import WorkerPool
+from src.utils.cancellation import run_cancellable
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is full."""
+
+class WorkersUnavailable(Exception):
+    """Raised when a job is submitted while no worker process could be started."""
+
+class JobService:
+    """
+    Runs pipeline jobs in the background, so a request only submits the job and polls for its status.
+
+    Jobs wait in a bounded queue and are picked up by a fixed number of worker threads. A submit
+    while the queue is full is refused (backpressure) instead of piling up work. Finished jobs
+    are kept for `retention` so their status can still be polled.
+
+    With `processes` > 0 the jobs run in a warm pool of worker processes that initialized QGIS
+    once at startup, one worker thread per process; otherwise they run in this process, one job at a time,
+    as QGIS Processing is not safe to run from several threads.
+    Tasks are module level functions (see pipeline_tasks) with picklable arguments and results.
+
+    A cancelled job that is still queued never runs. A running job is told to stop through a
+    marker file in CANCEL_DIR, which cancels the QgsProcessingFeedback of the job in its worker.
+    """
+    CANCEL_DIR = os.path.join(settings.CACHE_DIR, "jobs")
+
+    def __init__(
+        self,
+        workers: int = settings.JOB_WORKERS,
+        queue_size: int = settings.JOB_QUEUE_SIZE,
+        retention: timedelta = timedelta(seconds=settings.JOB_RETENTION_SECONDS),
+        processes: int = settings.QGIS_WORKERS,
+    ):
+        self.pool = None
+        if processes > 0:
+            self.pool = WorkerPool(
+                processes,
+                initializer=pipeline_tasks.init_worker,
+                initargs=(settings.QGIS_WORKER_RASTER_WORKERS,),
+                max_jobs=settings.QGIS_WORKER_MAX_JOBS,
+                max_memory_mb=settings.QGIS_WORKER_MAX_MEMORY_MB,
+            )
+            workers = processes
+        elif workers > 1:
+            print(f"Running jobs in the API process, so one at a time instead of {workers}")
+            workers = 1
+        self.workers = workers
+        self.retention = retention
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._jobs: dict[str, Job] = {}
+        self._cancelled: set[str] = set()
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+
+    def start(self):
+        """Starts the worker threads and the worker processes, so the first job does not wait for QGIS to boot."""
+        self._start_workers()
+        if self.pool is not None:
+            self.pool.start()
+
+    def run(self, task: Callable, *args):
+        """
+        Runs a task right away on an idle worker process (or in this process without a pool) and waits for it.
+
+        :return: The result of the task
+        """
+        if self.pool is None:
+            return task(*args)
+        return self.pool.run(task, *args)
+
+    def submit(
+        self,
+        kind: str,
+        task: Callable[..., str],
+        args: tuple = (),
+        session_id: str | None = None,
+        supersede: bool = False,
+    ) -> Job:
+        """
+        Queues a job.
+
+        :param str kind: What the job does, for example "pet_update"
+        :param task: Module level function that runs the job and returns the path of its output layer
+        :param tuple args: The arguments of the task
+        :param str session_id: The session the job belongs to
+        :param bool supersede: Cancel the queued and running jobs of the same kind and session,
+            their result is outdated by this job
+        :return: The queued job
+        :raises JobQueueFull: When the queue is full
+        :raises WorkersUnavailable: When no worker process could be started
+        """
+        self.start()
+        if self.pool is not None and not self.pool.healthy:
+            raise WorkersUnavailable("No QGIS worker process could be started")
+        self._prune()
+
+        job = Job(id=uuid.uuid4().hex, kind=kind, session_id=session_id, submitted_at=datetime.now())
+        with self._lock:
+            superseded = [
+                other.id for other in self._jobs.values()
+                if supersede and session_id is not None
+                and other.kind == kind and other.session_id == session_id
+                and other.status in (JobStatus.Queued, JobStatus.Running)
+            ]
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait((job.id, task, args))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise JobQueueFull(f"The job queue is full ({self._queue.maxsize} jobs), try again later")
+
+        for other_id in superseded:
+            self.cancel(other_id)
+            print(f"Job {other_id} ({kind}) superseded by job {job.id}")
+
+        print(f"Job {job.id} ({kind}) queued, {self._queue.qsize()} job(s) waiting")
+        return job.model_copy()
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.model_copy() if job is not None else None
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a queued or running job. A running job stops at its next processing step.
+
+        :return: False if the job is unknown or already finished
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in (JobStatus.Queued, JobStatus.Running):
+                return False
+            self._cancelled.add(job_id)
+            if job.status == JobStatus.Queued:
+                self._jobs[job_id] = job.model_copy(
+                    update={"status": JobStatus.Cancelled, "finished_at": datetime.now()}
+                )
+                return True
+
+            # Written under the lock, so a job that finishes meanwhile removes the marker after it
+            os.makedirs(self.CANCEL_DIR, exist_ok=True)
+            open(self._cancel_path(job_id), "w").close()
+            return True
+
+    def _cancel_path(self, job_id: str) -> str:
+        return os.path.join(self.CANCEL_DIR, f"{job_id}.cancel")
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job_id, task, args = self._queue.get()
+            if not self._claim(job_id):
+                # Cancelled while it was queued
+                self._queue.task_done()
+                continue
+
+            cancel_path = self._cancel_path(job_id)
+            try:
+                output = self.run(run_cancellable, cancel_path, task, *args)
+                self._update(job_id, status=JobStatus.Done, output=output, finished_at=datetime.now())
+            except Exception as exc:
+                if job_id in self._cancelled:
+                    print(f"Job {job_id} cancelled")
+                    self._update(job_id, status=JobStatus.Cancelled, finished_at=datetime.now())
+                else:
+                    traceback.print_exc()
+                    self._update(job_id, status=JobStatus.Failed, error=str(exc), finished_at=datetime.now())
+            finally:
+                with self._lock:
+                    self._cancelled.discard(job_id)
+                    if os.path.exists(cancel_path):
+                        os.remove(cancel_path)
+                self._queue.task_done()
+
+    def _claim(self, job_id: str) -> bool:
+        """Marks a queued job as running, unless it was cancelled or forgotten."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JobStatus.Queued:
+                return False
+            self._jobs[job_id] = job.model_copy(update={"status": JobStatus.Running, "started_at": datetime.now()})
+            return True
+
+    def _update(self, job_id: str, **changes):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._jobs[job_id] = job.model_copy(update=changes)
+
+    def _prune(self):
+        """Forgets the jobs that finished longer than `retention` ago."""
+        threshold = datetime.now() - self.retention
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < threshold
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
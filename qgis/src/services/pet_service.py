@@ -1,17 +1,32 @@
 import os
-import math
+import time
 from datetime import datetime
-from qgis.PyQt.QtCore import QVariant
+from zoneinfo import ZoneInfo
+import numpy as np
 from qgis.core import (
-    QgsVectorLayer, QgsField, QgsRasterLayer, QgsProcessingFeedback
+    QgsVectorLayer, QgsRasterLayer, QgsRectangle
 )
 from qgis.analysis import QgsZonalStatistics
 from src.services.raster_service import RasterService
+from src.services.attribute_service import AttributeService
+from src.services.zonal_service import ZonalService
+from src.api.models import WeatherParams
 from src.utils.uhi_lookup_tables import UHILookupTables
+from src.utils import pet_formulas
+from src.utils.raster_calculator import RasterCalculator
+from src.utils.pet_kernel import PetKernel
+from src.utils.pet_cube import PetCube
+from src.configs import settings
+from src.utils.cancellation import job_feedback
 
 class PETService:
-    def __init__(self):
-        self.raster_service = RasterService()
+    def __init__(self, raster_workers: int = settings.RASTER_WORKERS):
+        self.raster_service = RasterService(raster_workers)
+        self.attribute_service = AttributeService()
+        self.zonal_service = ZonalService(raster_workers)
+        self.raster_calculator = RasterCalculator(settings.RASTER_MEMORY_BUDGET_MB, raster_workers)
+        self.pet_kernel = PetKernel(settings.RASTER_MEMORY_BUDGET_MB, raster_workers)
+        self.pet_cube = PetCube(settings.RASTER_MEMORY_BUDGET_MB, raster_workers)
     def load_zonal_layer(self, path: str) -> QgsVectorLayer:
         return QgsVectorLayer(path, "zonal_layer", "ogr")
     
@@ -23,24 +38,12 @@ class PETService:
         date_time = datetime(2017, 7, 1, 18, 0)
     ): 
         field_name = "t_a"
-        if field_name not in [field.name() for field in zonal_layer.fields()]:
-            zonal_layer.dataProvider().addAttributes([QgsField(field_name, QVariant.Double)])
-            zonal_layer.updateFields()
-        
         uhi_factor = UHILookupTables.get_uhi_factor(date_time)
-        print(uhi_factor)
-        zonal_layer.startEditing()
-        for feature in zonal_layer.getFeatures():
-            uhi = feature[uhi_field]
-            if uhi is None:
-                t_a = None
-            else:  
-                t_a = base_temperature + uhi * uhi_factor
-            feature[field_name] = t_a
-            zonal_layer.updateFeature(feature)
-        
-        zonal_layer.commitChanges()
-        return zonal_layer
+
+        fids, columns = self.attribute_service.read_columns(zonal_layer, [uhi_field])
+        t_a = pet_formulas.air_temperature(columns[uhi_field], uhi_factor, base_temperature)
+
+        return self.attribute_service.write_columns(zonal_layer, fids, {field_name: t_a})
     
     def calculate_zonal_uhi(
         self,
@@ -49,13 +52,120 @@ class PETService:
         svf_layer: str|QgsRasterLayer,
         t_min = 27.2,
         t_max = 29.1,
-        average_wind_speed = 7.5
+        average_wind_speed = 7.5,
     ) -> QgsVectorLayer:
         """
         Calculates UHI directly on the ORIGINAL zonal_layer.
         """
-        svf_obj, _ = self.convert_raster_layer_to_qgs_and_path(svf_layer)
-        br_obj,  _ = self.convert_raster_layer_to_qgs_and_path(bowen_ratio_layer)
+        self._calculate_zonal_means(zonal_layer, bowen_ratio_layer, svf_layer)
+        
+        field_name = "uhi"
+        fids, columns = self.attribute_service.read_columns(zonal_layer, ["svf_mean", "veg_mean"])
+        uhi = pet_formulas.uhi(columns["svf_mean"], columns["veg_mean"], t_min, t_max, average_wind_speed)
+
+        return self.attribute_service.write_columns(zonal_layer, fids, {field_name: uhi})
+
+    def calculate_zonal_pet_fields(
+        self,
+        zonal_layer: QgsVectorLayer,
+        bowen_ratio_layer: str|QgsRasterLayer,
+        svf_layer: str|QgsRasterLayer,
+        weather: WeatherParams = WeatherParams(),
+        u_1_2_field: str = "u_1.2",
+    ) -> tuple[QgsVectorLayer, dict[str, float]]:
+        """
+        Fused variant of calculate_wind_speed_1_2, calculate_zonal_uhi, calculate_t_a_temperature,
+        calculate_wet_bulb_temp, calculate_zonal_part_pet_sun and calculate_zonal_part_pet_shadow.
+        All derived fields are computed from a single read of the attribute table and written
+        back in a single batch.
+
+        :param QgsVectorLayer zonal_layer: The zonal layer containing the u_1.2 wind reduction
+        :param str|QgsRasterLayer bowen_ratio_layer: The bowen ratio (vegetation) raster
+        :param str|QgsRasterLayer svf_layer: The sky-view factor raster
+        :param WeatherParams weather: The weather parameters of the calculated moment
+        :param str u_1_2_field: The field in the zonal layer containing u_1.2 values
+        :return: The updated layer and the time (in seconds) spent per step
+        """
+        timings = {}
+        uhi_factor = UHILookupTables.get_uhi_factor(weather.date_time)
+
+        start = time.perf_counter()
+        self._calculate_zonal_means(zonal_layer, bowen_ratio_layer, svf_layer)
+        timings["zonal_statistics"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fids, columns = self.attribute_service.read_columns(zonal_layer, [u_1_2_field, "svf_mean", "veg_mean"])
+        timings["read"] = time.perf_counter() - start
+
+        formulas = [
+            ("geschaalde_u_1_2", lambda c: pet_formulas.scaled_wind_speed(c[u_1_2_field], weather.ff10)),
+            ("uhi", lambda c: pet_formulas.uhi(
+                c["svf_mean"], c["veg_mean"], weather.t_min, weather.t_max, weather.average_wind_speed
+            )),
+            ("t_a", lambda c: pet_formulas.air_temperature(
+                c["uhi"], uhi_factor, weather.base_temperature
+            )),
+            ("t_w", lambda c: pet_formulas.wet_bulb_temperature(c["t_a"], weather.r_h)),
+            ("pet_sun_partial", lambda c: pet_formulas.pet_sun_partial(
+                c["t_a"], c["t_w"], c["geschaalde_u_1_2"], weather.phi, weather.q_gl
+            )),
+            ("pet_shadow_partial", lambda c: pet_formulas.pet_shadow_partial(
+                c["t_a"], c["t_w"], c["geschaalde_u_1_2"]
+            )),
+        ]
+
+        results = {}
+        for field_name, formula in formulas:
+            start = time.perf_counter()
+            results[field_name] = formula({**columns, **results})
+            timings[field_name] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.attribute_service.write_columns(zonal_layer, fids, results)
+        timings["write"] = time.perf_counter() - start
+
+        return zonal_layer, timings
+
+    def calculate_zonal_static_fields(
+        self,
+        zonal_layer: QgsVectorLayer,
+        bowen_ratio_layer: str|QgsRasterLayer,
+        svf_layer: str|QgsRasterLayer,
+        weather: WeatherParams = WeatherParams(),
+        u_1_2_field: str = "u_1.2",
+    ) -> QgsVectorLayer:
+        """
+        Adds the fields that do not depend on the moment of the day: the scaled wind speed
+        ('geschaalde_u_1_2') and the UHI ('uhi'), so they can be shared by all hours of a PET cube.
+        """
+        self._calculate_zonal_means(zonal_layer, bowen_ratio_layer, svf_layer)
+
+        fids, columns = self.attribute_service.read_columns(zonal_layer, [u_1_2_field, "svf_mean", "veg_mean"])
+        results = {
+            "geschaalde_u_1_2": pet_formulas.scaled_wind_speed(columns[u_1_2_field], weather.ff10),
+            "uhi": pet_formulas.uhi(
+                columns["svf_mean"], columns["veg_mean"], weather.t_min, weather.t_max, weather.average_wind_speed
+            ),
+        }
+        return self.attribute_service.write_columns(zonal_layer, fids, results)
+
+    def _calculate_zonal_means(
+        self,
+        zonal_layer: QgsVectorLayer,
+        bowen_ratio_layer: str|QgsRasterLayer,
+        svf_layer: str|QgsRasterLayer,
+    ):
+        """
+        Adds the 'svf_mean' and 'veg_mean' zonal statistics to the zonal layer. The numpy backend reduces
+        every raster on its own pixel grid, like QgsZonalStatistics, so the means are the same.
+        """
+        svf_obj, svf_path = self.convert_raster_layer_to_qgs_and_path(svf_layer)
+        br_obj,  br_path = self.convert_raster_layer_to_qgs_and_path(bowen_ratio_layer)
+
+        if settings.ZONAL_STATISTICS_BACKEND == "numpy":
+            for prefix, path in (("svf_", svf_path), ("veg_", br_path)):
+                self.zonal_service.add_zonal_means(zonal_layer, {prefix: path})
+            return
 
         if not svf_obj.isValid():
             raise Exception("SVF raster is invalid")
@@ -77,33 +187,6 @@ class PETService:
             stats=QgsZonalStatistics.Mean
         )
         zs_br.calculateStatistics(None)
-        
-        field_name = "uhi"
-        if field_name not in [f.name() for f in zonal_layer.fields()]:
-            zonal_layer.dataProvider().addAttributes([QgsField(field_name, QVariant.Double)])
-            zonal_layer.updateFields()
-
-        zonal_layer.startEditing()
-        temp_diff = t_max - t_min
-        base_value = (663 * (temp_diff ** 3)) / average_wind_speed
-        base_value = base_value ** 0.25
-
-        for feature in zonal_layer.getFeatures():
-
-            svf_mean = feature["svf_mean"]
-            veg_mean = feature["veg_mean"]
-
-            if svf_mean is None or veg_mean is None:
-                uhi = None
-            else:
-                uhi = (2 - svf_mean - veg_mean) * base_value
-
-            feature[field_name] = uhi
-            zonal_layer.updateFeature(feature)
-
-        zonal_layer.commitChanges()
-
-        return zonal_layer
 
     def calculate_wet_bulb_temp(self, zonal_layer: QgsVectorLayer, t_a_field = "t_a", r_h = 44.0) -> QgsVectorLayer:
         """
@@ -114,29 +197,10 @@ class PETService:
         :param float r_h: The relative humidity value (or constant) used in the calculation (φ)
         """
         field_name = "t_w"
-        if field_name not in [field.name() for field in zonal_layer.fields()]:
-            zonal_layer.dataProvider().addAttributes([QgsField(field_name, QVariant.Double)])
-            zonal_layer.updateFields()
-        
-        zonal_layer.startEditing()
-        for feature in zonal_layer.getFeatures():
-            t_a = feature[t_a_field]
-            if t_a is None:
-                wet_bulb = None
-            else:
-                temp_val = t_a
-                wet_bulb = (
-                    temp_val * math.atan(0.151977 * math.sqrt(r_h + 8.313659)) +
-                    math.atan(temp_val + r_h) -
-                    math.atan(r_h - 1.676331) +
-                    0.00391838 * (r_h ** 1.5) * math.atan(0.023101 * r_h) -
-                    4.686035
-                )
-            feature[field_name] = wet_bulb
-            zonal_layer.updateFeature(feature)
-        
-        zonal_layer.commitChanges()
-        return zonal_layer
+        fids, columns = self.attribute_service.read_columns(zonal_layer, [t_a_field])
+        wet_bulb = pet_formulas.wet_bulb_temperature(columns[t_a_field], r_h)
+
+        return self.attribute_service.write_columns(zonal_layer, fids, {field_name: wet_bulb})
 
     def calculate_zonal_part_pet_sun(
         self,
@@ -158,27 +222,12 @@ class PETService:
         :param flaot q_gl: The global radiation taken by KNMI (Qgl)
         """
         field_name = "pet_sun_partial"
-        if field_name not in [field.name() for field in zonal_layer.fields()]:
-            zonal_layer.dataProvider().addAttributes([QgsField(field_name, QVariant.Double)])
-            zonal_layer.updateFields()
-        
-        zonal_layer.startEditing()
-        for feature in zonal_layer.getFeatures():
-            t_a = feature[t_a_field]
-            t_w = feature[t_w_field]
-            u = feature[u_field]
-            if t_a is None or t_w is None or u is None:
-                pet_sun_partial = None
-            else:
-                pet_sun_partial = (
-                    -13.26 + 1.25 * t_a + 0.011 * q_gl - 3.37 * math.log(u) + 0.078 * t_w +
-                    0.0055 * q_gl * math.log(u) + 5.56 * math.sin(phi) - 0.0103 * q_gl * math.log(u) * math.sin(phi)
-                )
-            feature[field_name] = pet_sun_partial
-            zonal_layer.updateFeature(feature)
-        
-        zonal_layer.commitChanges()
-        return zonal_layer
+        fids, columns = self.attribute_service.read_columns(zonal_layer, [t_a_field, t_w_field, u_field])
+        pet_sun_partial = pet_formulas.pet_sun_partial(
+            columns[t_a_field], columns[t_w_field], columns[u_field], phi, q_gl
+        )
+
+        return self.attribute_service.write_columns(zonal_layer, fids, {field_name: pet_sun_partial})
 
     def calculate_zonal_part_pet_shadow(
         self,
@@ -196,33 +245,18 @@ class PETService:
         :param str u: The field in the zonal layer that contains the wind speed at 1.2 m height(U)
         """
         field_name = "pet_shadow_partial"
-        if field_name not in [field.name() for field in zonal_layer.fields()]:
-            zonal_layer.dataProvider().addAttributes([QgsField(field_name, QVariant.Double)])
-            zonal_layer.updateFields()
-        
-        zonal_layer.startEditing()
-        for feature in zonal_layer.getFeatures():
-            t_a = feature[t_a_field]
-            t_w = feature[t_w_field]
-            u = feature[u_field]
-            if t_a is None or t_w is None or u is None:
-                pet_shadow_partial = None
-            else:
-                pet_shadow_partial = (
-                    -12.14 + 1.25 * t_a - 1.47 * math.log(u) + 0.060 * t_w   
-                )
-            feature[field_name] = pet_shadow_partial
-            zonal_layer.updateFeature(feature)
-        
-        zonal_layer.commitChanges()
-        return zonal_layer
+        fids, columns = self.attribute_service.read_columns(zonal_layer, [t_a_field, t_w_field, u_field])
+        pet_shadow_partial = pet_formulas.pet_shadow_partial(columns[t_a_field], columns[t_w_field], columns[u_field])
+
+        return self.attribute_service.write_columns(zonal_layer, fids, {field_name: pet_shadow_partial})
         
     def calculate_total_pet_sun(
         self,
         partial_pet_layer: str|QgsRasterLayer, 
         br_layer_path: str|QgsRasterLayer, 
         svf_layer_path: str|QgsRasterLayer, 
-        output_path: str
+        output_path: str,
+        backend: str = settings.RASTER_CALCULATOR_BACKEND,
     ) -> QgsRasterLayer:
         """
         Calculates the total sun pet over the entire given partial pet layer.
@@ -231,11 +265,8 @@ class PETService:
         :param str|QgsRasterLayer br_layer_path: The path of the bowen ratio map
         :param str|QgsRasterLayer svf_layer_path: The path of the sky-view factor map
         :param str output_path: Path to save the output raster (e.g., '/tmp/total_pet.tif').
+        :param str backend: "numpy" for the in-process raster calculator or "gdal" for gdal:rastercalculator
         """
-        import processing
-        
-        feedback = QgsProcessingFeedback()
-
         partial_pet_obj, partial_pet_path = self.convert_raster_layer_to_qgs_and_path(partial_pet_layer)
         br_obj, br_path = self.convert_raster_layer_to_qgs_and_path(br_layer_path)
         svf_obj, svf_path = self.convert_raster_layer_to_qgs_and_path(svf_layer_path)
@@ -244,25 +275,13 @@ class PETService:
             if not layer.isValid():
                 raise Exception(f"Raster layer is invalid: {layer.name()}")
 
-        # Use string paths in parameters
-        params = {
-            'INPUT_A': partial_pet_path,
-            'BAND_A': 1,
-            'INPUT_B': br_path,
-            'BAND_B': 1,
-            'INPUT_C': svf_path,
-            'BAND_C': 1,
-            'FORMULA': 'A + 0.546 * B + 1.94 * C',
-            'NO_DATA': None,
-            'EXTENT_OPT': 0,  # 0 = intersect
-            'PROJWIN': partial_pet_obj.extent(),
-            'RTYPE': 5,  # Float32
-            'OUTPUT': output_path
-        }
-
-        result = processing.run("gdal:rastercalculator", params, feedback=feedback)
-
-        total_pet_layer = QgsRasterLayer(result['OUTPUT'], os.path.basename(output_path))
+        total_pet_layer = self._run_raster_calculator(
+            [partial_pet_path, br_path, svf_path],
+            'A + 0.546 * B + 1.94 * C',
+            partial_pet_obj.extent(),
+            output_path,
+            backend,
+        )
 
         if not total_pet_layer.isValid():
             raise Exception("Failed to create total PET raster")
@@ -276,6 +295,7 @@ class PETService:
         t_a_layer_path: str|QgsRasterLayer,
         output_path: str,
         q_diff = 0.2,
+        backend: str = settings.RASTER_CALCULATOR_BACKEND,
     ) -> QgsRasterLayer:
         """
         Calculates the total sun pet over the entire given partial pet layer.
@@ -285,12 +305,8 @@ class PETService:
         :param str|QgsRasterLayer t_a_layer_path: The path of the air temperature map
         :param str output_path: Path to save the output raster
         :param float q_diff: The "diffuse straling" from the standard
+        :param str backend: "numpy" for the in-process raster calculator or "gdal" for gdal:rastercalculator
         """
-        import processing
-        
-        feedback = QgsProcessingFeedback()
-        boltzmann_const = 5.670374419 * (10 ** (-8))
-
         partial_pet_obj, partial_pet_path = self.convert_raster_layer_to_qgs_and_path(partial_pet_layer)
         svf_obj, svf_path = self.convert_raster_layer_to_qgs_and_path(svf_layer_path)
         ta_obj, ta_path = self.convert_raster_layer_to_qgs_and_path(t_a_layer_path)
@@ -299,25 +315,13 @@ class PETService:
             if not layer.isValid():
                 raise Exception(f"Raster layer is invalid: {layer.name()}")
 
-        # Use string paths in parameters
-        params = {
-            'INPUT_A': partial_pet_path,
-            'BAND_A': 1,
-            'INPUT_B': svf_path,
-            'BAND_B': 1,
-            'INPUT_C': ta_path,
-            'BAND_C': 1,
-            'FORMULA': f'A + 0.015 * B * {q_diff} + 0.0060 * (1 - B) * {boltzmann_const} * ((C + 273.15) ** 4)',
-            'NO_DATA': None,
-            'EXTENT_OPT': 0,  # 0 = intersect
-            'PROJWIN': partial_pet_obj.extent(),
-            'RTYPE': 5,  # Float32
-            'OUTPUT': output_path
-        }
-
-        result = processing.run("gdal:rastercalculator", params, feedback=feedback)
-
-        total_pet_layer = QgsRasterLayer(result['OUTPUT'], os.path.basename(output_path))
+        total_pet_layer = self._run_raster_calculator(
+            [partial_pet_path, svf_path, ta_path],
+            f'A + 0.015 * B * {q_diff} + 0.0060 * (1 - B) * {pet_formulas.BOLTZMANN_CONST} * ((C + 273.15) ** 4)',
+            partial_pet_obj.extent(),
+            output_path,
+            backend,
+        )
 
         if not total_pet_layer.isValid():
             raise Exception("Failed to create total PET raster")
@@ -349,6 +353,7 @@ class PETService:
         shadow_pet: str|QgsRasterLayer,
         output_path: str,
         shadow_threshold: float = 127,
+        backend: str = settings.RASTER_CALCULATOR_BACKEND,
         ) :
         """
         Calculates and returns the total PET map
@@ -358,10 +363,8 @@ class PETService:
         :param shadow_pet: a file path string or QgsRasterLayer object that contains the shadow PET
         :param output_path: the output path
         :param shadow_threshold: a number between 0-255 that determines which values are shadow and which sun
+        :param backend: "numpy" for the in-process raster calculator or "gdal" for gdal:rastercalculator
         """
-        import processing
-        feedback = QgsProcessingFeedback()
-        
         shadow_map_obj, shadow_map_path = self.convert_raster_layer_to_qgs_and_path(shadow_map)
         sun_pet_obj, sun_pet_path = self.convert_raster_layer_to_qgs_and_path(sun_pet)
         shadow_pet_obj, shadow_pet_path = self.convert_raster_layer_to_qgs_and_path(shadow_pet)
@@ -370,28 +373,192 @@ class PETService:
             if not layer.isValid():
                 raise Exception(f"Raster layer is invalid: {layer.name()}")
         
-        shadow_maps_folder_path = "/data/shadow-maps"
-        aligned_shadow_map_path = os.path.join(shadow_maps_folder_path, "shadow_map_aligned.tif")
-
-        self.raster_service.adjust_raster_pixel_resolution(shadow_map_path, sun_pet_obj, aligned_shadow_map_path)
-
-        params = {
-            'INPUT_A': sun_pet_path,
-            'BAND_A': 1,
-            'INPUT_B': aligned_shadow_map_path,
-            'BAND_B': 1,
-            'INPUT_C': shadow_pet_path,
-            'BAND_C': 1,
-            'FORMULA': f'(A * (B > {shadow_threshold})) + (C * (B <= {shadow_threshold}))',
+        # The aligned shadow map is only read by the calculation below, so it lives in a workspace of this call
+        with self.raster_service.scratch_workspace("aligned_shadow_map") as workspace:
+            # The numpy backend samples the shadow map onto the sun PET grid itself, it only needs a warp across CRSs
+            aligned_shadow_map_path = shadow_map_path
+            if backend != "numpy" or shadow_map_obj.crs() != sun_pet_obj.crs():
+                extension = "vrt" if settings.VIRTUAL_RASTERS else "tif"
+                aligned_shadow_map_path = self.raster_service.adjust_raster_pixel_resolution(
+                    shadow_map_path, sun_pet_obj, workspace.path(f"shadow_map_aligned.{extension}")
+                )
+
+            total_pet_layer = self._run_raster_calculator(
+                [sun_pet_path, aligned_shadow_map_path, shadow_pet_path],
+                f'(A * (B > {shadow_threshold})) + (C * (B <= {shadow_threshold}))',
+                shadow_map_obj.extent(),
+                output_path,
+                backend,
+            )
+
+        return total_pet_layer
+
+    def calculate_total_pet_fused(
+        self,
+        shadow_map: str|QgsRasterLayer,
+        sun_partial_pet: str|QgsRasterLayer,
+        br_layer: str|QgsRasterLayer,
+        svf_layer: str|QgsRasterLayer,
+        shadow_partial_pet: str|QgsRasterLayer,
+        t_a_layer: str|QgsRasterLayer,
+        output_path: str,
+        shadow_threshold: float = 127,
+        q_diff: float = 0.2,
+        fill_distance: float = 10,
+        fill_iterations: int = 0,
+    ) -> QgsRasterLayer:
+        """
+        Calculates the filled total PET map in one pass, without writing the intermediate
+        sun PET, shadow PET and unfilled PET rasters. Equivalent to calculate_total_pet_sun,
+        calculate_total_pet_shadow, calculate_total_pet_map and RasterService.fill_nodata_gdal.
+
+        :param shadow_map: a file path string or QgsRasterLayer object that contains the shadow map
+        :param sun_partial_pet: the partial sun PET raster
+        :param br_layer: the bowen ratio map
+        :param svf_layer: the (filled) sky-view factor map
+        :param shadow_partial_pet: the partial shadow PET raster
+        :param t_a_layer: the air temperature map
+        :param output_path: the output path
+        :param shadow_threshold: a number between 0-255 that determines which values are shadow and which sun
+        :param q_diff: The "diffuse straling" from the standard
+        :param fill_distance: Maximum distance (in pixels) to search for values when filling NoData
+        :param fill_iterations: Number of smoothing iterations of the fill
+        """
+        layers = {
+            "shadow_map": shadow_map,
+            "sun_partial": sun_partial_pet,
+            "bowen": br_layer,
+            "svf": svf_layer,
+            "shadow_partial": shadow_partial_pet,
+            "t_a": t_a_layer,
+        }
+        paths = {name: self.convert_raster_layer_to_qgs_and_path(layer)[1] for name, layer in layers.items()}
+
+        self.pet_kernel.run(
+            paths,
+            output_path,
+            shadow_threshold=shadow_threshold,
+            q_diff=q_diff,
+            fill_distance=fill_distance,
+            fill_iterations=fill_iterations,
+        )
+
+        total_pet_layer = QgsRasterLayer(output_path, os.path.basename(output_path))
+
+        if not total_pet_layer.isValid():
+            raise Exception("Failed to create total PET raster")
+
+        return total_pet_layer
+
+    def calculate_pet_cube(
+        self,
+        uhi_layer: str|tuple[str, int]|QgsRasterLayer,
+        wind_layer: str|tuple[str, int]|QgsRasterLayer,
+        br_layer: str|QgsRasterLayer,
+        svf_layer: str|QgsRasterLayer,
+        shadow_stack: str,
+        moments: list[datetime],
+        output_path: str,
+        weather: WeatherParams = WeatherParams(),
+        timezone: str = "Europe/Amsterdam",
+        shadow_threshold: float = 127,
+        q_diff: float = 0.2,
+        pet_threshold: float = 35,
+        fill_distance: float = 10,
+    ) -> QgsRasterLayer:
+        """
+        Calculates the PET of every moment as the bands of one raster, followed by a band with the
+        maximum PET and a band with the number of moments above pet_threshold.
+
+        :param uhi_layer: the UHI raster, or (path, band) of a multiband raster
+        :param wind_layer: the scaled wind speed raster, or (path, band) of a multiband raster
+        :param br_layer: the bowen ratio map
+        :param svf_layer: the (filled) sky-view factor map
+        :param shadow_stack: the shadow stack with one band per moment
+        :param moments: the moments (local time in `timezone`) of the bands
+        :param output_path: the output path
+        :param weather: the weather parameters; date_time is replaced by the moments
+        :param pet_threshold: the PET (in °C) above which a moment is counted
+        """
+        zone = ZoneInfo(timezone)
+        uhi_factors = UHILookupTables.get_uhi_factors([moment.replace(tzinfo=zone) for moment in moments])
+        if np.ma.is_masked(uhi_factors):
+            raise ValueError("The moments of a PET cube must lie within the UHI lookup periods (April 1 - September 30)")
+
+        paths = [
+            layer if isinstance(layer, tuple) else self.convert_raster_layer_to_qgs_and_path(layer)[1]
+            for layer in [uhi_layer, wind_layer, br_layer, svf_layer]
+        ]
+        self.pet_cube.run(
+            *paths,
+            shadow_stack,
+            uhi_factors.filled(np.nan).tolist(),
+            weather.model_dump(include={"base_temperature", "r_h", "phi", "q_gl"}),
+            output_path,
+            labels=[moment.isoformat() for moment in moments],
+            shadow_threshold=shadow_threshold,
+            q_diff=q_diff,
+            pet_threshold=pet_threshold,
+            fill_distance=fill_distance,
+        )
+
+        pet_cube_layer = QgsRasterLayer(output_path, os.path.basename(output_path))
+
+        if not pet_cube_layer.isValid():
+            raise Exception("Failed to create PET cube raster")
+
+        return pet_cube_layer
+
+    def _run_raster_calculator(
+        self,
+        input_paths: list[str],
+        formula: str,
+        projwin: QgsRectangle,
+        output_path: str,
+        backend: str,
+    ) -> QgsRasterLayer:
+        """
+        Runs a raster calculation over the intersection of the inputs, which are bound to A, B, C... in order.
+
+        :param list[str] input_paths: The input rasters (band 1 of each is used)
+        :param str formula: The formula in gdal_calc syntax
+        :param QgsRectangle projwin: The extent the output is clipped to
+        :param str output_path: The output path (Float32 GeoTIFF)
+        :param str backend: "numpy" for the in-process calculator or "gdal" for gdal:rastercalculator
+        """
+        names = [chr(ord('A') + i) for i in range(len(input_paths))]
+
+        if backend == "numpy":
+            self.raster_calculator.calculate(
+                dict(zip(names, input_paths)),
+                formula,
+                output_path,
+                projwin=(projwin.xMinimum(), projwin.xMaximum(), projwin.yMinimum(), projwin.yMaximum()),
+            )
+            return QgsRasterLayer(output_path, os.path.basename(output_path))
+
+        if backend != "gdal":
+            raise ValueError(f"Unknown raster calculator backend: {backend}")
+
+        import processing
+
+        feedback = job_feedback()
+
+        # Use string paths in parameters
+        params = {}
+        for name, path in zip(names, input_paths):
+            params[f'INPUT_{name}'] = path
+            params[f'BAND_{name}'] = 1
+
+        params.update({
+            'FORMULA': formula,
             'NO_DATA': None,
             'EXTENT_OPT': 0,  # 0 = intersect
-            'PROJWIN': shadow_map_obj.extent(),
+            'PROJWIN': projwin,
             'RTYPE': 5,  # Float32
             'OUTPUT': output_path
-        }
+        })
 
         result = processing.run("gdal:rastercalculator", params, feedback=feedback)
 
-        total_pet_layer = QgsRasterLayer(result['OUTPUT'], os.path.basename(output_path))
-
-        return total_pet_layer
\ No newline at end of file
+        return QgsRasterLayer(result['OUTPUT'], os.path.basename(output_path))
@@ -0,0 +1,571 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+from src.api.models import Point, WeatherParams
+from src.configs import settings
+from src.services.pet_service import PETService
+from src.services.raster_service import RasterService
+from src.services.shadow_service import ShadowService
+from src.services.geojson_service import GeoJSONService
+from src.services.zonal_service import ZonalService
+from src.utils.artifact_cache import ArtifactCache
+from src.utils.file_lock import FileLock
+from src.utils.cancellation import JobCancelled, raise_if_cancelled
+from src.utils.raster_overlay import write_overlay, write_tile
+from src.utils.virtual_raster import materialize
+from src.utils.update_qgis_project import update_pet_layer_in_project
+from src.utils.raster_fill import fill_halo
+from src.utils.raster_patch import Bounds, crop_raster, expand_bounds, union_bounds, intersects, pixel_size
+
+class PipelineService:
+    """
+    Orchestrates the PET pipelines. The static intermediates of the full map generation
+    are built as cached stages, so they are only recomputed when their inputs change.
+    """
+    ZONAL_LAYER = "/data/json/wind_reduction copy.geojson"
+    DSM = "/data/dsm.TIF"
+    VEGETATION = "/data/raster/vegetation-reproject.tif"
+    SVF = "/data/raster/svf-reproject.tif"
+    SVF_FILLED = "/data/raster/svf-reproject-filled.tif"
+    BOWEN = "/data/raster/br-reproject.tif"
+    SUN_PARTIAL = "/data/uhi/sun-bbox.tif"
+    SHADOW_PARTIAL = "/data/uhi/shadow-bbox.tif"
+    T_A = "/data/uhi/t_a.tif"
+    SUN_PET = "/data/uhi/sun-pet.tif"
+    SHADOW_PET = "/data/uhi/shadow-pet.tif"
+    SHADOW_MAPS = "/data/shadow-maps"
+    PET = "/data/pet/pet.tif"
+    PET_CUBES = "/data/pet/cubes"
+    CUBE_ZONES = "/data/uhi/cube/zones.geojson"
+    # Band 1: UHI, band 2: scaled wind speed at 1.2 m
+    CUBE_STATICS = "/data/uhi/cube/statics.tif"
+    BASE_PET = "/data/pet/pet_filled.tif"
+    SESSIONS = "/data/server/sessions"
+
+    LAT, LON = 51.498, 3.613
+    SHADOW_MOMENT = datetime(2015, 7, 1, 15, 0, 0)
+    FILL_DISTANCE = 10
+
+    # Burn parameters of the placed objects, they determine the footprint of an object
+    BOWEN_BUFFER_DISTANCE = 3
+    LEAF_JITTER = 0.3
+    SESSION_STATE = "pet_state.json"
+
+    def __init__(self, raster_workers: int = settings.RASTER_WORKERS):
+        """
+        :param int raster_workers: Processes of the block-wise raster stages
+        """
+        self.pet_service = PETService(raster_workers)
+        self.raster_service = RasterService(raster_workers)
+        self.shadow_service = ShadowService(raster_workers)
+        self.geojson_service = GeoJSONService()
+        self.zonal_service = ZonalService(raster_workers)
+        self.cache = ArtifactCache(settings.CACHE_DIR)
+        self._session_locks: dict[str, FileLock] = {}
+        self._session_locks_lock = threading.Lock()
+        # Stats of the static files when the session updates last checked the static intermediates
+        self._static_files = None
+        self._static_files_lock = threading.Lock()
+
+    def generate_full_map(
+        self,
+        pipeline: str = "fused",
+        weather: WeatherParams = WeatherParams(),
+        force: bool = False,
+    ) -> dict:
+        """
+        Generates the PET map of the whole area, skipping every stage whose inputs did not change.
+
+        :param str pipeline: "fused" or "stepwise" calculation of the zonal fields
+        :param WeatherParams weather: The weather parameters of the calculated moment
+        :param bool force: Rebuild every stage, even if it is up to date
+        :return: Per stage whether it was rebuilt, and the timings of the rebuilt stages
+        """
+        stages = [
+            "zonal_partials", "svf_filled", "base_shadow_map", "base_pet", "sun_pet", "shadow_pet", "pet_map"
+        ]
+        if force:
+            for stage in stages:
+                self.cache.invalidate(stage)
+
+        timings = {}
+        rebuilt = {}
+
+        rebuilt.update(self.ensure_static_intermediates(pipeline, weather, timings))
+
+        rebuilt["sun_pet"] = self._run_stage(
+            "sun_pet",
+            [self.SUN_PARTIAL, self.BOWEN, self.SVF_FILLED],
+            {},
+            [self.SUN_PET],
+            lambda: self.pet_service.calculate_total_pet_sun(
+                self.SUN_PARTIAL, self.BOWEN, self.SVF_FILLED, self.SUN_PET
+            ),
+            timings,
+        )
+        rebuilt["shadow_pet"] = self._run_stage(
+            "shadow_pet",
+            [self.SHADOW_PARTIAL, self.SVF_FILLED, self.T_A],
+            {},
+            [self.SHADOW_PET],
+            lambda: self.pet_service.calculate_total_pet_shadow(
+                self.SHADOW_PARTIAL, self.SVF_FILLED, self.T_A, self.SHADOW_PET
+            ),
+            timings,
+        )
+
+        shadow_map = self.base_shadow_map()
+        rebuilt["pet_map"] = self._run_stage(
+            "pet_map",
+            [shadow_map, self.SUN_PET, self.SHADOW_PET],
+            {},
+            [self.PET],
+            lambda: self.pet_service.calculate_total_pet_map(
+                shadow_map, self.SUN_PET, self.SHADOW_PET, self.PET
+            ),
+            timings,
+        )
+
+        return {
+            "stages": {stage: "rebuilt" if done else "skipped" for stage, done in rebuilt.items()},
+            "timings": timings,
+        }
+
+    def ensure_static_intermediates(
+        self,
+        pipeline: str = "fused",
+        weather: WeatherParams = WeatherParams(),
+        timings: dict | None = None,
+    ) -> dict[str, bool]:
+        """
+        Makes sure the intermediates that /pet/update reads exist and are up to date,
+        including the filled PET map without any placed objects that sessions start from.
+
+        :return: Per stage whether it was rebuilt
+        """
+        timings = {} if timings is None else timings
+        rebuilt = {}
+
+        rebuilt["zonal_partials"] = self._run_stage(
+            "zonal_partials",
+            [self.ZONAL_LAYER, self.VEGETATION, self.SVF, self.DSM],
+            {"pipeline": pipeline, "weather": weather.model_dump()},
+            [self.SUN_PARTIAL, self.SHADOW_PARTIAL, self.T_A],
+            lambda: timings.update(self._build_zonal_partials(pipeline, weather)),
+            timings,
+        )
+        rebuilt["svf_filled"] = self._ensure_svf_filled(timings)
+
+        shadow_map = self.base_shadow_map()
+        rebuilt["base_shadow_map"] = self._run_stage(
+            "base_shadow_map",
+            [self.DSM],
+            {"lat": self.LAT, "lon": self.LON, "moment": self.SHADOW_MOMENT, "method": settings.SHADOW_METHOD},
+            [shadow_map],
+            lambda: self.shadow_service.generate_shadow_maps(
+                self.DSM, self.SHADOW_MAPS, self.LAT, self.LON, self.SHADOW_MOMENT, self.SHADOW_MOMENT
+            ),
+            timings,
+        )
+        rebuilt["base_pet"] = self._run_stage(
+            "base_pet",
+            [shadow_map, self.SUN_PARTIAL, self.BOWEN, self.SVF_FILLED, self.SHADOW_PARTIAL, self.T_A],
+            {"fill_distance": self.FILL_DISTANCE},
+            [self.BASE_PET],
+            lambda: self.pet_service.calculate_total_pet_fused(
+                shadow_map,
+                self.SUN_PARTIAL,
+                self.BOWEN,
+                self.SVF_FILLED,
+                self.SHADOW_PARTIAL,
+                self.T_A,
+                self.BASE_PET,
+                fill_distance=self.FILL_DISTANCE,
+            ),
+            timings,
+        )
+        return rebuilt
+
+    def generate_daily_cube(
+        self,
+        day: date,
+        weather: WeatherParams = WeatherParams(),
+        pet_threshold: float = 35,
+        force: bool = False,
+    ) -> dict:
+        """
+        Generates the PET of every hour of a day as one multiband raster, with the maximum PET and
+        the hours above pet_threshold as the last two bands. The zonal statistics, UHI and wind speed
+        are calculated and rasterized once; the shadow maps of all hours come from one shadow stack.
+
+        :param date day: The day (hours in local time)
+        :param WeatherParams weather: The weather parameters of the day, date_time is not used
+        :param float pet_threshold: The PET (in °C) above which an hour is counted
+        :param bool force: Rebuild every stage, even if it is up to date
+        :return: The path of the cube, per stage whether it was rebuilt, and the timings
+        """
+        day_str = day.strftime("%Y%m%d")
+        moments = [datetime.combine(day, datetime.min.time()) + timedelta(hours=hour) for hour in range(24)]
+        shadow_stack = os.path.join(self.SHADOW_MAPS, f"shadow_stack_{settings.SHADOW_METHOD}_{day_str}.tif")
+        output_path = os.path.join(self.PET_CUBES, f"pet_cube_{day_str}.tif")
+        static_params = weather.model_dump(include={"ff10", "t_min", "t_max", "average_wind_speed"})
+
+        stages = ["svf_filled", "cube_statics", f"shadow_stack_{day_str}", f"pet_cube_{day_str}"]
+        if force:
+            for stage in stages:
+                self.cache.invalidate(stage)
+
+        timings = {}
+        rebuilt = {}
+        os.makedirs(self.PET_CUBES, exist_ok=True)
+
+        rebuilt["svf_filled"] = self._ensure_svf_filled(timings)
+        rebuilt["cube_statics"] = self._run_stage(
+            "cube_statics",
+            [self.ZONAL_LAYER, self.VEGETATION, self.SVF, self.DSM],
+            static_params,
+            [self.CUBE_STATICS],
+            lambda: self._build_cube_statics(weather),
+            timings,
+        )
+        rebuilt[f"shadow_stack_{day_str}"] = self._run_stage(
+            f"shadow_stack_{day_str}",
+            [self.DSM],
+            {"lat": self.LAT, "lon": self.LON, "day": day, "method": settings.SHADOW_METHOD},
+            [shadow_stack],
+            lambda: self.shadow_service.generate_shadow_stack(
+                self.DSM, shadow_stack, self.LAT, self.LON, moments[0], moments[-1]
+            ),
+            timings,
+        )
+        rebuilt[f"pet_cube_{day_str}"] = self._run_stage(
+            f"pet_cube_{day_str}",
+            [self.CUBE_STATICS, self.BOWEN, self.SVF_FILLED, shadow_stack],
+            {
+                "weather": weather.model_dump(exclude={"date_time"}),
+                "day": day,
+                "pet_threshold": pet_threshold,
+                "fill_distance": self.FILL_DISTANCE,
+            },
+            [output_path],
+            lambda: self.pet_service.calculate_pet_cube(
+                (self.CUBE_STATICS, 1),
+                (self.CUBE_STATICS, 2),
+                self.BOWEN,
+                self.SVF_FILLED,
+                shadow_stack,
+                moments,
+                output_path,
+                weather,
+                pet_threshold=pet_threshold,
+                fill_distance=self.FILL_DISTANCE,
+            ),
+            timings,
+        )
+
+        return {
+            "output": output_path,
+            "stages": {stage: "rebuilt" if done else "skipped" for stage, done in rebuilt.items()},
+            "timings": timings,
+        }
+
+    def base_shadow_map(self) -> str:
+        return self.shadow_service.shadow_map_path(self.SHADOW_MAPS, self.SHADOW_MOMENT)
+
+    def update_session_pet(self, session_id: str, points: List[Point]) -> str:
+        """
+        Recalculates the PET map of a session with the placed objects burned into the DSM and bowen ratio.
+
+        Only the area influenced by the objects that were added or removed since the previous update
+        is recalculated: their footprints plus the reach of their shadow and of the NoData fill. That
+        window is stored as a small overlay tile; the PET map of the session is a VRT of the shared base
+        PET map with the tiles of all updates on top (copy-on-write, the base map is never copied).
+        After SESSION_MAX_TILES tiles they are compacted into a base map of the session.
+
+        Updates of the same session run one after the other, updates of different sessions in parallel:
+        every update works in its own scratch folder, which is removed afterwards. An update that is
+        cancelled (superseded by a newer one) stops at the next step and leaves the session as it was.
+
+        :return: The path of the new PET map (VRT)
+        """
+        self._ensure_static_checked()
+
+        session_folder = os.path.join(self.SESSIONS, str(session_id))
+        with self._session_lock(session_folder):
+            # A newer update may have superseded this one while it waited for the lock
+            raise_if_cancelled()
+
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            pet_overlay = os.path.join(session_folder, f"pet_{timestamp}_filled.vrt")
+
+            base_pet, tiles, previous_points = self._read_session_state(session_folder)
+            changed = self._changed_points(previous_points, points)
+
+            if changed:
+                start = time.perf_counter()
+                reach = self._influence_distance(points + previous_points)
+                dirty = expand_bounds(union_bounds([self._footprint(pt) for pt in changed]), reach)
+                tile = os.path.join(session_folder, f"tile_{timestamp}.tif")
+                scratch_folder = tempfile.mkdtemp(prefix=f"run_{timestamp}_", dir=session_folder)
+                try:
+                    self._recalculate_window(scratch_folder, points, dirty, reach, tile)
+                except JobCancelled:
+                    if os.path.exists(tile):
+                        os.remove(tile)
+                    raise
+                finally:
+                    shutil.rmtree(scratch_folder, ignore_errors=True)
+                tiles = tiles + [tile]
+                print(f"Patched {len(changed)} changed object(s) in {time.perf_counter() - start:.2f}s")
+
+            write_overlay(pet_overlay, base_pet, tiles)
+            if len(tiles) > settings.SESSION_MAX_TILES:
+                base_pet = materialize(pet_overlay, os.path.join(session_folder, f"base_{timestamp}.tif"))
+                tiles = []
+                write_overlay(pet_overlay, base_pet, tiles)
+
+            self._write_session_state(session_folder, pet_overlay, base_pet, tiles, points)
+
+            update_pet_layer_in_project(
+                os.path.join(session_folder, "map.qgz"), pet_overlay, f"pet_{timestamp}_filled"
+            )
+            self._remove_superseded(session_folder, [pet_overlay, base_pet] + tiles)
+            return pet_overlay
+
+    def _ensure_static_checked(self):
+        """
+        Runs ensure_static_intermediates, unless it already ran in this process and none of the static
+        inputs and intermediates changed since. An update then does not digest and lock every stage.
+        """
+        with self._static_files_lock:
+            if self._static_files is not None and self._static_files == self._static_files_stats():
+                return
+            self.ensure_static_intermediates()
+            self._static_files = self._static_files_stats()
+
+    def _static_files_stats(self) -> list[tuple[str, int, int] | None]:
+        """The size and modification time of the static inputs and intermediates, None for missing files."""
+        paths = [
+            self.ZONAL_LAYER, self.VEGETATION, self.SVF, self.DSM, self.BOWEN,
+            self.SUN_PARTIAL, self.SHADOW_PARTIAL, self.T_A, self.SVF_FILLED, self.base_shadow_map(), self.BASE_PET,
+        ]
+        stats = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stats.append(None)
+                continue
+            stats.append((path, stat.st_size, stat.st_mtime_ns))
+        return stats
+
+    def _remove_superseded(self, session_folder: str, keep: list[str]):
+        """
+        Removes the PET maps, base maps and tiles of the session that the current state no longer uses:
+        older VRTs, and the tiles and base map that were merged by a compaction.
+        """
+        keep = {os.path.abspath(path) for path in keep}
+        for pattern in ("pet_*_filled.vrt", "pet_*_filled.tif", "base_*.tif", "tile_*.tif"):
+            for path in glob.glob(os.path.join(session_folder, pattern)):
+                if os.path.abspath(path) not in keep:
+                    os.remove(path)
+
+    def _session_lock(self, session_folder: str) -> FileLock:
+        """A lock per session, shared with the other worker processes through a lock file in the session folder."""
+        session_folder = os.path.abspath(session_folder)
+        with self._session_locks_lock:
+            if session_folder not in self._session_locks:
+                self._session_locks[session_folder] = FileLock(os.path.join(session_folder, ".lock"))
+            return self._session_locks[session_folder]
+
+    def _recalculate_window(
+        self,
+        scratch_folder: str,
+        points: List[Point],
+        dirty: Bounds,
+        reach: float,
+        tile_path: str,
+    ):
+        """
+        Recalculates the PET inside the dirty bounds and writes it to an overlay tile on the grid of the PET map.
+        The inputs are cropped with another `reach` around the dirty bounds, so the shadow and
+        the fill of every pixel that is written see the same neighbourhood as a full recalculation.
+
+        :param str scratch_folder: Folder of this update only, for the cropped inputs and the intermediates
+        """
+        bounds = expand_bounds(dirty, reach)
+        dsm_window = os.path.join(scratch_folder, "dsm.tif")
+        bowen_window = os.path.join(scratch_folder, "bowen.tif")
+        pet_window = os.path.join(scratch_folder, "pet_window.tif")
+
+        crop_raster(self.DSM, bounds, dsm_window)
+        crop_raster(self.BOWEN, bounds, bowen_window)
+
+        # Every object that touches the window is burned, also the unchanged ones
+        touching = [pt for pt in points if intersects(self._footprint(pt), bounds)]
+        if touching:
+            self.raster_service.burn_points_to_raster_pixel_cloud(dsm_window, touching, jitter=self.LEAF_JITTER)
+            self.raster_service.burn_points_to_raster(
+                bowen_window, touching, buffer_distance=self.BOWEN_BUFFER_DISTANCE, height=0.4, sameHeight=True
+            )
+        raise_if_cancelled()
+
+        # Written to the scratch folder, so the cached base shadow map and other updates are left untouched
+        shadow_path = self.shadow_service.generate_shadow_maps(
+            dsm_window, scratch_folder, self.LAT, self.LON, self.SHADOW_MOMENT, self.SHADOW_MOMENT
+        )
+        raise_if_cancelled()
+
+        self.pet_service.calculate_total_pet_fused(
+            shadow_path,
+            self.SUN_PARTIAL,
+            bowen_window,
+            self.SVF_FILLED,
+            self.SHADOW_PARTIAL,
+            self.T_A,
+            pet_window,
+            fill_distance=self.FILL_DISTANCE,
+        )
+        raise_if_cancelled()
+
+        write_tile(pet_window, dirty, tile_path)
+
+    def _footprint(self, point: Point) -> Bounds:
+        """The bounds of the pixels an object is burned into, in the DSM and in the bowen ratio."""
+        radius = point.radius if point.radius is not None else 5.0
+        extent = max(radius + self.LEAF_JITTER, self.BOWEN_BUFFER_DISTANCE)
+        return point.x - extent, point.x + extent, point.y - extent, point.y + extent
+
+    def _influence_distance(self, points: List[Point]) -> float:
+        """
+        Distance (in map units) around a changed pixel in which the PET can change:
+        the reach of its shadow plus the fill halo, with one extra pixel for snapping to the grids.
+        """
+        max_height = max((pt.height for pt in points if pt.height is not None), default=None)
+        shadow_reach = self.shadow_service.shadow_reach(
+            self.DSM, self.LAT, self.LON, self.SHADOW_MOMENT, max_height=max_height
+        )
+        size = max(pixel_size(self.DSM), pixel_size(self.SUN_PARTIAL))
+        return shadow_reach + (fill_halo(self.FILL_DISTANCE, 0) + 1) * size
+
+    def _changed_points(self, previous: List[Point], current: List[Point]) -> List[Point]:
+        """The objects that were added or removed since the previous update."""
+        def key(point: Point) -> str:
+            return json.dumps(point.model_dump(mode="json"), sort_keys=True)
+
+        previous_keys = {key(pt) for pt in previous}
+        current_keys = {key(pt) for pt in current}
+        added = [pt for pt in current if key(pt) not in previous_keys]
+        removed = [pt for pt in previous if key(pt) not in current_keys]
+        return added + removed
+
+    def _read_session_state(self, session_folder: str) -> tuple[str, list[str], List[Point]]:
+        """
+        :return: The base PET map of the session, its overlay tiles and the objects it contains,
+                 or the shared base PET map without tiles and objects for a new session
+        """
+        state_path = os.path.join(session_folder, self.SESSION_STATE)
+        if os.path.exists(state_path):
+            try:
+                with open(state_path) as file:
+                    state = json.load(file)
+                # Sessions written before the overlays have a full PET map and no tiles
+                base_pet = state.get("base_pet", state["pet"])
+                tiles = state.get("tiles", [])
+                # A session made on top of an older base PET map is recalculated from the current one
+                if (
+                    all(os.path.exists(path) for path in [base_pet] + tiles)
+                    and state["base"] == self.cache.file_digest(self.BASE_PET)
+                ):
+                    return base_pet, tiles, [Point(**pt) for pt in state["points"]]
+            except (OSError, ValueError, KeyError):
+                print(f"Ignoring unreadable session state: {state_path}")
+        return self.BASE_PET, [], []
+
+    def _write_session_state(
+        self,
+        session_folder: str,
+        pet_path: str,
+        base_pet: str,
+        tiles: list[str],
+        points: List[Point],
+    ):
+        state_path = os.path.join(session_folder, self.SESSION_STATE)
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({
+                "pet": pet_path,
+                "base_pet": base_pet,
+                "tiles": tiles,
+                "base": self.cache.file_digest(self.BASE_PET),
+                "points": [pt.model_dump(mode="json") for pt in points],
+            }, file)
+        os.replace(tmp_path, state_path)
+
+    def _ensure_svf_filled(self, timings: dict) -> bool:
+        return self._run_stage(
+            "svf_filled",
+            [self.SVF],
+            {"distance": self.FILL_DISTANCE},
+            [self.SVF_FILLED],
+            lambda: self.raster_service.fill_nodata_gdal(self.SVF, self.SVF_FILLED, distance=self.FILL_DISTANCE),
+            timings,
+        )
+
+    def _build_cube_statics(self, weather: WeatherParams):
+        """
+        Rasterizes the hour independent UHI and wind speed of the zones as the two bands of one raster,
+        on the 1 m grid over the zones. The zones are copied first, so the fields are not written into the
+        zonal layer that the single moment pipeline uses.
+        """
+        os.makedirs(os.path.dirname(self.CUBE_ZONES), exist_ok=True)
+        shutil.copyfile(self.ZONAL_LAYER, self.CUBE_ZONES)
+
+        vector = self.pet_service.load_zonal_layer(self.CUBE_ZONES)
+        obj = self.pet_service.calculate_zonal_static_fields(vector, self.VEGETATION, self.SVF, weather)
+
+        self.raster_service.rasterize_vector_fields(obj, ["uhi", "geschaalde_u_1_2"], self.CUBE_STATICS)
+
+    def _build_zonal_partials(self, pipeline: str, weather: WeatherParams) -> dict[str, float]:
+        """
+        Calculates the zonal PET fields and rasterizes the partial PETs (clipped to the DSM) and air temperature
+        on the 1 m grid over the zones, like gdal:rasterize and gdal:cliprasterbyextent did.
+        """
+        vector = self.pet_service.load_zonal_layer(self.ZONAL_LAYER)
+        timings = {}
+
+        if pipeline == "fused":
+            obj, timings = self.pet_service.calculate_zonal_pet_fields(vector, self.VEGETATION, self.SVF, weather)
+        else:
+            obj = self.geojson_service.calculate_wind_speed_1_2(vector, ff10=weather.ff10)
+            obj = self.pet_service.calculate_zonal_uhi(
+                obj, self.VEGETATION, self.SVF, weather.t_min, weather.t_max, weather.average_wind_speed
+            )
+            obj = self.pet_service.calculate_t_a_temperature(obj, "uhi", weather.base_temperature, weather.date_time)
+            obj = self.pet_service.calculate_wet_bulb_temp(obj, "t_a", weather.r_h)
+
+            obj = self.pet_service.calculate_zonal_part_pet_sun(
+                obj, "t_a", "t_w", "geschaalde_u_1_2", weather.phi, weather.q_gl
+            )
+            obj = self.pet_service.calculate_zonal_part_pet_shadow(obj, "t_a", "t_w", "geschaalde_u_1_2")
+
+        start = time.perf_counter()
+        self.raster_service.rasterize_vector_fields(obj, ["pet_sun_partial"], self.SUN_PARTIAL, clip_raster=self.DSM)
+        self.raster_service.rasterize_vector_fields(
+            obj, ["pet_shadow_partial"], self.SHADOW_PARTIAL, clip_raster=self.DSM
+        )
+        self.raster_service.rasterize_vector_fields(obj, ["t_a"], self.T_A)
+        timings["rasterize"] = time.perf_counter() - start
+        return timings
+
+    def _run_stage(self, stage: str, inputs: list[str], params: dict, outputs: list[str], build, timings: dict) -> bool:
+        start = time.perf_counter()
+        rebuilt = self.cache.ensure(stage, inputs, params, outputs, build)
+        timings[stage] = time.perf_counter() - start
+        return rebuilt
@@ -0,0 +1,33 @@
+from datetime import date
+from typing import List
+from src.api.models import Point
+from src.configs.preflight import init_qgis
+from src.services.pipeline_service import PipelineService
+
+# Pipeline jobs as module level functions, so they can be sent to the QGIS worker processes.
+# Every process builds its own PipelineService on the first job it runs, or when it starts as a QGIS worker.
+_pipeline_service: PipelineService | None = None
+
+def init_worker(raster_workers: int):
+    """
+    Initializes a QGIS worker process of the job pool. The worker's raster stages get their share
+    of the cores, so the workers together do not start more raster processes than there are cores.
+    """
+    global _pipeline_service
+    init_qgis()
+    _pipeline_service = PipelineService(raster_workers)
+
+def _pipeline() -> PipelineService:
+    global _pipeline_service
+    if _pipeline_service is None:
+        _pipeline_service = PipelineService()
+    return _pipeline_service
+
+def generate_full_map(pipeline: str = "fused", force: bool = False) -> dict:
+    return _pipeline().generate_full_map(pipeline, force=force)
+
+def generate_daily_cube(day: date, pet_threshold: float = 35, force: bool = False) -> dict:
+    return _pipeline().generate_daily_cube(day, pet_threshold=pet_threshold, force=force)
+
+def update_session_pet(session_id: str, points: List[Point]) -> str:
+    return _pipeline().update_session_pet(session_id, points)
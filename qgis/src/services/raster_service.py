@@ -1,199 +1,131 @@
 import os
-import tempfile
-from qgis.core import (
-    QgsVectorLayer, QgsRasterLayer, QgsFeature, QgsGeometry, QgsPointXY,
-    QgsField, QgsProcessingFeedback, QgsVectorFileWriter
-)
-from qgis.PyQt.QtCore import QVariant
+from qgis.core import QgsVectorLayer, QgsRasterLayer
 from typing import List
 from src.api.models import Point
+from src.configs import settings
+from src.utils.raster_fill import fill_nodata_raster
+from src.utils.raster_calculator import RasterCalculator, grid_from_extent, crop_grid
+from src.utils.virtual_raster import warp_raster, is_virtual
+from src.utils.scratch import ScratchWorkspace
+from src.utils.leaf_cloud import Tree, stamp_leaf_clouds
+from src.utils.footprint_raster import CircleFootprint, paint_footprints
+from src.utils.cancellation import job_feedback
+from src.services.zonal_service import ZonalService
 import shutil
-import math
-import random
 
 class RasterService:
+    def __init__(self, raster_workers: int = settings.RASTER_WORKERS):
+        self.raster_workers = raster_workers
+        self.zonal_service = ZonalService(raster_workers)
+
     def load_raster_layer(self, path: str, layer: str) -> QgsRasterLayer:
         return QgsRasterLayer(path, layer)
 
+    def scratch_workspace(self, name: str = "scratch") -> ScratchWorkspace:
+        """
+        A workspace for throwaway intermediates in a temporary folder.
+        Every workspace is a namespace of its own, so concurrent requests never share a file.
+        Use it as a context manager, so everything in it is removed afterwards.
+        """
+        return ScratchWorkspace(name)
+
     def burn_points_to_raster(
         self,
         raster: str,
         points: List[Point], 
-        crs="EPSG:28992",
         buffer_distance = 3,
         output_path: str | None = None,
         height: float = 0.4,
         sameHeight: bool = False
     ) -> str:
-        import processing
+        """
+        Burns a disc of buffer_distance around every point into the raster, with the height of the point
+        (or `height` when the point has none or sameHeight is set). The pixels whose centre lies in a disc
+        are painted directly into the raster, without building and rasterizing buffer polygons.
 
-        # Creating a vector layer
-        # https://docs.qgis.org/3.40/en/docs/pyqgis_developer_cookbook/vector.html#from-an-instance-of-qgsvectorlayer
-        vl = QgsVectorLayer(f"Point?crs={crs}", "temp_point", "memory")
-        pr = vl.dataProvider()
-        pr.addAttributes([QgsField("value", QVariant.Double)]) # Add Fields
-        vl.updateFields() # Tell the vector layer to fetch changes from the provider
+        The points must be in the CRS of the raster.
 
-        # --- Add all points ---
+        :param str output_path: Burn into a copy of the raster at this path instead of into the raster itself
+        :return: The path of the burned raster
+        """
+        footprints = []
         for pt in points:
-            feat = QgsFeature() # Shape + Attribute
-            feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(pt.x, pt.y)))
             value = pt.height if pt.height != None and pt.height != 0 else height
-            
+
             if sameHeight:
                 value = height
-                
-            feat.setAttributes([value])
-            pr.addFeature(feat)
-        vl.updateExtents()
-
-        # Buffer for the point (in order to have actual dimensions)
-        buffer_layer_path = os.path.join(tempfile.gettempdir(), "buffered_point.gpkg") 
-        processing.run(
-            "native:buffer",
-            {
-                "INPUT": vl,
-                "DISTANCE": buffer_distance,
-                "SEGMENTS": 16,
-                "END_CAP_STYLE": 0,
-                "JOIN_STYLE": 0,
-                "MITER_LIMIT": 2,
-                "DISSOLVE": False,  # Merge overlapping buffers
-                "OUTPUT": buffer_layer_path,
-            },
-        )
 
+            footprints.append(CircleFootprint(pt.x, pt.y, buffer_distance, value))
+
+        target = output_path or raster
         if output_path:
             shutil.copyfile(raster, output_path)
 
-            processing.run(
-                "gdal:rasterize_over",
-                {
-                    "INPUT": buffer_layer_path,
-                    "INPUT_RASTER": output_path,
-                    "FIELD": "value",
-                    "ADD": False,
-                    "EXTRA": "",
-                    "OPTIONS": "",
-                },
-                feedback=QgsProcessingFeedback(),
-            )
-
-            return output_path
-
-        else:
-            processing.run(
-                "gdal:rasterize_over",
-                {
-                    "INPUT": buffer_layer_path,
-                    "INPUT_RASTER": raster,
-                    "FIELD": "value",
-                    "ADD": False,
-                    "EXTRA": "",
-                    "OPTIONS": "",
-                },
-                feedback=QgsProcessingFeedback(),
-            )
+        paint_footprints(target, footprints, memory_budget_mb=settings.RASTER_MEMORY_BUDGET_MB)
 
-            return raster
+        return target
 
-    def rasterize_vector_layer(
+    def rasterize_vector_fields(
         self,
         vector_layer: QgsVectorLayer,
-        attribute_field: str,
+        attribute_fields: list[str],
         output_path: str,
+        reference_raster: str | None = None,
+        extent: tuple[float, float, float, float] | None = None,
         resolution: float = 1.0,
+        crs_wkt: str | None = None,
         no_data_value: float = 0.0,
+        clip_raster: str | None = None,
     ) -> QgsRasterLayer:
         """
-        Rasterizes a vector layer based on a specific attribute field using georeferenced units.
+        Rasterizes several attribute fields in one pass into a multiband raster (one Float32 band per field).
+        With a reference raster the output is aligned to its pixel grid, so no clip or warp is needed afterwards.
+        Without one the grid is the one gdal:rasterize makes in georeferenced units.
 
         :param QgsVectorLayer vector_layer: Input vector layer to rasterize.
-        :param str attribute_field: The attribute field whose values will be burned into the raster.
-        :param str output_path: Path to the output raster (e.g., '/tmp/output.tif').
-        :param float resolution: The raster resolution in georeferenced units
+        :param list[str] attribute_fields: The attribute fields to burn, in band order.
+        :param str output_path: Path to the output raster.
+        :param str reference_raster: Raster whose grid (extent, resolution and CRS) is used.
+        :param tuple extent: (xmin, xmax, ymin, ymax) of the output without a reference raster, defaults to the layer extent
+        :param float resolution: The raster resolution in georeferenced units, without a reference raster
+        :param str crs_wkt: The CRS of the output without a reference raster (the layer must be in it), defaults to the layer CRS
         :param float no_data_value: Value for pixels with no data.
-        :return: The rasterized layer as a QgsRasterLayer.
-        :rtype: QgsRasterLayer
+        :param str clip_raster: Clips the output to the extent of this raster, on the grid of the output
+                                (like gdal:cliprasterbyextent afterwards)
+        :return: The multiband raster as a QgsRasterLayer.
         """
-        import processing
-
-        feedback = QgsProcessingFeedback()
+        calculator = RasterCalculator()
+        if reference_raster is not None:
+            sources = calculator.open_inputs({"reference": reference_raster})
+            grid = calculator.intersect_grid([sources["reference"][0]])
+        else:
+            if extent is None:
+                layer_extent = vector_layer.extent()
+                extent = (
+                    layer_extent.xMinimum(), layer_extent.xMaximum(), layer_extent.yMinimum(), layer_extent.yMaximum()
+                )
+            grid = grid_from_extent(extent, resolution, crs_wkt or vector_layer.crs().toWkt())
 
-        # Define raster extent and resolution in georeferenced units
-        params = {
-            'INPUT': vector_layer,
-            'FIELD': attribute_field,
-            'BURN': 1, #  Source trust me (ui qgis)
-            'USE_Z': False,
-            'UNITS': 1,  # 1 = Georeferenced units (map units)
-            'WIDTH': resolution,
-            'HEIGHT': resolution,
-            'EXTENT': vector_layer.extent(),
-            'NODATA': no_data_value,
-            'DATA_TYPE': 5,  # Float32
-            'OUTPUT': output_path
-        }
+        if clip_raster is not None:
+            sources = calculator.open_inputs({"clip": clip_raster})
+            grid = crop_grid(grid, calculator.dataset_extent(sources["clip"][0]))
 
-        result = processing.run("gdal:rasterize", params, feedback=feedback)
-        raster_layer = QgsRasterLayer(result['OUTPUT'], os.path.basename(output_path))
+        self.zonal_service.rasterize_fields(vector_layer, attribute_fields, grid, output_path, no_data_value)
+        raster_layer = QgsRasterLayer(output_path, os.path.basename(output_path))
 
         if not raster_layer.isValid():
             raise Exception(f"Rasterization failed — could not load output: {output_path}")
 
         return raster_layer
 
-    def clip_raster_by_extent(
-        self,
-        input_raster: QgsRasterLayer,
-        reference_raster: QgsRasterLayer,
-        output_path: str,
-        no_data_value: float = 0,
-        crop_to_cutline: bool = True
-    ) -> QgsRasterLayer:
-        """
-        Clips the first raster by the extent of the second raster.
-
-        :param QgsRasterLayer input_raster: The raster to be clipped.
-        :param QgsRasterLayer reference_raster: The raster whose extent will be used for clipping.
-        :param str output_path: The path for the clipped output raster (e.g., '/tmp/clipped.tif').
-        :param float no_data_value: Optional no-data value to assign to empty areas.
-        :param bool crop_to_cutline: Whether to crop tightly to the reference extent.
-        :return: The clipped raster layer.
-        :rtype: QgsRasterLayer
-        """
-        import processing
-
-        feedback = QgsProcessingFeedback()
-        
-        extent = reference_raster.extent()
-        extent_str = f"{extent.xMinimum()},{extent.xMaximum()},{extent.yMinimum()},{extent.yMaximum()}"
-
-        params = {
-            'INPUT': input_raster,
-            'PROJWIN': extent_str,
-            'NODATA': no_data_value,
-            'OPTIONS': '',
-            'DATA_TYPE': 0,  # same as input
-            'OUTPUT': output_path
-        }
-
-        result = processing.run("gdal:cliprasterbyextent", params, feedback=feedback)
-        
-        clipped_raster = QgsRasterLayer(result['OUTPUT'], os.path.basename(output_path))
-        
-        if not clipped_raster.isValid():
-            raise Exception("Raster clipping failed — could not load output raster.")
-        
-        return clipped_raster
-
     def fill_nodata_gdal(
         self,
-        input_raster_path: str,
+        input_raster_path: str | QgsRasterLayer,
         output_path: str,
         band: int = 1,
         distance: float = 10,
         iterations: int = 0,
+        backend: str = settings.RASTER_CALCULATOR_BACKEND,
     ) -> QgsRasterLayer:
         """
         Fills NoData pixels in a raster using GDAL's Fill NoData algorithm.
@@ -206,14 +138,27 @@ class RasterService:
         :param int band: Band number to process (default: 1)
         :param float distance: Maximum distance (in pixels) to search for values (default: 10)
         :param int iterations: Number of smoothing iterations (default: 0)
+        :param str backend: "numpy" fills window by window within the memory budget, "gdal" runs gdal:fillnodata
         :return: QgsRasterLayer of the filled raster
         :rtype: QgsRasterLayer
         """
         import processing
-        from qgis.core import QgsProcessingFeedback
         import os
 
-        feedback = QgsProcessingFeedback()
+        if backend == "numpy":
+            input_path = input_raster_path.source() if isinstance(input_raster_path, QgsRasterLayer) else input_raster_path
+            fill_nodata_raster(
+                input_path, output_path, band, distance, iterations,
+                settings.RASTER_MEMORY_BUDGET_MB, self.raster_workers,
+            )
+            filled_raster = QgsRasterLayer(output_path, os.path.basename(output_path))
+
+            if not filled_raster.isValid():
+                raise Exception("NoData filling failed — could not load output raster.")
+
+            return filled_raster
+
+        feedback = job_feedback()
 
         params = {
             'INPUT': input_raster_path,
@@ -243,16 +188,27 @@ class RasterService:
         target_resolution: float = 1,
     )-> str:
         import processing
-        feedback = QgsProcessingFeedback()
+        feedback = job_feedback()
         """
         Reprojects and resamples a raster to match the CRS and alignment of a target layer.
 
         :param input_raster_path: file path or QgsRasterLayer to warp
         :param target_layer_objr: QgsRasterLayer whose CRS/resolution/alignment will be matched
-        :param resampled_output_path: output file path for the warped raster
+        :param resampled_output_path: output file path for the warped raster, a .vrt path gives a warped VRT
+                                      (the warp then happens when the raster is read) instead of a GeoTIFF
         :param resampling: resampling method index (0=nearest, 1=bilinear, etc.)
         :param target_resolution: target resolution in map units
+        :return: the path of the warped raster, resampled_output_path
         """
+        if is_virtual(resampled_output_path):
+            input_path = input_raster.source() if isinstance(input_raster, QgsRasterLayer) else input_raster
+            return warp_raster(
+                input_path,
+                resampled_output_path,
+                target_layer_obj.crs().toWkt(),
+                target_resolution,
+                resampling,
+            )
 
         warp_params = {
             'INPUT': input_raster,
@@ -276,65 +232,41 @@ class RasterService:
         self,
         raster: str,
         points: List[Point],
-        crs="EPSG:28992",
         height: float = 0.4,
         radius: float = 5.0,
         density: int = 250,
         jitter: float = 0.3,
         output_path: str | None = None,
+        seed: int = settings.LEAF_CLOUD_SEED,
     ):
-        import processing
+        """
+        Burns every point as a cloud of leaf points (a disc of the point's radius, jittered) into the raster,
+        with the point's height. The leaf patterns come from a seeded generator, so the same points and seed
+        always give the same raster.
 
-        # Memory point layer for cloud
-        vl = QgsVectorLayer(f"Point?crs={crs}", "leaf_clouds", "memory")
-        pr = vl.dataProvider()
-        pr.addAttributes([QgsField("value", QVariant.Double)])
-        vl.updateFields()
+        The points must be in the CRS of the raster.
 
-        # Add clustered leaf points
-        for pt in points:
-            pointRadius = pt.radius if pt.radius != None else radius
-            leafs = self._generate_leaf_points(pt.x, pt.y, pointRadius, density, jitter)
-            for (px, py) in leafs:
-                feat = QgsFeature()
-                feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(px, py)))
-                pointHeight = pt.height if pt.height != None else height
-                feat.setAttributes([pointHeight])
-                pr.addFeature(feat)
-
-        vl.updateExtents()
-
-        # Save to temporary gpkg
-        tmpdir = tempfile.gettempdir()
-        gpkg_path = os.path.join(tmpdir, "leaf_clouds.gpkg")
-        QgsVectorFileWriter.writeAsVectorFormat(vl, gpkg_path, "utf-8", vl.crs(), "GPKG")
+        :param int density: Number of leaf points per tree
+        :param float jitter: Maximum shift of a leaf point along each axis, in map units
+        :param str output_path: Burns into a copy of the raster at this path instead of in place
+        :param int seed: Seed of the leaf patterns
+        :return: The path of the burned raster
+        """
+        trees = [
+            Tree(
+                pt.x,
+                pt.y,
+                pt.radius if pt.radius != None else radius,
+                pt.height if pt.height != None else height,
+            )
+            for pt in points
+        ]
 
         target = output_path or raster
         if output_path:
             shutil.copyfile(raster, output_path)
 
-        processing.run(
-            "gdal:rasterize_over",
-            {
-                "INPUT": gpkg_path,
-                "INPUT_RASTER": target,
-                "FIELD": "value",
-                "ADD": False
-            }
+        stamp_leaf_clouds(
+            target, trees, density, jitter, seed, memory_budget_mb=settings.RASTER_MEMORY_BUDGET_MB
         )
-
         return target
-
-    def _generate_leaf_points(self, x, y, radius, density, jitter):
-        pts = []
-        for _ in range(density):
-            # radius distribution
-            r = radius * math.sqrt(random.random())
-            ang = random.random() * 2 * math.pi
-
-            # Apply jitter and coordinates
-            px = x + math.cos(ang) * r + random.uniform(-jitter, jitter)
-            py = y + math.sin(ang) * r + random.uniform(-jitter, jitter)
-            
-            pts.append((px, py))
-        return pts
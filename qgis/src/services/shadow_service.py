@@ -1,9 +1,143 @@
 from datetime import timedelta
-from src.utils.solar_position import get_solar_position
-from qgis.core import QgsApplication, QgsProcessingFeedback
+from src.utils.solar_position import get_solar_position, solar_positions
+from src.utils.cast_shadow import cast_shadow_raster, shadow_length
+from src.utils.shadow_stack import shadow_stack_raster
+from src.configs import settings
+from src.utils.cancellation import job_feedback
+from qgis.core import QgsApplication
+from osgeo import gdal
 import os
 
 class ShadowService:
+    def __init__(self, raster_workers: int = settings.RASTER_WORKERS):
+        self.raster_workers = raster_workers
+        self._min_max: dict[tuple, tuple[float, float]] = {}
+
+    def generate_shadow_maps(
+        self, input_path, output_folder, lat, lon, start_dt, end_dt, method: str = settings.SHADOW_METHOD
+    ) -> str:
+        """
+        Generates one shadow map per hour between start_dt and end_dt with the given method.
+        All methods write values above 127 for sun, so the maps are interchangeable.
+
+        :param str method: "hillshade", "cast" or "cast_fractional"
+        :return: The path of the last shadow map
+        """
+        if method == "hillshade":
+            return self.generate_hillshade_maps(input_path, output_folder, lat, lon, start_dt, end_dt)
+        if method in ("cast", "cast_fractional"):
+            return self.generate_cast_shadow_maps(
+                input_path, output_folder, lat, lon, start_dt, end_dt, fractional=method == "cast_fractional"
+            )
+        raise ValueError(f"Unknown shadow method: {method}")
+
+    def generate_shadow_stack(
+        self,
+        input_path,
+        output_path,
+        lat,
+        lon,
+        start_dt,
+        end_dt,
+        step: timedelta = timedelta(hours=1),
+        method: str = settings.SHADOW_METHOD,
+    ) -> str:
+        """
+        Generates the shadow maps of every step between start_dt and end_dt as the bands of one raster.
+        The DSM is read once for all of them. The last band holds the number of steps each pixel is in shade,
+        with hourly steps the shaded hours.
+
+        :param str method: "hillshade", "cast" or "cast_fractional"
+        :return: The path of the shadow stack
+        """
+        moments = []
+        current_dt = start_dt
+        while current_dt <= end_dt:
+            moments.append(current_dt)
+            current_dt += step
+
+        azimuths, altitudes = solar_positions(lat, lon, moments)
+        positions = list(zip(azimuths.tolist(), altitudes.tolist()))
+        labels = [moment.isoformat() for moment in moments]
+
+        shadow_stack_raster(
+            input_path,
+            output_path,
+            positions,
+            labels,
+            method=method,
+            memory_budget_mb=settings.RASTER_MEMORY_BUDGET_MB,
+            workers=self.raster_workers,
+        )
+        print(f"Shadow stack of {len(positions)} moment(s) saved: {output_path}")
+
+        return output_path
+
+    def shadow_map_path(self, output_folder, dt, method: str = settings.SHADOW_METHOD) -> str:
+        prefix = "hillshade" if method == "hillshade" else "shadow"
+        return os.path.join(output_folder, f"{prefix}_{dt.strftime('%Y%m%d_%H%M')}.tif")
+
+    def shadow_reach(
+        self, input_path, lat, lon, dt, max_height: float | None = None, method: str = settings.SHADOW_METHOD
+    ) -> float:
+        """
+        Distance (in map units) over which a change of the DSM can change the shadow map.
+
+        :param float max_height: Highest surface that can be burned into the DSM, defaults to the DSM maximum
+        """
+        dataset = gdal.Open(input_path)
+        if dataset is None:
+            raise Exception(f"Could not open raster: {input_path}")
+        gt = dataset.GetGeoTransform()
+        pixel_size = max(abs(gt[1]), abs(gt[5]))
+
+        # The hillshade of a pixel only depends on its 3x3 neighbourhood
+        if method == "hillshade":
+            return pixel_size
+
+        minimum, maximum = self._raster_min_max(input_path, dataset)
+        if max_height is not None:
+            maximum = max(maximum, max_height)
+        _, alt = get_solar_position(lat, lon, dt)
+
+        # A shadow never reaches further than the raster itself
+        longest = pixel_size * max(dataset.RasterXSize, dataset.RasterYSize)
+        return min(shadow_length(maximum - minimum, alt), longest) + pixel_size
+
+    def _raster_min_max(self, path: str, dataset: gdal.Dataset) -> tuple[float, float]:
+        """
+        Exact minimum and maximum of the first band. Memoized per (path, size, mtime), so a static
+        raster like the DSM is only read in full once instead of on every update.
+        """
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._min_max:
+            self._min_max[memo_key] = tuple(dataset.GetRasterBand(1).ComputeRasterMinMax(False))
+        return self._min_max[memo_key]
+
+    def generate_cast_shadow_maps(self, input_path, output_folder, lat, lon, start_dt, end_dt, fractional=False) -> str:
+        current_dt = start_dt
+        out_path = ''
+        while current_dt <= end_dt:
+            az, alt = get_solar_position(lat, lon, current_dt)
+            print(f"{current_dt}: Azimuth={az:.2f}, Altitude={alt:.2f}")
+
+            out_path = self.shadow_map_path(output_folder, current_dt, "cast_fractional" if fractional else "cast")
+            cast_shadow_raster(
+                input_path,
+                out_path,
+                az,
+                alt,
+                fractional=fractional,
+                memory_budget_mb=settings.RASTER_MEMORY_BUDGET_MB,
+                workers=self.raster_workers,
+            )
+            print(f"Cast shadow map saved: {out_path}")
+
+            current_dt += timedelta(hours=1)
+
+        return out_path
+
     def generate_hillshade_maps(self, input_path, output_folder, lat, lon, start_dt, end_dt) -> str:
         import processing
         from processing.algs.gdal.GdalAlgorithmProvider import GdalAlgorithmProvider
@@ -12,7 +146,7 @@ class ShadowService:
         current_dt = start_dt
         out_path = ''
         while current_dt <= end_dt:
-            az, alt = get_solar_position(lat, lon, "Middelburg", "Netherlands", "Europe/Amsterdam", current_dt)
+            az, alt = get_solar_position(lat, lon, current_dt)
             print(f"{current_dt}: Azimuth={az:.2f}, Altitude={alt:.2f}")
 
             hour_str = current_dt.strftime("%Y%m%d_%H%M")
@@ -27,7 +161,7 @@ class ShadowService:
                 "MULTIDIRECTIONAL": False,
                 "OUTPUT": out_path,
             }
-            feedback = QgsProcessingFeedback()
+            feedback = job_feedback()
             processing.run("gdal:hillshade", params, feedback=feedback)
             print(f"Hillshade saved: {out_path}")
 
@@ -0,0 +1,149 @@
+import os
+import numpy as np
+from qgis.core import QgsVectorLayer, QgsFeatureRequest
+from src.services.attribute_service import AttributeService
+from src.utils.raster_calculator import RasterCalculator, RasterGrid
+from src.utils.zonal_stats import ZonalStatistics
+from src.utils.zone_index import ZoneIndex, build_zone_index, gather_raster, label_lookup
+from src.configs import settings
+
+class ZonalService:
+    """
+    Zonal statistics of a vector layer for any number of rasters at once.
+
+    The zones are rasterized once into a zone-label raster (the zone index) on a reference grid,
+    after which all rasters are reduced per zone in a single streaming pass. The zone index is kept
+    on disk, so attributes can be rasterized with a lookup per label instead of burning the polygons again.
+    """
+    INDEX_DIR = os.path.join(settings.CACHE_DIR, "zone_index")
+
+    def __init__(self, raster_workers: int = settings.RASTER_WORKERS):
+        self.raster_workers = raster_workers
+        self.attribute_service = AttributeService()
+        self.raster_calculator = RasterCalculator(settings.RASTER_MEMORY_BUDGET_MB)
+        self.zonal_statistics = ZonalStatistics(settings.RASTER_MEMORY_BUDGET_MB)
+
+    def zone_index(self, zonal_layer: QgsVectorLayer, reference: str | RasterGrid) -> ZoneIndex:
+        """
+        The zone-label raster of the layer on the grid of the reference raster (for example the DSM).
+        It is cached by the content hash of the geometries and the grid, so the polygons are only
+        rasterized again when the zones or the grid change.
+
+        :param QgsVectorLayer zonal_layer: The zones
+        :param str|RasterGrid reference: The raster whose pixel grid is used, or the grid itself
+        """
+        fids, geometries, _ = self._read_zones(zonal_layer)
+        return self._zone_index(zonal_layer, reference, fids, geometries)
+
+    def calculate_statistics(
+        self,
+        zonal_layer: QgsVectorLayer,
+        rasters: dict[str, str | tuple[str, int]],
+        reference_raster: str | None = None,
+    ) -> tuple[np.ndarray, dict[str, dict[str, np.ndarray]]]:
+        """
+        Calculates mean, min, max, count and sum of every raster per feature.
+
+        :param QgsVectorLayer zonal_layer: The zones
+        :param dict rasters: Name -> raster path or (path, band)
+        :param str reference_raster: The raster whose pixel grid the zones are rasterized on, defaults to the first raster
+        :return: The feature ids and per raster name a dict of statistic -> array aligned to the feature ids
+        """
+        if not rasters:
+            raise ValueError("Zonal statistics need at least one raster")
+
+        fids, geometries, points = self._read_zones(zonal_layer)
+        if len(fids) == 0:
+            empty = {stat: np.empty(0) for stat in ("mean", "min", "max", "sum")}
+            return fids, {name: {**empty, "count": np.empty(0, dtype=np.int64)} for name in rasters}
+
+        if reference_raster is None:
+            first = next(iter(rasters.values()))
+            reference_raster = first[0] if isinstance(first, tuple) else first
+
+        index = self._zone_index(zonal_layer, reference_raster, fids, geometries)
+        statistics = self.zonal_statistics.calculate(index.path, len(index.fids), rasters, points)
+        return index.fids, statistics
+
+    def rasterize_fields(
+        self,
+        zonal_layer: QgsVectorLayer,
+        fields: list[str],
+        reference: str | RasterGrid,
+        output_path: str,
+        no_data: float = 0.0,
+    ) -> str:
+        """
+        Rasterizes attributes as the bands of one raster on the reference grid, by looking up the value
+        of every zone label in the (cached) zone index instead of burning the polygons again.
+        The labels are read once for all fields.
+
+        :param list fields: The attributes to rasterize, one band each (named after the field)
+        :param str|RasterGrid reference: The raster whose pixel grid is used, or the grid itself
+        :param float no_data: Value outside the zones and of features without a value
+        :return: The output path
+        """
+        if not fields:
+            raise ValueError("Rasterizing needs at least one field")
+
+        index = self.zone_index(zonal_layer, reference)
+        fids, columns = self.attribute_service.read_columns(zonal_layer, fields)
+        lookup = np.stack([label_lookup(index, fids, columns[field], no_data) for field in fields])
+        return gather_raster(
+            index,
+            lookup if len(fields) > 1 else lookup[0],
+            output_path,
+            no_data,
+            band_names=fields,
+            memory_budget_mb=settings.RASTER_MEMORY_BUDGET_MB,
+            workers=self.raster_workers,
+        )
+
+    def add_zonal_means(
+        self,
+        zonal_layer: QgsVectorLayer,
+        rasters: dict[str, str | tuple[str, int]],
+        reference_raster: str | None = None,
+    ) -> QgsVectorLayer:
+        """
+        Writes the mean of every raster into the field '<prefix>mean', like QgsZonalStatistics
+        with attributePrefix=<prefix> and stats=Mean does.
+
+        :param dict rasters: Attribute prefix (for example 'svf_') -> raster path or (path, band)
+        :param str reference_raster: The raster whose pixel grid the zones are rasterized on, defaults to the first raster
+        """
+        fids, statistics = self.calculate_statistics(zonal_layer, rasters, reference_raster)
+        columns = {f"{prefix}mean": stats["mean"] for prefix, stats in statistics.items()}
+        return self.attribute_service.write_columns(zonal_layer, fids, columns)
+
+    def _zone_index(
+        self,
+        zonal_layer: QgsVectorLayer,
+        reference: str | RasterGrid,
+        fids: np.ndarray,
+        geometries: list[bytes | None],
+    ) -> ZoneIndex:
+        grid = reference
+        if not isinstance(reference, RasterGrid):
+            sources = self.raster_calculator.open_inputs({"reference": reference})
+            grid = self.raster_calculator.intersect_grid([sources["reference"][0]])
+        return build_zone_index(self.INDEX_DIR, fids, geometries, zonal_layer.crs().toWkt(), grid)
+
+    def _read_zones(self, zonal_layer: QgsVectorLayer) -> tuple[np.ndarray, list[bytes | None], list]:
+        """Reads the feature ids, the geometries (WKB) and a point on the surface of every feature."""
+        request = QgsFeatureRequest()
+        request.setSubsetOfAttributes([])
+
+        fids, geometries, points = [], [], []
+        for feature in zonal_layer.getFeatures(request):
+            fids.append(feature.id())
+            geometry = feature.geometry()
+            if geometry is None or geometry.isEmpty():
+                geometries.append(None)
+                points.append(None)
+                continue
+            geometries.append(bytes(geometry.asWkb()))
+            point = geometry.pointOnSurface().asPoint()
+            points.append((point.x(), point.y()))
+
+        return np.asarray(fids, dtype=np.int64), geometries, points
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Callable
+from src.utils.file_lock import FileLock
+
+class ArtifactCache:
+    """
+    Content-addressed cache for pipeline stages.
+
+    A stage is identified by a key: the hash of the contents of its input files and
+    of its parameters. The stage is only rebuilt when that key changed since its last
+    build or when one of its outputs is missing or was modified.
+    """
+    CHUNK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, cache_dir: str = "/data/cache"):
+        self.cache_dir = cache_dir
+        self._digests: dict[tuple, str] = {}
+        self._locks: dict[str, FileLock] = {}
+        self._locks_lock = threading.Lock()
+
+    def file_digest(self, path: str) -> str:
+        """
+        SHA-256 of the file contents. Memoized per (path, size, mtime) so unchanged files are hashed only once.
+        """
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._digests:
+            digest = hashlib.sha256()
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(self.CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            self._digests[memo_key] = digest.hexdigest()
+        return self._digests[memo_key]
+
+    def stage_key(self, stage: str, inputs: list[str], params: dict | None = None) -> str:
+        """
+        :param str stage: The name of the stage
+        :param list[str] inputs: The input files of the stage
+        :param dict params: The (JSON serializable) parameters of the stage
+        :return: The key of the stage for the current inputs and parameters
+        """
+        digest = hashlib.sha256(stage.encode())
+        for path in inputs:
+            if not os.path.exists(path):
+                raise Exception(f"Input of stage '{stage}' does not exist: {path}")
+            digest.update(self.file_digest(path).encode())
+        digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def is_fresh(self, stage: str, inputs: list[str], params: dict | None, outputs: list[str]) -> bool:
+        manifest = self._read_manifest(stage)
+        if manifest is None or manifest.get("key") != self.stage_key(stage, inputs, params):
+            return False
+
+        recorded = manifest.get("outputs", {})
+        for path in outputs:
+            if not os.path.exists(path) or recorded.get(path) != self.file_digest(path):
+                return False
+        return True
+
+    def ensure(
+        self,
+        stage: str,
+        inputs: list[str],
+        params: dict | None,
+        outputs: list[str],
+        build: Callable[[], object],
+    ) -> bool:
+        """
+        Runs `build` unless the outputs of the stage are up to date.
+
+        The key is recorded after the build, so stages that update their inputs in place
+        (like the zonal layer receiving its derived fields) are not rebuilt on the next run.
+
+        :return: True if the stage was rebuilt, False if it was skipped
+        """
+        with self._stage_lock(stage):
+            if self.is_fresh(stage, inputs, params, outputs):
+                print(f"Stage '{stage}' is up to date, skipped")
+                return False
+
+            build()
+
+            missing = [path for path in outputs if not os.path.exists(path)]
+            if missing:
+                raise Exception(f"Stage '{stage}' did not produce: {', '.join(missing)}")
+
+            self._write_manifest(stage, {
+                "key": self.stage_key(stage, inputs, params),
+                "inputs": inputs,
+                "params": params or {},
+                "outputs": {path: self.file_digest(path) for path in outputs},
+            })
+            print(f"Stage '{stage}' rebuilt")
+            return True
+
+    def invalidate(self, stage: str):
+        path = self._manifest_path(stage)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _stage_lock(self, stage: str) -> FileLock:
+        """A lock per stage, shared with the other worker processes through a lock file next to the manifest."""
+        with self._locks_lock:
+            if stage not in self._locks:
+                self._locks[stage] = FileLock(os.path.join(self.cache_dir, f"{stage}.lock"))
+            return self._locks[stage]
+
+    def _manifest_path(self, stage: str) -> str:
+        return os.path.join(self.cache_dir, f"{stage}.json")
+
+    def _read_manifest(self, stage: str) -> dict | None:
+        path = self._manifest_path(stage)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, stage: str, manifest: dict):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._manifest_path(stage)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(manifest, file, indent=2, default=str)
+        os.replace(tmp_path, path)
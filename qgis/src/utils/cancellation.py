@@ -0,0 +1,57 @@
+import contextvars
+import os
+import threading
+from qgis.core import QgsProcessingFeedback
+
+class JobCancelled(Exception):
+    """Raised inside a job once it was cancelled."""
+
+_feedback: contextvars.ContextVar[QgsProcessingFeedback | None] = contextvars.ContextVar("job_feedback", default=None)
+
+def job_feedback() -> QgsProcessingFeedback:
+    """
+    The feedback of the job running in this thread, so cancelling the job also cancels its processing
+    algorithms. Outside of a job this is a new feedback that is never cancelled.
+    """
+    feedback = _feedback.get()
+    return feedback if feedback is not None else QgsProcessingFeedback()
+
+def raise_if_cancelled():
+    """
+    :raises JobCancelled: When the job running in this thread was cancelled
+    """
+    feedback = _feedback.get()
+    if feedback is not None and feedback.isCanceled():
+        raise JobCancelled("The job was cancelled")
+
+def run_cancellable(cancel_path: str, task, *args, poll_interval: float = 0.25):
+    """
+    Runs the task with a job feedback that is cancelled as soon as the file cancel_path appears.
+    The file is the signal between processes: the job may run in a worker process.
+
+    :param str cancel_path: The file whose existence cancels the job
+    :param task: Module level function that runs the job
+    :return: The result of the task
+    :raises JobCancelled: When the job was cancelled
+    """
+    feedback = QgsProcessingFeedback()
+    finished = threading.Event()
+
+    def watch():
+        while not finished.wait(poll_interval):
+            if os.path.exists(cancel_path):
+                feedback.cancel()
+                return
+
+    token = _feedback.set(feedback)
+    watcher = threading.Thread(target=watch, name="job-cancel-watch", daemon=True)
+    watcher.start()
+    try:
+        return task(*args)
+    except Exception:
+        # A cancelled algorithm usually fails on its missing output; report the cancel instead
+        raise_if_cancelled()
+        raise
+    finally:
+        finished.set()
+        _feedback.reset(token)
@@ -0,0 +1,166 @@
+import math
+import numpy as np
+from osgeo import gdal
+from src.utils.raster_calculator import RasterCalculator, RasterGrid, SourceStage
+from src.utils.raster_blocks import Window
+
+# Encoding of the shadow maps, compatible with the hillshade threshold (values above 127 are sun)
+SUN = 255
+FULL_SHADE = 1
+NO_DATA = 0
+
+def sun_step(azimuth: float, pixel_width: float, pixel_height: float) -> tuple[float, float, float]:
+    """
+    One step from a pixel towards the sun: a whole pixel along the dominant axis.
+
+    :param float azimuth: Solar azimuth in degrees, clockwise from north
+    :return: The (column, row) offset of the step in pixels and its length in map units
+    """
+    east = math.sin(math.radians(azimuth))
+    north = math.cos(math.radians(azimuth))
+    length = 1 / max(abs(east) / abs(pixel_width), abs(north) / abs(pixel_height))
+    # Rows run southwards on north-up rasters
+    return east * length / abs(pixel_width), -north * length / abs(pixel_height), length
+
+def shadow_steps(height_range: float, altitude: float, step_length: float) -> int:
+    """Number of steps after which a ray towards the sun is above every possible blocker."""
+    if altitude <= 0:
+        return 0
+    return max(0, math.ceil(height_range / (math.tan(math.radians(altitude)) * step_length)))
+
+def shadow_length(height_range: float, altitude: float) -> float:
+    """Longest shadow (in map units) an object of `height_range` casts at the given solar altitude."""
+    if altitude <= 0:
+        return math.inf
+    return height_range / math.tan(math.radians(altitude))
+
+def cast_shadow(
+    dsm: np.ndarray,
+    valid: np.ndarray,
+    pixel_width: float,
+    pixel_height: float,
+    azimuth: float,
+    altitude: float,
+    fractional: bool = False,
+) -> np.ndarray:
+    """
+    Shadows cast on a DSM by the sun at the given position.
+
+    The DSM is swept towards the sun one step at a time: every step shifts the whole array and
+    keeps, per pixel, the highest surface along its ray minus the drop of the sun line over that
+    distance. A pixel is in shade when that maximum is above its own height.
+
+    :param np.ndarray dsm: Surface heights
+    :param np.ndarray valid: True where the DSM is valid, invalid pixels never cast shadow
+    :param float azimuth: Solar azimuth in degrees, clockwise from north
+    :param float altitude: Solar altitude in degrees
+    :param bool fractional: Return the lit fraction of every pixel instead of sun or shade. The shadow
+                            line drops `drop` over one pixel, so the part of the pixel below it follows
+                            from how far the line is above the pixel's height.
+    :return: uint8 shadow map: SUN (255) for sun, FULL_SHADE (1) for shade, partial shade in between
+             in fractional mode, NO_DATA (0) where the DSM is invalid
+    """
+    if altitude <= 0:
+        return np.where(valid, FULL_SHADE, NO_DATA).astype(np.uint8)
+
+    heights = np.where(valid, dsm, -np.inf).astype(np.float64)
+    height_range = float(np.ptp(dsm[valid])) if valid.any() else 0.0
+
+    d_col, d_row, step_length = sun_step(azimuth, pixel_width, pixel_height)
+    steps = shadow_steps(height_range, altitude, step_length)
+    drop = math.tan(math.radians(altitude)) * step_length
+
+    with np.errstate(invalid="ignore"):
+        excess = _sweep(heights, d_col, d_row, drop, steps) - heights
+        if fractional:
+            lit = 1 - np.clip(excess / drop + 0.5, 0, 1)
+            shade = np.rint(FULL_SHADE + lit * (SUN - FULL_SHADE))
+        else:
+            shade = np.where(excess > 0, FULL_SHADE, SUN)
+
+    return np.where(valid, shade, NO_DATA).astype(np.uint8)
+
+def _sweep(heights: np.ndarray, d_col: float, d_row: float, drop: float, steps: int) -> np.ndarray:
+    """Per pixel the highest surface along its ray towards the sun, minus the drop of the sun line."""
+    ysize, xsize = heights.shape
+    blockers = np.full(heights.shape, -np.inf)
+    for step in range(1, steps + 1):
+        col = int(round(step * d_col))
+        row = int(round(step * d_row))
+        if abs(col) >= xsize or abs(row) >= ysize:
+            break
+
+        # blockers[y, x] = max(blockers[y, x], heights[y + row, x + col] - step * drop)
+        target = (slice(max(0, -row), ysize - max(0, row)), slice(max(0, -col), xsize - max(0, col)))
+        source = (slice(max(0, row), ysize - max(0, -row)), slice(max(0, col), xsize - max(0, -col)))
+        np.maximum(blockers[target], heights[source] - step * drop, out=blockers[target])
+
+    return blockers
+
+class CastShadowStage(SourceStage):
+    """
+    One window of a cast shadow map. The window is read with a halo of the longest possible
+    shadow, so blockers outside the window are taken into account.
+    """
+    # Per pixel: the DSM (float64 + mask), the heights, the blockers, the excess and the output
+    bytes_per_pixel = 9 + 8 + 8 + 8 + 1
+
+    def __init__(
+        self,
+        inputs: dict[str, str | tuple[str, int]],
+        grid: RasterGrid,
+        azimuth: float,
+        altitude: float,
+        height_range: float,
+        fractional: bool = False,
+    ):
+        super().__init__(inputs, grid)
+        self.azimuth = azimuth
+        self.altitude = altitude
+        self.fractional = fractional
+
+        _, pixel_width, _, _, _, pixel_height = grid.geotransform
+        _, _, step_length = sun_step(azimuth, pixel_width, pixel_height)
+        # A shadow never reaches further than the raster itself
+        self.halo = min(shadow_steps(height_range, altitude, step_length), max(grid.xsize, grid.ysize)) + 1
+
+    def compute(self, window: Window) -> np.ndarray:
+        dataset, band = self.sources["A"]
+        outer = window.expand(self.halo, self.grid.xsize, self.grid.ysize)
+        dsm, valid = RasterCalculator().read_window(dataset, band, self.grid, *outer)
+
+        _, pixel_width, _, _, _, pixel_height = self.grid.geotransform
+        shade = cast_shadow(
+            dsm, valid, pixel_width, pixel_height, self.azimuth, self.altitude, self.fractional
+        )
+        return shade[window.inner(outer)]
+
+def cast_shadow_raster(
+    input_path: str,
+    output_path: str,
+    azimuth: float,
+    altitude: float,
+    fractional: bool = False,
+    band: int = 1,
+    memory_budget_mb: float = 256,
+    workers: int = 1,
+) -> str:
+    """
+    Writes the cast shadow map of a DSM raster, on the grid of the DSM.
+
+    :param str input_path: The DSM raster
+    :param str output_path: The shadow map (Byte, NoData 0)
+    :param float azimuth: Solar azimuth in degrees, clockwise from north
+    :param float altitude: Solar altitude in degrees
+    :param bool fractional: Write the lit fraction of every pixel instead of sun or shade
+    :return: The output path
+    """
+    calculator = RasterCalculator(memory_budget_mb, workers)
+    inputs = {"A": (input_path, band)}
+    sources = calculator.open_inputs(inputs)
+    dataset, _ = sources["A"]
+    grid = calculator.intersect_grid([dataset])
+
+    minimum, maximum = dataset.GetRasterBand(band).ComputeRasterMinMax(False)
+    stage = CastShadowStage(inputs, grid, azimuth, altitude, maximum - minimum, fractional)
+    return calculator.run(stage, sources, output_path, gdal.GDT_Byte, NO_DATA)
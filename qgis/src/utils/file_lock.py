@@ -0,0 +1,35 @@
+import fcntl
+import os
+import threading
+
+class FileLock:
+    """
+    A lock shared by the threads of this process and by other processes, through an flock on a lock file.
+    Use it as a context manager; it is not reentrant.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self) -> "FileLock":
+        self._thread_lock.acquire()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        except BaseException:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        finally:
+            self._thread_lock.release()
@@ -0,0 +1,90 @@
+import math
+from typing import NamedTuple
+import numpy as np
+from osgeo import gdal
+from src.utils.raster_blocks import Window, block_windows
+
+class CircleFootprint(NamedTuple):
+    x: float
+    y: float
+    radius: float
+    value: float
+
+def _circle_mask(footprint: CircleFootprint, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """The pixels (given by the map coordinates of their centres) that the circle covers."""
+    return (xs - footprint.x) ** 2 + (ys - footprint.y) ** 2 <= footprint.radius ** 2
+
+def _bounds_window(footprint: CircleFootprint, gt: tuple, xsize: int, ysize: int) -> Window | None:
+    """The pixels whose centres can fall inside the footprint, clamped to the raster."""
+    cols = sorted(((footprint.x - footprint.radius - gt[0]) / gt[1], (footprint.x + footprint.radius - gt[0]) / gt[1]))
+    rows = sorted(((footprint.y + footprint.radius - gt[3]) / gt[5], (footprint.y - footprint.radius - gt[3]) / gt[5]))
+    left = max(0, math.floor(cols[0]))
+    right = min(xsize, math.ceil(cols[1]))
+    top = max(0, math.floor(rows[0]))
+    bottom = min(ysize, math.ceil(rows[1]))
+    if right <= left or bottom <= top:
+        return None
+    return Window(left, top, right - left, bottom - top)
+
+def paint_footprints(
+    raster_path: str,
+    footprints: list[CircleFootprint],
+    band: int = 1,
+    memory_budget_mb: float = 256,
+) -> Window | None:
+    """
+    Paints the value of every footprint into the pixels whose centre it covers, in place, like
+    burning the buffered footprints as polygons. Where footprints overlap the later one wins.
+    Only the window around the footprints is read and written.
+
+    :param list[CircleFootprint] footprints: The footprints, in the order they are painted
+    :return: The window of the raster that was written, or None if no footprint overlapped it
+    """
+    dataset = gdal.Open(raster_path, gdal.GA_Update)
+    if dataset is None:
+        raise Exception(f"Could not open raster for painting: {raster_path}")
+    gt = dataset.GetGeoTransform()
+    if gt[2] != 0 or gt[4] != 0:
+        raise ValueError("Rotated rasters are not supported")
+
+    windows = [_bounds_window(fp, gt, dataset.RasterXSize, dataset.RasterYSize) for fp in footprints]
+    painted = [(fp, window) for fp, window in zip(footprints, windows) if window is not None]
+    if not painted:
+        return None
+
+    left = min(window.xoff for _, window in painted)
+    top = min(window.yoff for _, window in painted)
+    right = max(window.xoff + window.xsize for _, window in painted)
+    bottom = max(window.yoff + window.ysize for _, window in painted)
+    total = Window(left, top, right - left, bottom - top)
+
+    raster_band = dataset.GetRasterBand(band)
+    for part in block_windows(
+        total.xsize, total.ysize, raster_band.GetBlockSize(),
+        gdal.GetDataTypeSize(raster_band.DataType) // 8, memory_budget_mb,
+        origin=(total.xoff, total.yoff),
+    ):
+        part = Window(total.xoff + part.xoff, total.yoff + part.yoff, part.xsize, part.ysize)
+        values = None
+        for footprint, window in painted:
+            # The overlap of the footprint's window with this part
+            xoff, yoff = max(part.xoff, window.xoff), max(part.yoff, window.yoff)
+            xend = min(part.xoff + part.xsize, window.xoff + window.xsize)
+            yend = min(part.yoff + part.ysize, window.yoff + window.ysize)
+            if xend <= xoff or yend <= yoff:
+                continue
+
+            if values is None:
+                values = raster_band.ReadAsArray(part.xoff, part.yoff, part.xsize, part.ysize)
+            xs = gt[0] + (np.arange(xoff, xend) + 0.5) * gt[1]
+            ys = gt[3] + (np.arange(yoff, yend) + 0.5) * gt[5]
+            mask = _circle_mask(footprint, xs[np.newaxis, :], ys[:, np.newaxis])
+            overlap = Window(xoff, yoff, xend - xoff, yend - yoff)
+            values[overlap.inner(part)][mask] = footprint.value
+
+        if values is not None:
+            raster_band.WriteArray(values, part.xoff, part.yoff)
+
+    dataset.FlushCache()
+    dataset = None
+    return total
@@ -0,0 +1,112 @@
+import math
+import zlib
+from functools import lru_cache
+from typing import NamedTuple
+import numpy as np
+from osgeo import gdal
+from src.utils.raster_blocks import Window, block_windows
+
+# Number of different leaf patterns per (radius, density, jitter); a tree gets one by its position
+STAMP_VARIANTS = 64
+
+class Tree(NamedTuple):
+    x: float
+    y: float
+    radius: float
+    height: float
+
+@lru_cache(maxsize=1024)
+def leaf_offsets(radius: float, density: int, jitter: float, seed: int = 0, variant: int = 0) -> np.ndarray:
+    """
+    The leaf points of one tree relative to its centre: uniform over a disc of the radius, each moved
+    by a uniform jitter along both axes. The same arguments always give the same (read-only) stamp.
+
+    :return: Array of (density, 2) x and y offsets in map units
+    """
+    rng = np.random.default_rng([seed, variant])
+    distance = radius * np.sqrt(rng.random(density))
+    angle = rng.random(density) * 2 * math.pi
+    offsets = np.column_stack((np.cos(angle) * distance, np.sin(angle) * distance))
+    offsets += rng.uniform(-jitter, jitter, size=(density, 2))
+    offsets.flags.writeable = False
+    return offsets
+
+def tree_variant(x: float, y: float, seed: int = 0) -> int:
+    """The leaf pattern of a tree, fixed by its position (to the cm) so a tree looks the same in every run."""
+    key = f"{seed}:{round(x * 100)}:{round(y * 100)}".encode()
+    return zlib.crc32(key) % STAMP_VARIANTS
+
+def stamp_leaf_clouds(
+    raster_path: str,
+    trees: list[Tree],
+    density: int = 250,
+    jitter: float = 0.3,
+    seed: int = 0,
+    band: int = 1,
+    memory_budget_mb: float = 256,
+) -> int:
+    """
+    Writes the height of every tree into the pixels that its leaf points fall in, in place. Like
+    burning the leaf points as vector points: a pixel is only written when a point falls inside it,
+    and where trees overlap the later tree wins. Only the window around the trees is read and written.
+
+    :param list[Tree] trees: The trees, in the order they are stamped
+    :param int density: Number of leaf points per tree
+    :param float jitter: Maximum shift of a leaf point along each axis, in map units
+    :param int seed: Seed of the leaf patterns, the same seed gives the same raster
+    :return: The number of pixels that were written
+    """
+    if not trees:
+        return 0
+
+    dataset = gdal.Open(raster_path, gdal.GA_Update)
+    if dataset is None:
+        raise Exception(f"Could not open raster for stamping: {raster_path}")
+    gt = dataset.GetGeoTransform()
+    if gt[2] != 0 or gt[4] != 0:
+        raise ValueError("Rotated rasters are not supported")
+
+    xs, ys, heights = [], [], []
+    for tree in trees:
+        offsets = leaf_offsets(tree.radius, density, jitter, seed, tree_variant(tree.x, tree.y, seed))
+        xs.append(tree.x + offsets[:, 0])
+        ys.append(tree.y + offsets[:, 1])
+        heights.append(np.full(density, tree.height))
+
+    cols = np.floor((np.concatenate(xs) - gt[0]) / gt[1]).astype(np.int64)
+    rows = np.floor((np.concatenate(ys) - gt[3]) / gt[5]).astype(np.int64)
+    heights = np.concatenate(heights)
+
+    inside = (cols >= 0) & (cols < dataset.RasterXSize) & (rows >= 0) & (rows < dataset.RasterYSize)
+    cols, rows, heights = cols[inside], rows[inside], heights[inside]
+    if cols.size == 0:
+        return 0
+
+    # One value per pixel: the last one, like a later point burned over an earlier one
+    flat = rows * dataset.RasterXSize + cols
+    _, last = np.unique(flat[::-1], return_index=True)
+    keep = flat.size - 1 - last
+    cols, rows, heights = cols[keep], rows[keep], heights[keep]
+
+    raster_band = dataset.GetRasterBand(band)
+    window = Window(
+        int(cols.min()), int(rows.min()), int(cols.max() - cols.min()) + 1, int(rows.max() - rows.min()) + 1
+    )
+    for part in block_windows(
+        window.xsize, window.ysize, raster_band.GetBlockSize(),
+        gdal.GetDataTypeSize(raster_band.DataType) // 8, memory_budget_mb,
+        origin=(window.xoff, window.yoff),
+    ):
+        xoff, yoff = window.xoff + part.xoff, window.yoff + part.yoff
+        selected = (
+            (cols >= xoff) & (cols < xoff + part.xsize) & (rows >= yoff) & (rows < yoff + part.ysize)
+        )
+        if not selected.any():
+            continue
+        values = raster_band.ReadAsArray(xoff, yoff, part.xsize, part.ysize)
+        values[rows[selected] - yoff, cols[selected] - xoff] = heights[selected]
+        raster_band.WriteArray(values, xoff, yoff)
+
+    dataset.FlushCache()
+    dataset = None
+    return int(cols.size)
@@ -0,0 +1,153 @@
+import numpy as np
+from osgeo import gdal
+from src.utils import pet_formulas
+from src.utils.raster_calculator import RasterCalculator, RasterGrid, SourceStage, DEFAULT_NODATA
+from src.utils.raster_blocks import Window
+from src.utils.raster_fill import fill_nodata, fill_halo
+
+# Bands that follow the hourly PET bands
+SUMMARY_BANDS = ["max_pet", "hours_above_threshold"]
+
+class PetCubeStage(SourceStage):
+    """
+    One window of the PET cube. The hour independent inputs (UHI, wind speed, bowen ratio, SVF)
+    and the shadow stack are read once; per hour only the air temperature (through the UHI factor),
+    the terms that depend on it and the sun/shade blend are evaluated.
+    """
+    def __init__(
+        self,
+        inputs: dict[str, str | tuple[str, int]],
+        grid: RasterGrid,
+        no_data: float,
+        uhi_factors: list[float],
+        weather: dict,
+        shadow_threshold: float,
+        q_diff: float,
+        pet_threshold: float,
+        fill_distance: float,
+        fill_iterations: int,
+    ):
+        super().__init__(inputs, grid)
+        self.no_data = no_data
+        self.uhi_factors = uhi_factors
+        self.weather = weather
+        self.shadow_threshold = shadow_threshold
+        self.q_diff = q_diff
+        self.pet_threshold = pet_threshold
+        self.fill_distance = fill_distance
+        self.fill_iterations = fill_iterations
+        self.halo = fill_halo(fill_distance, fill_iterations) if fill_distance > 0 else 0
+
+        hours = len(uhi_factors)
+        self.bands = hours + len(SUMMARY_BANDS)
+        # Per pixel: four static inputs and the shadow maps (float64 + mask), the working arrays of one hour
+        # (t_a, t_w, partials, sun/shadow PET, fill copy) and the output bands
+        self.bytes_per_pixel = (4 + hours) * 9 + 8 * 8 + self.bands * 4
+
+    def compute(self, window: Window) -> np.ndarray:
+        outer = window.expand(self.halo, self.grid.xsize, self.grid.ysize)
+        inner = window.inner(outer)
+        calculator = RasterCalculator()
+
+        arrays = {}
+        valid = np.ones((outer.ysize, outer.xsize), dtype=bool)
+        for name, (dataset, band) in self.sources.items():
+            values, mask = calculator.read_window(dataset, band, self.grid, *outer)
+            arrays[name] = values
+            valid &= mask
+
+        weather = self.weather
+        cube = np.empty((self.bands, window.ysize, window.xsize), dtype=np.float32)
+        with np.errstate(all="ignore"):
+            for hour, uhi_factor in enumerate(self.uhi_factors):
+                t_a = pet_formulas.air_temperature(arrays["uhi"], uhi_factor, weather["base_temperature"])
+                t_w = pet_formulas.wet_bulb_temperature(t_a, weather["r_h"])
+                sun_pet = pet_formulas.pet_sun_total(
+                    pet_formulas.pet_sun_partial(t_a, t_w, arrays["wind"], weather["phi"], weather["q_gl"]),
+                    arrays["bowen"],
+                    arrays["svf"],
+                ).astype(np.float32)
+                shadow_pet = pet_formulas.pet_shadow_total(
+                    pet_formulas.pet_shadow_partial(t_a, t_w, arrays["wind"]), arrays["svf"], t_a, self.q_diff
+                ).astype(np.float32)
+                pet = pet_formulas.blend_pet(
+                    arrays[f"shadow_{hour}"], sun_pet, shadow_pet, self.shadow_threshold
+                ).astype(np.float32)
+
+                pet_valid = valid
+                if self.fill_distance > 0:
+                    pet, pet_valid = fill_nodata(pet, valid, self.no_data, self.fill_distance, self.fill_iterations)
+                cube[hour] = np.where(pet_valid[inner], pet[inner], np.nan)
+
+        hourly = cube[:len(self.uhi_factors)]
+        any_valid = ~np.all(np.isnan(hourly), axis=0)
+        with np.errstate(all="ignore"):
+            cube[-2] = np.where(any_valid, np.nanmax(np.where(any_valid, hourly, 0), axis=0), np.nan)
+            cube[-1] = np.where(any_valid, np.sum(hourly > self.pet_threshold, axis=0), np.nan)
+
+        return np.where(np.isnan(cube), self.no_data, cube).astype(np.float32)
+
+class PetCube:
+    """
+    PET for a series of moments (for example every hour of a day) as the bands of one raster,
+    followed by the maximum PET and the number of moments above a PET threshold.
+    """
+    def __init__(self, memory_budget_mb: float = 256, workers: int = 1):
+        self.raster_calculator = RasterCalculator(memory_budget_mb, workers)
+
+    def run(
+        self,
+        uhi_raster: str | tuple[str, int],
+        wind_raster: str | tuple[str, int],
+        bowen_raster: str,
+        svf_raster: str,
+        shadow_stack: str,
+        uhi_factors: list[float],
+        weather: dict,
+        output_path: str,
+        labels: list[str] | None = None,
+        shadow_threshold: float = 127,
+        q_diff: float = 0.2,
+        pet_threshold: float = 35,
+        fill_distance: float = 10,
+        fill_iterations: int = 0,
+    ) -> str:
+        """
+        :param str|tuple uhi_raster: The (hour independent) UHI per zone, a path or (path, band)
+        :param str|tuple wind_raster: The scaled wind speed at 1.2 m per zone, a path or (path, band)
+        :param str bowen_raster: The bowen ratio raster
+        :param str svf_raster: The (filled) sky-view factor raster
+        :param str shadow_stack: The shadow stack, band i is the shadow map of moment i
+        :param list uhi_factors: The UHI factor per moment
+        :param dict weather: base_temperature, r_h, phi and q_gl
+        :param str output_path: Path of the PET cube
+        :param list labels: Description per moment band, for example its timestamp
+        :param float pet_threshold: PET (in °C) above which a moment counts in the last band
+        :param float fill_distance: Maximum distance (in pixels) used to fill NoData, 0 disables the fill
+        :return: The output path
+        """
+        # The UHI raster comes first so its pixel grid is used, like the partial PETs in the single moment pipeline
+        inputs = {"uhi": uhi_raster, "wind": wind_raster, "bowen": bowen_raster, "svf": svf_raster}
+        inputs.update({f"shadow_{hour}": (shadow_stack, hour + 1) for hour in range(len(uhi_factors))})
+
+        sources = self.raster_calculator.open_inputs(inputs)
+        if sources["shadow_0"][0].RasterCount < len(uhi_factors):
+            raise ValueError(f"The shadow stack has fewer bands than the {len(uhi_factors)} moments")
+
+        grid = self.raster_calculator.intersect_grid([dataset for dataset, _ in sources.values()])
+        no_data = DEFAULT_NODATA[gdal.GDT_Float32]
+
+        stage = PetCubeStage(
+            inputs, grid, no_data, list(uhi_factors), weather, shadow_threshold, q_diff,
+            pet_threshold, fill_distance, fill_iterations,
+        )
+        self.raster_calculator.run(stage, sources, output_path, gdal.GDT_Float32, no_data)
+
+        output = gdal.Open(output_path, gdal.GA_Update)
+        labels = labels or [str(index) for index in range(len(uhi_factors))]
+        for index, label in enumerate(labels + SUMMARY_BANDS, start=1):
+            output.GetRasterBand(index).SetDescription(label)
+        output.SetMetadataItem("PET_THRESHOLD", str(pet_threshold))
+        output = None
+
+        return output_path
@@ -0,0 +1,123 @@
+import numpy as np
+from osgeo import gdal
+from src.utils import pet_formulas
+from src.utils.raster_calculator import RasterCalculator, RasterGrid, SourceStage, DEFAULT_NODATA
+from src.utils.raster_blocks import Window
+from src.utils.raster_fill import fill_nodata, fill_halo
+
+class PetKernelStage(SourceStage):
+    """
+    One window of the fused total PET: evaluated on the window plus the fill halo,
+    filled, and cropped back to the window.
+    """
+    # Per pixel: six inputs (float64 + mask), sun/shadow/total PET, the fill copy and the masks
+    bytes_per_pixel = 6 * 9 + 3 * 4 + 8 + 4
+
+    def __init__(
+        self,
+        inputs: dict[str, str],
+        grid: RasterGrid,
+        no_data: float,
+        shadow_threshold: float,
+        q_diff: float,
+        fill_distance: float,
+        fill_iterations: int,
+    ):
+        super().__init__(inputs, grid)
+        self.no_data = no_data
+        self.shadow_threshold = shadow_threshold
+        self.q_diff = q_diff
+        self.fill_distance = fill_distance
+        self.fill_iterations = fill_iterations
+        self.halo = fill_halo(fill_distance, fill_iterations) if fill_distance > 0 else 0
+
+    def compute(self, window: Window) -> np.ndarray:
+        outer = window.expand(self.halo, self.grid.xsize, self.grid.ysize)
+
+        values, valid = PetKernel.evaluate(
+            self.sources, self.grid, *outer, self.shadow_threshold, self.q_diff
+        )
+        if self.fill_distance > 0:
+            values, valid = fill_nodata(values, valid, self.no_data, self.fill_distance, self.fill_iterations)
+
+        inner = window.inner(outer)
+        return np.where(valid[inner], values[inner], self.no_data).astype(np.float32)
+
+class PetKernel:
+    """
+    Fused total PET kernel: sun PET, shadow PET, the shadow threshold blend and
+    the NoData fill are evaluated per block, only the final raster is written.
+    """
+    INPUTS = ["sun_partial", "bowen", "svf", "shadow_partial", "t_a", "shadow_map"]
+
+    def __init__(self, memory_budget_mb: float = 256, workers: int = 1):
+        self.raster_calculator = RasterCalculator(memory_budget_mb, workers)
+
+    def run(
+        self,
+        inputs: dict[str, str],
+        output_path: str,
+        shadow_threshold: float = 127,
+        q_diff: float = 0.2,
+        fill_distance: float = 10,
+        fill_iterations: int = 0,
+    ) -> str:
+        """
+        :param dict inputs: Raster paths for 'sun_partial', 'bowen', 'svf', 'shadow_partial', 't_a' and 'shadow_map'
+        :param str output_path: Path of the final (filled) PET raster
+        :param float shadow_threshold: Shadow map values above this threshold are sun, the rest shade
+        :param float q_diff: The "diffuse straling" from the standard
+        :param float fill_distance: Maximum distance (in pixels) used to fill NoData, 0 disables the fill
+        :param int fill_iterations: Number of smoothing iterations of the fill
+        :return: The output path
+        """
+        missing = [name for name in self.INPUTS if name not in inputs]
+        if missing:
+            raise ValueError(f"Missing PET kernel inputs: {', '.join(missing)}")
+
+        # The sun partial PET comes first so its pixel grid is used, like the sun PET step does
+        ordered_inputs = {name: inputs[name] for name in self.INPUTS}
+        sources = self.raster_calculator.open_inputs(ordered_inputs)
+        grid = self.raster_calculator.intersect_grid([dataset for dataset, _ in sources.values()])
+        no_data = DEFAULT_NODATA[gdal.GDT_Float32]
+
+        stage = PetKernelStage(
+            ordered_inputs, grid, no_data, shadow_threshold, q_diff, fill_distance, fill_iterations
+        )
+        return self.raster_calculator.run(stage, sources, output_path, gdal.GDT_Float32, no_data)
+
+    @staticmethod
+    def evaluate(
+        sources: dict[str, tuple[gdal.Dataset, int]],
+        grid: RasterGrid,
+        xoff: int,
+        yoff: int,
+        xsize: int,
+        ysize: int,
+        shadow_threshold: float,
+        q_diff: float,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluates the (unfilled) total PET on one window of the grid.
+
+        :return: The PET values and a mask that is True where all inputs are valid
+        """
+        calculator = RasterCalculator()
+        arrays = {}
+        valid = np.ones((ysize, xsize), dtype=bool)
+        for name, (dataset, band) in sources.items():
+            values, mask = calculator.read_window(dataset, band, grid, xoff, yoff, xsize, ysize)
+            arrays[name] = values
+            valid &= mask
+
+        with np.errstate(all="ignore"):
+            # Round the intermediates to Float32 like the sun/shadow PET rasters they replace
+            sun_pet = pet_formulas.pet_sun_total(
+                arrays["sun_partial"], arrays["bowen"], arrays["svf"]
+            ).astype(np.float32)
+            shadow_pet = pet_formulas.pet_shadow_total(
+                arrays["shadow_partial"], arrays["svf"], arrays["t_a"], q_diff
+            ).astype(np.float32)
+            pet = pet_formulas.blend_pet(arrays["shadow_map"], sun_pet, shadow_pet, shadow_threshold)
+
+        return pet.astype(np.float32), valid
@@ -0,0 +1,81 @@
+import math
+from typing import Iterator, NamedTuple
+
+# Creation options of rasters written block by block: tiles line up with the windows that are written
+TILED_GTIFF_OPTIONS = ["TILED=YES", "BLOCKXSIZE=256", "BLOCKYSIZE=256", "BIGTIFF=IF_SAFER"]
+
+class Window(NamedTuple):
+    xoff: int
+    yoff: int
+    xsize: int
+    ysize: int
+
+    def expand(self, halo: int, xsize: int, ysize: int) -> "Window":
+        """Grows the window by `halo` pixels on every side, clamped to a raster of xsize by ysize."""
+        left = max(0, self.xoff - halo)
+        top = max(0, self.yoff - halo)
+        right = min(xsize, self.xoff + self.xsize + halo)
+        bottom = min(ysize, self.yoff + self.ysize + halo)
+        return Window(left, top, right - left, bottom - top)
+
+    def inner(self, outer: "Window") -> tuple[slice, slice]:
+        """Row and column slices that select this window out of an array read for `outer`."""
+        row = self.yoff - outer.yoff
+        col = self.xoff - outer.xoff
+        return slice(row, row + self.ysize), slice(col, col + self.xsize)
+
+def block_windows(
+    xsize: int,
+    ysize: int,
+    block_size: tuple[int, int],
+    bytes_per_pixel: int,
+    memory_budget_mb: float,
+    halo: int = 0,
+    origin: tuple[int, int] = (0, 0),
+) -> Iterator[Window]:
+    """
+    Walks a raster of xsize by ysize in windows made of whole native blocks, as large as
+    the memory budget allows. Windows prefer to span the full width so reads stay sequential.
+
+    :param int xsize: Width of the raster (grid) that is walked
+    :param int ysize: Height of the raster (grid) that is walked
+    :param tuple block_size: The native (x, y) block size of the source raster
+    :param int bytes_per_pixel: Memory needed per pixel of a window (all inputs, intermediates and output)
+    :param float memory_budget_mb: Memory a single window may use
+    :param int halo: Extra pixels read around every window, counted in the budget
+    :param tuple origin: Pixel offset of the grid in the source raster, so windows start on block boundaries
+    """
+    block_x = max(1, min(block_size[0], xsize))
+    block_y = max(1, min(block_size[1], ysize))
+    max_pixels = max(1, int(memory_budget_mb * 1024 * 1024 / max(1, bytes_per_pixel)))
+
+    blocks_x = math.ceil(xsize / block_x)
+    blocks_y = math.ceil(ysize / block_y)
+
+    def fits(nx: int, ny: int) -> bool:
+        return (nx * block_x + 2 * halo) * (ny * block_y + 2 * halo) <= max_pixels
+
+    # Start with full-width windows, then fall back to fewer blocks per window
+    per_x = blocks_x
+    while per_x > 1 and not fits(per_x, 1):
+        per_x = max(1, per_x // 2)
+    per_y = 1
+    while per_y < blocks_y and fits(per_x, per_y + 1):
+        per_y += 1
+
+    window_x = per_x * block_x
+    window_y = per_y * block_y
+
+    # The first window is shortened so the following ones line up with the native blocks
+    shift_x = origin[0] % block_x
+    shift_y = origin[1] % block_y
+
+    yoff = 0
+    while yoff < ysize:
+        height = min(window_y - (shift_y if yoff == 0 else 0), ysize - yoff)
+        xoff = 0
+        while xoff < xsize:
+            width = min(window_x - (shift_x if xoff == 0 else 0), xsize - xoff)
+            yield Window(xoff, yoff, width, height)
+            xoff += width
+        yoff += height
@@ -0,0 +1,356 @@
+import math
+from functools import lru_cache
+from typing import NamedTuple
+import numpy as np
+from osgeo import gdal, osr
+from src.utils.raster_blocks import Window, block_windows, TILED_GTIFF_OPTIONS
+from src.utils.raster_parallel import WindowStage, OUTPUT_BLOCK_SIZE, run_stage
+
+# Same defaults gdal_calc uses when no NoDataValue is given
+DEFAULT_NODATA = {
+    gdal.GDT_Byte: 0,
+    gdal.GDT_UInt16: 65535,
+    gdal.GDT_Int16: -32768,
+    gdal.GDT_UInt32: 4294967293,
+    gdal.GDT_Int32: -2147483647,
+    gdal.GDT_Float32: 3.402823466e+38,
+    gdal.GDT_Float64: 1.7976931348623158e+308,
+}
+
+# Everything numpy exposes is usable inside a formula, just like in gdal_calc
+_FORMULA_GLOBALS = {
+    "__builtins__": {},
+    "np": np,
+    "numpy": np,
+    **{name: getattr(np, name) for name in dir(np) if not name.startswith("_")},
+}
+
+class RasterGrid(NamedTuple):
+    geotransform: tuple
+    xsize: int
+    ysize: int
+    projection: str
+
+def grid_from_extent(extent: tuple[float, float, float, float], resolution: float, projection: str) -> RasterGrid:
+    """
+    A north-up grid with square pixels over the extent, anchored at its upper left corner. The size is
+    rounded like gdal_rasterize -te -tr (gdal:rasterize in georeferenced units) does.
+
+    :param tuple extent: (xmin, xmax, ymin, ymax)
+    :param float resolution: The pixel size in map units
+    :param str projection: The CRS as WKT
+    """
+    xmin, xmax, ymin, ymax = extent
+    if resolution <= 0:
+        raise ValueError("The resolution of a grid must be positive")
+    xsize = max(1, int((xmax - xmin) / resolution + 0.5))
+    ysize = max(1, int((ymax - ymin) / resolution + 0.5))
+    return RasterGrid((xmin, resolution, 0.0, ymax, 0.0, -resolution), xsize, ysize, projection)
+
+def crop_grid(grid: RasterGrid, extent: tuple[float, float, float, float]) -> RasterGrid:
+    """
+    The part of a north-up grid inside the extent, with the extent rounded to the nearest pixel edges
+    like the projwin of gdal_translate (gdal:cliprasterbyextent), so the pixels stay where they are.
+
+    :param tuple extent: (xmin, xmax, ymin, ymax)
+    """
+    gt = grid.geotransform
+    xmin, xmax, ymin, ymax = extent
+    col_start = max(0, round((xmin - gt[0]) / gt[1]))
+    col_end = min(grid.xsize, round((xmax - gt[0]) / gt[1]))
+    row_start = max(0, round((ymax - gt[3]) / gt[5]))
+    row_end = min(grid.ysize, round((ymin - gt[3]) / gt[5]))
+    if col_end <= col_start or row_end <= row_start:
+        raise ValueError("The extent does not overlap the grid")
+
+    return RasterGrid(
+        (gt[0] + col_start * gt[1], gt[1], 0.0, gt[3] + row_start * gt[5], 0.0, gt[5]),
+        col_end - col_start,
+        row_end - row_start,
+        grid.projection,
+    )
+
+@lru_cache(maxsize=64)
+def compile_formula(formula: str):
+    """Compiles a gdal_calc style formula (e.g. 'A + 0.546 * B') once per distinct formula."""
+    return compile(formula, "<formula>", "eval")
+
+class SourceStage(WindowStage):
+    """
+    A window stage that reads its inputs through the RasterCalculator. The input datasets
+    are opened on first use in whichever process computes the window.
+    """
+    def __init__(self, inputs: dict[str, str | tuple[str, int]], grid: RasterGrid):
+        self.inputs = inputs
+        self.grid = grid
+        self._sources = None
+
+    @property
+    def sources(self) -> dict[str, tuple[gdal.Dataset, int]]:
+        if self._sources is None:
+            self._sources = RasterCalculator().open_inputs(self.inputs)
+        return self._sources
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_sources"] = None
+        return state
+
+class FormulaStage(SourceStage):
+    def __init__(self, inputs: dict[str, str | tuple[str, int]], grid: RasterGrid, formula: str, no_data: float):
+        super().__init__(inputs, grid)
+        self.formula = formula
+        self.no_data = no_data
+        # Per pixel: every input (float64 + mask), the validity mask and the float64 result
+        self.bytes_per_pixel = 9 * len(inputs) + 17
+
+    def compute(self, window: Window) -> np.ndarray:
+        return RasterCalculator().evaluate(self.formula, self.sources, self.grid, *window, self.no_data)
+
+class RasterCalculator:
+    """
+    In-process replacement for gdal:rastercalculator.
+
+    Inputs are read as NumPy arrays on a common grid, the formula is evaluated
+    directly and every pixel where at least one input is NoData becomes NoData
+    in the output (the gdal_calc behaviour). Rasters are processed window by
+    window, sized by the memory budget, so memory use does not grow with the extent.
+    With more than one worker the windows are spread over a process pool.
+    """
+    def __init__(self, memory_budget_mb: float = 256, workers: int = 1):
+        self.memory_budget_mb = memory_budget_mb
+        self.workers = workers
+
+    def calculate(
+        self,
+        inputs: dict[str, str | tuple[str, int]],
+        formula: str,
+        output_path: str,
+        projwin: tuple[float, float, float, float] | None = None,
+        no_data: float | None = None,
+        data_type: int = gdal.GDT_Float32,
+    ) -> str:
+        """
+        Evaluates the formula over the intersection of all inputs (EXTENT_OPT 0).
+
+        :param dict inputs: Formula variable -> raster path or (raster path, band)
+        :param str formula: A numpy expression over the input variables (e.g. 'A + 0.546 * B')
+        :param str output_path: Path of the output GeoTIFF
+        :param tuple projwin: Optional (xmin, xmax, ymin, ymax) the output is additionally clipped to
+        :param float no_data: NoData value of the output, defaults to the gdal_calc default of the data type
+        :param int data_type: GDAL data type of the output (default Float32)
+        :return: The output path
+        """
+        sources = self.open_inputs(inputs)
+        grid = self.intersect_grid([dataset for dataset, _ in sources.values()], projwin)
+        no_data = DEFAULT_NODATA[data_type] if no_data is None else no_data
+
+        stage = FormulaStage(inputs, grid, formula, no_data)
+        return self.run(stage, sources, output_path, data_type, no_data)
+
+    def run(
+        self,
+        stage: WindowStage,
+        sources: dict[str, tuple[gdal.Dataset, int]],
+        output_path: str,
+        data_type: int,
+        no_data: float | None,
+    ) -> str:
+        """
+        Creates the (tiled) output raster on the grid of the stage and fills it window by window.
+        """
+        options = TILED_GTIFF_OPTIONS + (["INTERLEAVE=BAND"] if stage.bands > 1 else [])
+        output = self.create_output(output_path, stage.grid, data_type, no_data, stage.bands, options)
+        output = None
+
+        windows = list(self.windows(sources, stage.grid, stage.bytes_per_pixel, halo=stage.halo))
+        run_stage(stage, output_path, windows, self.workers)
+
+        return output_path
+
+    def windows(
+        self,
+        sources: dict[str, tuple[gdal.Dataset, int]],
+        grid: RasterGrid,
+        bytes_per_pixel: int,
+        halo: int = 0,
+    ):
+        """
+        Windows over the grid, sized by the memory budget. Serial runs align them with the native
+        blocks of the first source, parallel runs with the blocks of the output.
+        """
+        if self.workers > 1:
+            return block_windows(
+                grid.xsize, grid.ysize, OUTPUT_BLOCK_SIZE, bytes_per_pixel, self.memory_budget_mb, halo=halo
+            )
+
+        dataset, band = next(iter(sources.values()))
+        gt = dataset.GetGeoTransform()
+        origin = (
+            round((grid.geotransform[0] - gt[0]) / gt[1]),
+            round((grid.geotransform[3] - gt[3]) / gt[5]),
+        )
+        return block_windows(
+            grid.xsize,
+            grid.ysize,
+            tuple(dataset.GetRasterBand(band).GetBlockSize()),
+            bytes_per_pixel,
+            self.memory_budget_mb,
+            halo=halo,
+            origin=origin,
+        )
+
+    def evaluate(
+        self,
+        formula: str,
+        sources: dict[str, tuple[gdal.Dataset, int]],
+        grid: RasterGrid,
+        xoff: int,
+        yoff: int,
+        xsize: int,
+        ysize: int,
+        no_data: float,
+    ) -> np.ndarray:
+        """
+        Evaluates the formula on one window of the grid and returns the result with NoData applied.
+        """
+        variables = {}
+        valid = np.ones((ysize, xsize), dtype=bool)
+        for name, (dataset, band) in sources.items():
+            values, mask = self.read_window(dataset, band, grid, xoff, yoff, xsize, ysize)
+            variables[name] = values
+            valid &= mask
+
+        with np.errstate(all="ignore"):
+            result = eval(compile_formula(formula), _FORMULA_GLOBALS, variables)
+
+        result = np.broadcast_to(np.asarray(result, dtype=np.float64), (ysize, xsize))
+        return np.where(valid, result, no_data)
+
+    def open_inputs(self, inputs: dict[str, str | tuple[str, int]]) -> dict[str, tuple[gdal.Dataset, int]]:
+        sources = {}
+        for name, source in inputs.items():
+            path, band = source if isinstance(source, tuple) else (source, 1)
+            dataset = gdal.Open(path, gdal.GA_ReadOnly)
+            if dataset is None:
+                raise Exception(f"Raster layer is invalid: {path}")
+            sources[name] = (dataset, band)
+        return sources
+
+    def intersect_grid(
+        self,
+        datasets: list[gdal.Dataset],
+        projwin: tuple[float, float, float, float] | None = None,
+    ) -> RasterGrid:
+        """
+        Returns the grid of the first dataset, reduced to the intersection of all dataset extents
+        (and the projwin, if given).
+        """
+        reference = datasets[0]
+        gt = reference.GetGeoTransform()
+        if gt[2] != 0 or gt[4] != 0:
+            raise ValueError("Rotated rasters are not supported")
+
+        reference_srs = osr.SpatialReference(wkt=reference.GetProjection())
+        xmin, xmax, ymin, ymax = self.dataset_extent(reference)
+        for dataset in datasets[1:]:
+            if not reference_srs.IsSame(osr.SpatialReference(wkt=dataset.GetProjection())):
+                raise ValueError("All rasters in a calculation must share the same CRS")
+            d_xmin, d_xmax, d_ymin, d_ymax = self.dataset_extent(dataset)
+            xmin, xmax = max(xmin, d_xmin), min(xmax, d_xmax)
+            ymin, ymax = max(ymin, d_ymin), min(ymax, d_ymax)
+
+        if projwin is not None:
+            xmin, xmax = max(xmin, projwin[0]), min(xmax, projwin[1])
+            ymin, ymax = max(ymin, projwin[2]), min(ymax, projwin[3])
+
+        # Snap the intersection onto the pixel grid of the first raster
+        eps = 1e-6
+        col_start = math.ceil((xmin - gt[0]) / gt[1] - eps)
+        col_end = math.floor((xmax - gt[0]) / gt[1] + eps)
+        row_start = math.ceil((ymax - gt[3]) / gt[5] - eps)
+        row_end = math.floor((ymin - gt[3]) / gt[5] + eps)
+
+        if col_end <= col_start or row_end <= row_start:
+            raise ValueError("The input rasters do not overlap")
+
+        return RasterGrid(
+            (gt[0] + col_start * gt[1], gt[1], 0.0, gt[3] + row_start * gt[5], 0.0, gt[5]),
+            col_end - col_start,
+            row_end - row_start,
+            reference.GetProjection(),
+        )
+
+    def dataset_extent(self, dataset: gdal.Dataset) -> tuple[float, float, float, float]:
+        gt = dataset.GetGeoTransform()
+        x0, x1 = gt[0], gt[0] + dataset.RasterXSize * gt[1]
+        y0, y1 = gt[3], gt[3] + dataset.RasterYSize * gt[5]
+        return min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1)
+
+    def read_window(
+        self,
+        dataset: gdal.Dataset,
+        band: int,
+        grid: RasterGrid,
+        xoff: int,
+        yoff: int,
+        xsize: int,
+        ysize: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Reads a window of the grid from a dataset using nearest neighbour sampling.
+        The dataset may have another resolution or origin than the grid.
+
+        :return: The values (float32 for Float32 rasters, float64 otherwise) and a mask that is True where the value is valid
+        """
+        gt = dataset.GetGeoTransform()
+        grid_gt = grid.geotransform
+
+        centres_x = grid_gt[0] + (xoff + np.arange(xsize) + 0.5) * grid_gt[1]
+        centres_y = grid_gt[3] + (yoff + np.arange(ysize) + 0.5) * grid_gt[5]
+        cols = np.floor((centres_x - gt[0]) / gt[1]).astype(np.int64)
+        rows = np.floor((centres_y - gt[3]) / gt[5]).astype(np.int64)
+        valid_cols = (cols >= 0) & (cols < dataset.RasterXSize)
+        valid_rows = (rows >= 0) & (rows < dataset.RasterYSize)
+
+        raster_band = dataset.GetRasterBand(band)
+        dtype = gdal.GetDataTypeName(raster_band.DataType)
+        values = np.zeros((ysize, xsize), dtype=np.float32 if dtype == "Float32" else np.float64)
+        mask = np.zeros((ysize, xsize), dtype=bool)
+        if not valid_cols.any() or not valid_rows.any():
+            return values, mask
+
+        col_min, col_max = int(cols[valid_cols].min()), int(cols[valid_cols].max())
+        row_min, row_max = int(rows[valid_rows].min()), int(rows[valid_rows].max())
+        data = raster_band.ReadAsArray(col_min, row_min, col_max - col_min + 1, row_max - row_min + 1)
+
+        window = np.ix_(valid_rows, valid_cols)
+        values[window] = data[np.ix_(rows[valid_rows] - row_min, cols[valid_cols] - col_min)]
+        mask[window] = True
+
+        no_data = raster_band.GetNoDataValue()
+        if no_data is not None:
+            mask &= ~np.isnan(values) if math.isnan(no_data) else values != no_data
+
+        return values, mask
+
+    def create_output(
+        self,
+        output_path: str,
+        grid: RasterGrid,
+        data_type: int,
+        no_data: float | None,
+        bands: int = 1,
+        options: list[str] | None = None,
+    ) -> gdal.Dataset:
+        driver = gdal.GetDriverByName("GTiff")
+        output = driver.Create(output_path, grid.xsize, grid.ysize, bands, data_type, options or [])
+        if output is None:
+            raise Exception(f"Could not create output raster: {output_path}")
+
+        output.SetGeoTransform(grid.geotransform)
+        output.SetProjection(grid.projection)
+        if no_data is not None:
+            for band in range(1, bands + 1):
+                output.GetRasterBand(band).SetNoDataValue(no_data)
+        return output
@@ -0,0 +1,92 @@
+import math
+import numpy as np
+from osgeo import gdal, gdal_array
+from src.utils.raster_calculator import RasterCalculator, RasterGrid, SourceStage
+from src.utils.raster_blocks import Window
+
+def fill_halo(distance: float, iterations: int) -> int:
+    """
+    Pixels a window needs around it so filling it gives the same result as filling the whole raster:
+    the search distance plus one pixel per 3x3 smoothing iteration.
+    """
+    return math.ceil(distance) + iterations + 1
+
+def fill_nodata(
+    values: np.ndarray,
+    valid: np.ndarray,
+    no_data: float,
+    distance: float = 10,
+    iterations: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    In-memory equivalent of gdal:fillnodata for one window.
+    The window should contain a halo of fill_halo(distance, iterations) pixels around the part that is kept.
+
+    :param np.ndarray values: The values of the window
+    :param np.ndarray valid: True where the values are valid
+    :param float no_data: The NoData value used while filling
+    :param float distance: Maximum distance (in pixels) to search for values
+    :param int iterations: Number of smoothing iterations
+    :return: The filled values and the new validity mask
+    """
+    ysize, xsize = values.shape
+    data_type = gdal_array.NumericTypeCodeToGDALTypeCode(values.dtype)
+    dataset = gdal.GetDriverByName("MEM").Create("", xsize, ysize, 1, data_type)
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(no_data)
+    band.WriteArray(np.where(valid, values, no_data).astype(values.dtype))
+
+    gdal.FillNodata(targetBand=band, maskBand=None, maxSearchDist=distance, smoothingIterations=iterations)
+
+    filled = band.ReadAsArray()
+    if math.isnan(no_data):
+        return filled, ~np.isnan(filled)
+    return filled, filled != values.dtype.type(no_data)
+
+class FillStage(SourceStage):
+    # Per pixel: the window (float64 + mask), the MEM copy and the filled result
+    bytes_per_pixel = 4 * 8 + 2
+
+    def __init__(self, inputs: dict, grid: RasterGrid, no_data: float | None, distance: float, iterations: int):
+        super().__init__(inputs, grid)
+        self.no_data = no_data
+        self.distance = distance
+        self.iterations = iterations
+        self.halo = fill_halo(distance, iterations)
+
+    def compute(self, window: Window) -> np.ndarray:
+        dataset, band = self.sources["A"]
+        outer = window.expand(self.halo, self.grid.xsize, self.grid.ysize)
+        values, valid = RasterCalculator().read_window(dataset, band, self.grid, *outer)
+
+        if self.no_data is not None:
+            values, valid = fill_nodata(values, valid, self.no_data, self.distance, self.iterations)
+
+        return values[window.inner(outer)]
+
+def fill_nodata_raster(
+    input_path: str,
+    output_path: str,
+    band: int = 1,
+    distance: float = 10,
+    iterations: int = 0,
+    memory_budget_mb: float = 256,
+    workers: int = 1,
+) -> str:
+    """
+    Windowed equivalent of gdal:fillnodata: every window is read with a halo,
+    filled in memory and only its interior is written.
+
+    :return: The output path
+    """
+    calculator = RasterCalculator(memory_budget_mb, workers)
+    inputs = {"A": (input_path, band)}
+    sources = calculator.open_inputs(inputs)
+    dataset, _ = sources["A"]
+    grid = calculator.intersect_grid([dataset])
+
+    input_band = dataset.GetRasterBand(band)
+    no_data = input_band.GetNoDataValue()
+
+    stage = FillStage(inputs, grid, no_data, distance, iterations)
+    return calculator.run(stage, sources, output_path, input_band.DataType, no_data)
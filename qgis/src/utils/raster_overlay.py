@@ -0,0 +1,68 @@
+import os
+import xml.etree.ElementTree as ElementTree
+from osgeo import gdal
+from src.utils.raster_blocks import TILED_GTIFF_OPTIONS
+from src.utils.raster_patch import Bounds, crop_raster
+
+# Overlay tiles are small and written once, so they are compressed
+TILE_GTIFF_OPTIONS = TILED_GTIFF_OPTIONS + ["COMPRESS=DEFLATE"]
+
+def write_tile(input_path: str, bounds: Bounds, tile_path: str) -> str:
+    """
+    Copies the pixels of a raster that touch the bounds to a (compressed) overlay tile, on the same pixel grid.
+    """
+    return crop_raster(input_path, bounds, tile_path, creation_options=TILE_GTIFF_OPTIONS)
+
+def write_overlay(output_path: str, base_path: str, tiles: list[str]) -> str:
+    """
+    Writes a VRT that reads as the base raster with the tiles on top of it: a copy-on-write raster that
+    shares the (read-only) base and only stores the modified tiles. Later tiles win where tiles overlap.
+    Every pixel of a tile is written, NoData included, like patching the base in place.
+
+    The tiles must lie on the pixel grid of the base raster; the VRT has the extent and grid of the base.
+    Sources are referenced relative to the VRT, so it stays readable where the data folder is mounted
+    at another path (like in the QGIS server container).
+
+    :param str output_path: The path of the VRT
+    :return: The output path
+    """
+    base = gdal.Open(base_path)
+    if base is None:
+        raise Exception(f"Could not open raster: {base_path}")
+    gt = base.GetGeoTransform()
+    bounds = (
+        min(gt[0], gt[0] + base.RasterXSize * gt[1]),
+        min(gt[3], gt[3] + base.RasterYSize * gt[5]),
+        max(gt[0], gt[0] + base.RasterXSize * gt[1]),
+        max(gt[3], gt[3] + base.RasterYSize * gt[5]),
+    )
+    no_data = base.GetRasterBand(1).GetNoDataValue()
+    base = None
+
+    options = gdal.BuildVRTOptions(
+        outputBounds=bounds,
+        resolution="user",
+        xRes=abs(gt[1]),
+        yRes=abs(gt[5]),
+        # Sources are opaque: a NoData pixel in a tile replaces the base pixel instead of showing it
+        srcNodata="None",
+        VRTNodata="None" if no_data is None else no_data,
+    )
+    result = gdal.BuildVRT(output_path, [base_path] + tiles, options=options)
+    if result is None:
+        raise Exception(f"Could not write overlay raster: {output_path}")
+    result = None
+
+    _make_sources_relative(output_path)
+    return output_path
+
+def _make_sources_relative(vrt_path: str):
+    """Rewrites the absolute source paths of a VRT relative to the VRT (BuildVRT only does so for files below it)."""
+    vrt_folder = os.path.dirname(os.path.abspath(vrt_path))
+    tree = ElementTree.parse(vrt_path)
+    for source in tree.iter("SourceFilename"):
+        if source.get("relativeToVRT") == "1":
+            continue
+        source.text = os.path.relpath(os.path.abspath(source.text), vrt_folder)
+        source.set("relativeToVRT", "1")
+    tree.write(vrt_path)
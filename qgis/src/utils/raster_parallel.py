@@ -0,0 +1,128 @@
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from osgeo import gdal
+from src.utils.raster_blocks import Window
+
+# Block size of the tiled outputs (see TILED_GTIFF_OPTIONS); parallel windows are aligned to it
+OUTPUT_BLOCK_SIZE = (256, 256)
+
+_executors: dict[int, ProcessPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+class WindowStage:
+    """
+    A raster stage that can compute any window of its output grid on its own, in any process.
+    Subclasses keep only picklable state (paths, grid, parameters) and open their datasets lazily.
+    A stage with more than one band returns a (bands, rows, columns) array per window.
+    """
+    halo: int = 0
+    bytes_per_pixel: int = 8
+    bands: int = 1
+
+    def compute(self, window: Window):
+        raise NotImplementedError
+
+def get_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns a process pool that is kept alive between requests. Workers are spawned (not forked)
+    so they do not inherit the QGIS application of the API process; they only use GDAL and NumPy.
+    """
+    with _executors_lock:
+        if workers not in _executors:
+            _executors[workers] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executors[workers]
+
+def _discard_executor(workers: int, executor: ProcessPoolExecutor):
+    """Drops a broken process pool, so the next stage gets a new one."""
+    with _executors_lock:
+        if _executors.get(workers) is executor:
+            del _executors[workers]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _write_values(output: gdal.Dataset, window: Window, values):
+    if values.ndim == 2:
+        values = values[np.newaxis]
+    for index, band_values in enumerate(values):
+        output.GetRasterBand(index + 1).WriteArray(band_values, window.xoff, window.yoff)
+
+def _open_output(output_path: str) -> gdal.Dataset:
+    output = gdal.Open(output_path, gdal.GA_Update)
+    if output is None:
+        raise Exception(f"Could not open output raster for writing: {output_path}")
+    return output
+
+def compute_window(stage: WindowStage, window: Window):
+    """Computes one window of a stage, in a worker process."""
+    return stage.compute(window)
+
+def write_windows(stage: WindowStage, output_path: str, windows: list[Window]) -> int:
+    """
+    Computes the windows of a stage and writes them into an existing output raster.
+
+    :return: The number of windows written
+    """
+    output = _open_output(output_path)
+    for window in windows:
+        _write_values(output, window, stage.compute(window))
+
+    output.FlushCache()
+    output = None
+    return len(windows)
+
+def run_stage(stage: WindowStage, output_path: str, windows: list[Window], workers: int = 1):
+    """
+    Runs a stage over the given windows of an existing (closed) output raster.
+
+    With more than one worker the windows are computed in the worker processes, which return
+    the values; only this process writes to the output, since GDAL does not support several
+    writers of one dataset. At most two windows per worker are in flight, so the values that
+    wait to be written stay within a few memory budgets.
+
+    When a worker process dies (for example killed for its memory) the pool is replaced and the
+    stage runs once more; every window is written whole, so running it again is safe.
+    """
+    if workers <= 1 or len(windows) < 2:
+        write_windows(stage, output_path, windows)
+        return
+
+    for attempt in range(2):
+        executor = get_executor(workers)
+        try:
+            _run_windows(executor, stage, output_path, windows, workers)
+            return
+        except BrokenProcessPool:
+            _discard_executor(workers, executor)
+            if attempt == 1:
+                raise
+            print("A raster worker process died, running the stage again in a new pool")
+
+def _run_windows(
+    executor: ProcessPoolExecutor, stage: WindowStage, output_path: str, windows: list[Window], workers: int
+):
+    output = _open_output(output_path)
+    pending = deque()
+    remaining = iter(windows)
+    try:
+        for window in remaining:
+            pending.append((window, executor.submit(compute_window, stage, window)))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            window, future = pending.popleft()
+            _write_values(output, window, future.result())
+            next_window = next(remaining, None)
+            if next_window is not None:
+                pending.append((next_window, executor.submit(compute_window, stage, next_window)))
+    finally:
+        for _, future in pending:
+            future.cancel()
+        # Closed here, also on errors, so a second run does not open the output next to this handle
+        output.FlushCache()
+        output = None
@@ -0,0 +1,81 @@
+import math
+from osgeo import gdal
+from src.utils.raster_blocks import Window, TILED_GTIFF_OPTIONS
+
+# Bounds are (xmin, xmax, ymin, ymax) in map units, like the projwin of the raster calculator
+Bounds = tuple[float, float, float, float]
+
+def expand_bounds(bounds: Bounds, distance: float) -> Bounds:
+    xmin, xmax, ymin, ymax = bounds
+    return xmin - distance, xmax + distance, ymin - distance, ymax + distance
+
+def union_bounds(bounds: list[Bounds]) -> Bounds:
+    return (
+        min(b[0] for b in bounds),
+        max(b[1] for b in bounds),
+        min(b[2] for b in bounds),
+        max(b[3] for b in bounds),
+    )
+
+def intersects(a: Bounds, b: Bounds) -> bool:
+    return a[0] < b[1] and b[0] < a[1] and a[2] < b[3] and b[2] < a[3]
+
+def pixel_size(path: str) -> float:
+    """The largest (absolute) pixel size of a raster, in map units."""
+    dataset = gdal.Open(path)
+    if dataset is None:
+        raise Exception(f"Could not open raster: {path}")
+    gt = dataset.GetGeoTransform()
+    return max(abs(gt[1]), abs(gt[5]))
+
+def pixel_window(dataset: gdal.Dataset, bounds: Bounds) -> Window | None:
+    """
+    The pixels of a raster that touch the bounds, clamped to the raster.
+
+    :return: The window, or None if the bounds do not overlap the raster
+    """
+    gt = dataset.GetGeoTransform()
+    if gt[2] != 0 or gt[4] != 0:
+        raise ValueError("Rotated rasters are not supported")
+
+    xmin, xmax, ymin, ymax = bounds
+    cols = sorted(((xmin - gt[0]) / gt[1], (xmax - gt[0]) / gt[1]))
+    rows = sorted(((ymax - gt[3]) / gt[5], (ymin - gt[3]) / gt[5]))
+
+    left = max(0, math.floor(cols[0]))
+    right = min(dataset.RasterXSize, math.ceil(cols[1]))
+    top = max(0, math.floor(rows[0]))
+    bottom = min(dataset.RasterYSize, math.ceil(rows[1]))
+
+    if right <= left or bottom <= top:
+        return None
+    return Window(left, top, right - left, bottom - top)
+
+def crop_raster(
+    input_path: str,
+    bounds: Bounds,
+    output_path: str,
+    creation_options: list[str] = TILED_GTIFF_OPTIONS,
+) -> str:
+    """
+    Copies the pixels of a raster that touch the bounds to a new (tiled) GeoTIFF on the same pixel grid.
+    """
+    source = gdal.Open(input_path)
+    if source is None:
+        raise Exception(f"Could not open raster: {input_path}")
+
+    window = pixel_window(source, bounds)
+    if window is None:
+        raise ValueError(f"Bounds {bounds} do not overlap raster: {input_path}")
+
+    result = gdal.Translate(
+        output_path,
+        source,
+        srcWin=list(window),
+        format="GTiff",
+        creationOptions=creation_options,
+    )
+    if result is None:
+        raise Exception(f"Could not crop raster to: {output_path}")
+    result = None
+    return output_path
@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+
+class ScratchWorkspace:
+    """
+    A namespace for throwaway intermediates: a temporary folder on disk that is removed on cleanup,
+    or when the `with` block ends. Files in it can be read by other processes, like the command line
+    GDAL tools that the gdal:* processing algorithms run and the raster workers.
+    """
+    def __init__(self, name: str = "scratch", parent_dir: str | None = None):
+        """
+        :param str name: Prefix of the folder, for recognizable paths in the logs
+        :param str parent_dir: Parent of the temporary folder, the system temp dir by default
+        """
+        self.name = name
+        self.parent_dir = parent_dir
+        self._disk_root = None
+
+    def __enter__(self) -> "ScratchWorkspace":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+    @property
+    def disk_root(self) -> str:
+        if self._disk_root is None:
+            self._disk_root = tempfile.mkdtemp(prefix=f"{self.name}_", dir=self.parent_dir)
+        return self._disk_root
+
+    def path(self, filename: str) -> str:
+        """
+        A path for a new intermediate file in the workspace.
+
+        :param str filename: The file name, unique within the workspace
+        """
+        return os.path.join(self.disk_root, filename)
+
+    def cleanup(self):
+        if self._disk_root is not None:
+            shutil.rmtree(self._disk_root, ignore_errors=True)
+            self._disk_root = None
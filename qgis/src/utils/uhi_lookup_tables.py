@@ -1,4 +1,9 @@
-from datetime import datetime, date
+from datetime import datetime, date, timezone
+from functools import lru_cache
+import numpy as np
+
+# First day-of-year index of every month in a leap year, so every (month, day) has its own row
+_MONTH_STARTS = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
 
 class UHILookupTables:
     """Lookup tables for UHI corrections based on sunrise/sunset times"""
@@ -29,6 +34,48 @@ class UHILookupTables:
         "3/20": [1.000, 0.866, 0.690, 0.560, 0.380, 0.107, 0.015, -0.020, -0.007, 0.007, 0.029, 0.050, 0.074, 0.108, 0.161, 0.228, 0.312, 0.424, 0.556, 0.695, 0.838, 0.911, 0.964],
     }
     
+    @classmethod
+    @lru_cache(maxsize=1)
+    def dense_table(cls) -> np.ndarray:
+        """
+        The UHI factors compiled into a (366, 24) day-of-year (of a leap year) by hour (UTC) array.
+        Days outside the defined periods are NaN. Hour 23 uses the factor of hour 22.
+        """
+        table = np.full((366, 24), np.nan)
+        for (start_month, start_day), (end_month, end_day), category in cls.SUNRISE_SUNSET_PERIODS:
+            start = _MONTH_STARTS[start_month - 1] + start_day - 1
+            end = _MONTH_STARTS[end_month - 1] + end_day - 1
+            factors = cls.UHI_FACTORS[category]
+            table[start:end + 1, :23] = factors
+            table[start:end + 1, 23] = factors[22]
+        table.flags.writeable = False
+        return table
+
+    @classmethod
+    def get_uhi_factors(cls, datetimes) -> np.ma.MaskedArray:
+        """
+        Get the UHI correction factors for many datetimes at once.
+
+        :param datetimes: datetime objects or numpy datetime64 values (in UTC); aware datetimes are converted to UTC
+        :return: UHI factors, masked where the date is outside the defined periods (April 1 - September 30)
+        """
+        values = np.asarray(datetimes)
+        if values.dtype == object:
+            values = np.array(
+                [dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt for dt in values.ravel()],
+                dtype="datetime64[h]",
+            ).reshape(values.shape)
+        hours = values.astype("datetime64[h]")
+        days = hours.astype("datetime64[D]")
+        months = days.astype("datetime64[M]")
+
+        month = months.astype(np.int64) % 12
+        day = (days - months).astype(np.int64)
+        hour = (hours - days).astype(np.int64)
+
+        factors = cls.dense_table()[_MONTH_STARTS[month] + day, hour]
+        return np.ma.masked_invalid(factors)
+
     @staticmethod
     def get_sunrise_sunset_category(dt: datetime) -> str:
         """
@@ -59,14 +106,8 @@ class UHILookupTables:
         :param dt: datetime object (should be in UTC)
         :return: UHI factor
         """
-        category = UHILookupTables.get_sunrise_sunset_category(dt)
-        hour = dt.hour
-        
-        # Handle hour 23 (wraps to next day)
-        if hour == 23:
-            return UHILookupTables.UHI_FACTORS[category][22]
-        
-        if hour < 0 or hour > 22:
-            raise ValueError(f"Hour must be between 0 and 23, got {hour}")
-        
-        return UHILookupTables.UHI_FACTORS[category][hour]
+        factor = UHILookupTables.get_uhi_factors([dt])[0]
+        if factor is np.ma.masked:
+            raise ValueError(f"Date {dt.date()} is outside defined UHI lookup periods (April 1 - September 30)")
+
+        return float(factor)
@@ -1,7 +1,9 @@
 from qgis.core import QgsProject, QgsRasterLayer
 
 def update_pet_layer_in_project(project_path: str, new_raster_path: str, base_name:str, style_path: str='/data/server/styles/new-default.qml'):
-    project = QgsProject.instance()
+    # A project of its own instead of the QgsProject.instance() singleton, so updates of different sessions
+    # can run at the same time
+    project = QgsProject()
     
     if not project.read(project_path):
         raise RuntimeError("Unable to read QGIS project")
@@ -0,0 +1,57 @@
+import os
+from osgeo import gdal
+from src.utils.raster_blocks import TILED_GTIFF_OPTIONS
+
+# Resampling methods in the order of the RESAMPLING parameter of gdal:warpreproject
+RESAMPLING_METHODS = [
+    "near", "bilinear", "cubic", "cubicspline", "lanczos", "average", "mode", "max", "min", "med", "q1", "q3",
+]
+
+def is_virtual(path: str) -> bool:
+    return path.lower().endswith(".vrt")
+
+def _format_options(output_path: str) -> dict:
+    """A VRT for .vrt paths, a tiled GeoTIFF otherwise."""
+    if is_virtual(output_path):
+        return {"format": "VRT"}
+    return {"format": "GTiff", "creationOptions": TILED_GTIFF_OPTIONS}
+
+def warp_raster(
+    input_path: str,
+    output_path: str,
+    srs_wkt: str,
+    resolution: float,
+    resampling: int = 0,
+    data_type: int = gdal.GDT_Float32,
+) -> str:
+    """
+    Reprojects and resamples a raster onto a grid with the given CRS and resolution, aligned to
+    multiples of the resolution (like gdal:warpreproject with TARGET_ALIGN). A .vrt output is a warped
+    VRT: the warp is done window by window when it is read.
+
+    :param int resampling: Index into RESAMPLING_METHODS (0 = nearest)
+    :return: The output path
+    """
+    result = gdal.Warp(
+        output_path,
+        input_path,
+        dstSRS=srs_wkt,
+        xRes=resolution,
+        yRes=resolution,
+        targetAlignedPixels=True,
+        resampleAlg=RESAMPLING_METHODS[resampling],
+        outputType=data_type,
+        **_format_options(output_path),
+    )
+    if result is None:
+        raise Exception(f"Could not warp raster to: {output_path}")
+    result = None
+    return output_path
+
+def materialize(input_path: str, output_path: str) -> str:
+    """Writes the pixels of a (virtual) raster to a tiled GeoTIFF."""
+    result = gdal.Translate(output_path, input_path, format="GTiff", creationOptions=TILED_GTIFF_OPTIONS)
+    if result is None:
+        raise Exception(f"Could not write raster: {output_path}")
+    result = None
+    return output_path
@@ -0,0 +1,245 @@
+import atexit
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+import time
+import traceback
+from typing import Callable
+
+def _process_rss_mb(pid: int | str = "self") -> float:
+    """The resident memory of a process in MB, 0 if it is gone."""
+    try:
+        with open(f"/proc/{pid}/statm") as file:
+            resident_pages = int(file.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+def _rss_mb() -> float:
+    """
+    The resident memory of this process and of its child processes (like the process pool of the raster
+    stages, where most of the memory of a job is used) in MB.
+    """
+    own = _process_rss_mb()
+    if own == 0.0:
+        # No /proc: the peak instead of the current memory, in KB on Linux
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return own + sum(_process_rss_mb(child.pid) for child in multiprocessing.active_children())
+
+def _worker_main(connection, initializer: Callable | None, initargs: tuple):
+    """Loop of a worker process: initialize once, then run the jobs that arrive over the connection."""
+    # Keep what the initializer returns (the QgsApplication) alive for the lifetime of the worker
+    state = initializer(*initargs) if initializer is not None else None
+    connection.send(("ready", None, _rss_mb()))
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        function, args, kwargs = message
+        try:
+            result = function(*args, **kwargs)
+            connection.send(("ok", result, _rss_mb()))
+        except Exception as exc:
+            traceback.print_exc()
+            connection.send(("error", f"{type(exc).__name__}: {exc}", _rss_mb()))
+
+    connection.close()
+    del state
+
+class _Worker:
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.jobs = 0
+
+class WorkerPool:
+    """
+    A warm pool of worker processes that are initialized once (for example with QGIS and Processing)
+    and then run jobs one at a time, sent to them over a pipe. A worker is replaced by a fresh one
+    after max_jobs jobs, once its memory passes max_memory_mb, or when it dies.
+
+    A worker that fails to start is retried with a backoff. After start_attempts failures its slot is
+    given up; once every slot is given up the pool is unhealthy and run fails right away.
+
+    Jobs are module level functions with picklable arguments and results.
+    """
+    def __init__(
+        self,
+        size: int,
+        initializer: Callable | None = None,
+        initargs: tuple = (),
+        max_jobs: int = 50,
+        max_memory_mb: float = 4096,
+        acquire_timeout: float = 600,
+        start_attempts: int = 5,
+    ):
+        """
+        :param int size: The number of worker processes
+        :param initializer: Module level function each worker runs once at start
+        :param tuple initargs: The (picklable) arguments of the initializer
+        :param int max_jobs: Jobs after which a worker is replaced
+        :param float max_memory_mb: Resident memory after a job above which a worker is replaced
+        :param float acquire_timeout: Seconds a job waits for an idle worker before it fails
+        :param int start_attempts: Attempts to start a worker before its slot is given up
+        """
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_jobs = max_jobs
+        self.max_memory_mb = max_memory_mb
+        self.start_attempts = start_attempts
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: queue.Queue = queue.Queue()
+        self._workers: list[_Worker] = []
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self._failed_slots = 0
+
+    @property
+    def healthy(self) -> bool:
+        """False once no worker could be started in any of the slots."""
+        return self._failed_slots < self.size
+
+    def start(self):
+        """Starts the workers in the background, so the first job does not wait for all of them."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        atexit.register(self.shutdown)
+        for _ in range(self.size):
+            self._spawn_in_background()
+
+    def run(self, function: Callable, *args, **kwargs):
+        """
+        Runs the function on an idle worker, waiting for one if all are busy.
+
+        :return: The result of the function
+        :raises RuntimeError: When the function raised, or the worker died while running it
+        """
+        self.start()
+        worker = self._acquire()
+        try:
+            worker.connection.send((function, args, kwargs))
+            status, result, rss_mb = worker.connection.recv()
+        except (EOFError, OSError):
+            self._retire(worker)
+            raise RuntimeError("The worker process died while running the job")
+
+        worker.jobs += 1
+        if worker.jobs >= self.max_jobs or rss_mb > self.max_memory_mb:
+            print(f"Recycling worker {worker.process.pid} after {worker.jobs} job(s) at {rss_mb:.0f} MB")
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+
+        if status == "error":
+            raise RuntimeError(result)
+        return result
+
+    def _acquire(self) -> _Worker:
+        """Waits for an idle worker, checking every second whether any worker can still start."""
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            if not self.healthy:
+                raise RuntimeError("No worker process could be started")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RuntimeError(f"No worker process became available within {self.acquire_timeout:.0f}s")
+            try:
+                return self._idle.get(timeout=min(1.0, remaining))
+            except queue.Empty:
+                continue
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+            self._workers = []
+        for worker in workers:
+            self._stop(worker)
+
+    def _retire(self, worker: _Worker):
+        """Stops the worker and starts a replacement, without keeping the caller waiting."""
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        self._spawn_in_background(worker)
+
+    def _spawn_in_background(self, retired: _Worker | None = None):
+        def replace():
+            if retired is not None:
+                self._stop(retired)
+            self._start_worker()
+        threading.Thread(target=replace, name="worker-spawn", daemon=True).start()
+
+    def _start_worker(self):
+        """Starts a worker, retrying with a backoff; gives up the slot after start_attempts failures."""
+        for attempt in range(self.start_attempts):
+            if self._closed or self._spawn():
+                return
+            if attempt < self.start_attempts - 1:
+                time.sleep(min(2 ** attempt, 30))
+
+        with self._lock:
+            self._failed_slots += 1
+            failed = self._failed_slots
+        print(f"Gave up starting a worker after {self.start_attempts} attempts ({failed} of {self.size} slot(s) failed)")
+
+    def _spawn(self) -> bool:
+        """
+        Starts a worker and waits until it is initialized.
+
+        :return: False if the worker failed to start
+        """
+        if self._closed:
+            return True
+        parent_connection, child_connection = self._context.Pipe()
+        # Not a daemon: the jobs start process pools of their own
+        process = self._context.Process(
+            target=_worker_main, args=(child_connection, self.initializer, self.initargs), daemon=False
+        )
+        process.start()
+        child_connection.close()
+
+        try:
+            status, _, _ = parent_connection.recv()
+        except EOFError:
+            process.join()
+            print(f"Worker process failed to start (exit code {process.exitcode})")
+            return False
+        if status != "ready":
+            process.terminate()
+            print(f"Worker process failed to start (status {status})")
+            return False
+
+        worker = _Worker(process, parent_connection)
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._workers.append(worker)
+        if closed:
+            self._stop(worker)
+            return True
+        self._idle.put(worker)
+        print(f"Worker {process.pid} ready")
+        return True
+
+    def _stop(self, worker: _Worker):
+        try:
+            worker.connection.send(None)
+        except OSError:
+            pass
+        worker.process.join(timeout=10)
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker.connection.close()
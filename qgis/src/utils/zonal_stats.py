@@ -0,0 +1,163 @@
+import math
+import numpy as np
+from osgeo import gdal, ogr, osr
+from src.utils.raster_calculator import RasterCalculator, RasterGrid
+from src.utils.raster_blocks import TILED_GTIFF_OPTIONS, block_windows
+
+STATISTICS = ("mean", "min", "max", "count", "sum")
+
+def rasterize_zones(
+    geometries: list[bytes],
+    srs_wkt: str,
+    grid: RasterGrid,
+    output_path: str,
+) -> str:
+    """
+    Burns zone labels into a UInt32 raster on the given grid: the geometry at position i gets label i + 1,
+    pixels outside every zone are 0. A pixel belongs to a zone when its centre lies inside the zone
+    (like QgsZonalStatistics); where zones overlap the last one wins.
+
+    :param list geometries: The zone geometries as WKB (None for features without geometry)
+    :param str srs_wkt: The CRS of the geometries, it must match the grid
+    :param RasterGrid grid: The grid of the label raster
+    :param str output_path: Path of the label raster
+    :return: The output path
+    """
+    srs = osr.SpatialReference(wkt=srs_wkt)
+    if grid.projection and not srs.IsSame(osr.SpatialReference(wkt=grid.projection)):
+        raise ValueError("The zones and the raster must share the same CRS")
+
+    driver = ogr.GetDriverByName("Memory") or ogr.GetDriverByName("MEM")
+    source = driver.CreateDataSource("zones")
+    layer = source.CreateLayer("zones", srs=srs, geom_type=ogr.wkbUnknown)
+    layer.CreateField(ogr.FieldDefn("label", ogr.OFTInteger64))
+    definition = layer.GetLayerDefn()
+    for label, wkb in enumerate(geometries, start=1):
+        if wkb is None:
+            continue
+        feature = ogr.Feature(definition)
+        feature.SetField("label", label)
+        feature.SetGeometry(ogr.CreateGeometryFromWkb(wkb))
+        layer.CreateFeature(feature)
+
+    output = RasterCalculator().create_output(output_path, grid, gdal.GDT_UInt32, None, options=TILED_GTIFF_OPTIONS)
+    output.GetRasterBand(1).Fill(0)
+    if gdal.RasterizeLayer(output, [1], layer, options=["ATTRIBUTE=label"]) != 0:
+        raise Exception(f"Could not rasterize the zones to: {output_path}")
+    output.FlushCache()
+    output = None
+    return output_path
+
+class ZonalStatistics:
+    """
+    Zonal statistics of many rasters in one streaming pass over a zone-label raster.
+
+    Every window of the label raster is read once, together with the same window of every raster
+    on that grid, and the statistics of all zones are accumulated with bincount-style reductions.
+    """
+    def __init__(self, memory_budget_mb: float = 256):
+        self.memory_budget_mb = memory_budget_mb
+        self.raster_calculator = RasterCalculator(memory_budget_mb)
+
+    def calculate(
+        self,
+        label_path: str,
+        zone_count: int,
+        rasters: dict[str, str | tuple[str, int]],
+        fallback_points: list[tuple[float, float] | None] | None = None,
+    ) -> dict[str, dict[str, np.ndarray]]:
+        """
+        :param str label_path: The zone-label raster (see rasterize_zones); the rasters are read on its grid
+        :param int zone_count: The number of zones (the highest label)
+        :param dict rasters: Name -> raster path or (path, band)
+        :param list fallback_points: Per zone a point (for example its centroid) whose pixel is used
+                                     when no pixel centre lies inside the zone, like small zones in QGIS
+        :return: Per raster name the arrays 'mean', 'min', 'max', 'count' and 'sum', one value per zone
+                 (NaN where a zone has no valid pixel; 'count' stays 0 for fallback values)
+        """
+        labels_dataset = gdal.Open(label_path)
+        if labels_dataset is None:
+            raise Exception(f"Could not open zone-label raster: {label_path}")
+        labels_band = labels_dataset.GetRasterBand(1)
+        grid = self.raster_calculator.intersect_grid([labels_dataset])
+
+        sources = self.raster_calculator.open_inputs(rasters)
+        size = zone_count + 1
+        sums = {name: np.zeros(size) for name in rasters}
+        counts = {name: np.zeros(size, dtype=np.int64) for name in rasters}
+        minimums = {name: np.full(size, np.inf) for name in rasters}
+        maximums = {name: np.full(size, -np.inf) for name in rasters}
+
+        # Per pixel: the labels and per raster its values (float64 + mask) and the sorted copies
+        bytes_per_pixel = 4 + len(rasters) * (9 + 8 + 8 + 4)
+        for window in block_windows(
+            grid.xsize, grid.ysize, tuple(labels_band.GetBlockSize()), bytes_per_pixel, self.memory_budget_mb
+        ):
+            labels = labels_band.ReadAsArray(*window).astype(np.int64)
+            in_zone = labels > 0
+            if not in_zone.any():
+                continue
+
+            for name, (dataset, band) in sources.items():
+                values, valid = self.raster_calculator.read_window(dataset, band, grid, *window)
+                valid &= in_zone
+                zone_labels = labels[valid]
+                if zone_labels.size == 0:
+                    continue
+                zone_values = values[valid].astype(np.float64)
+
+                sums[name] += np.bincount(zone_labels, weights=zone_values, minlength=size)
+                counts[name] += np.bincount(zone_labels, minlength=size)
+
+                order = np.argsort(zone_labels, kind="stable")
+                sorted_labels = zone_labels[order]
+                sorted_values = zone_values[order]
+                starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+                present = sorted_labels[starts]
+                minimums[name][present] = np.minimum(minimums[name][present], np.minimum.reduceat(sorted_values, starts))
+                maximums[name][present] = np.maximum(maximums[name][present], np.maximum.reduceat(sorted_values, starts))
+
+        results = {}
+        for name in rasters:
+            count = counts[name]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.where(count > 0, sums[name] / count, np.nan)
+            results[name] = {
+                "mean": mean,
+                "min": np.where(count > 0, minimums[name], np.nan),
+                "max": np.where(count > 0, maximums[name], np.nan),
+                "count": count,
+                "sum": np.where(count > 0, sums[name], np.nan),
+            }
+
+        if fallback_points is not None:
+            self._apply_fallback(results, sources, grid, fallback_points)
+
+        # Label 0 is "no zone"
+        return {name: {stat: values[1:] for stat, values in stats.items()} for name, stats in results.items()}
+
+    def _apply_fallback(
+        self,
+        results: dict[str, dict[str, np.ndarray]],
+        sources: dict[str, tuple[gdal.Dataset, int]],
+        grid: RasterGrid,
+        fallback_points: list[tuple[float, float] | None],
+    ):
+        """Uses the pixel under the fallback point of every zone without pixels."""
+        gt = grid.geotransform
+        for name, (dataset, band) in sources.items():
+            stats = results[name]
+            for label in np.flatnonzero(stats["count"] == 0):
+                if label == 0 or label > len(fallback_points) or fallback_points[label - 1] is None:
+                    continue
+                x, y = fallback_points[label - 1]
+                col = math.floor((x - gt[0]) / gt[1])
+                row = math.floor((y - gt[3]) / gt[5])
+                if not (0 <= col < grid.xsize and 0 <= row < grid.ysize):
+                    continue
+
+                values, valid = self.raster_calculator.read_window(dataset, band, grid, col, row, 1, 1)
+                if valid[0, 0]:
+                    value = float(values[0, 0])
+                    for stat in ("mean", "min", "max", "sum"):
+                        stats[stat][label] = value
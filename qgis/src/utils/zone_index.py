@@ -0,0 +1,120 @@
+import hashlib
+import os
+import uuid
+from typing import NamedTuple
+import numpy as np
+from osgeo import gdal
+from src.utils.raster_calculator import RasterCalculator, RasterGrid, SourceStage
+from src.utils.raster_blocks import Window
+from src.utils.zonal_stats import rasterize_zones
+
+class ZoneIndex(NamedTuple):
+    """A zone-label raster: pixel label i + 1 belongs to the feature fids[i], 0 to no feature."""
+    path: str
+    fids: np.ndarray
+    grid: RasterGrid
+
+def zone_key(fids: np.ndarray, geometries: list[bytes | None], srs_wkt: str, grid: RasterGrid) -> str:
+    """
+    Hash of everything a zone-label raster depends on: the feature ids and geometries (in label order),
+    their CRS and the grid. The attributes are left out, so writing fields does not invalidate the index.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((tuple(grid.geotransform), grid.xsize, grid.ysize, grid.projection, srs_wkt)).encode())
+    digest.update(np.asarray(fids, dtype=np.int64).tobytes())
+    for wkb in geometries:
+        digest.update(b"\0" if wkb is None else hashlib.sha256(wkb).digest())
+    return digest.hexdigest()
+
+def build_zone_index(
+    index_dir: str,
+    fids: np.ndarray,
+    geometries: list[bytes | None],
+    srs_wkt: str,
+    grid: RasterGrid,
+) -> ZoneIndex:
+    """
+    Returns the zone-label raster of the zones on the grid, rasterizing it only when no raster
+    with the same key exists in index_dir yet.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, f"zones_{zone_key(fids, geometries, srs_wkt, grid)}.tif")
+
+    if not os.path.exists(path):
+        # Written under a name of its own first, so a concurrent reader never sees half a raster and
+        # concurrent builders (threads of one process included) never write into the same file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.tif"
+        rasterize_zones(geometries, srs_wkt, grid, tmp_path)
+        os.replace(tmp_path, path)
+        print(f"Zone index built: {path}")
+
+    return ZoneIndex(path, np.asarray(fids, dtype=np.int64), grid)
+
+def label_lookup(index: ZoneIndex, fids: np.ndarray, values: np.ndarray, no_data: float) -> np.ndarray:
+    """
+    Lookup table from label to value: entry 0 (no zone) and features without a value get no_data.
+
+    :param np.ndarray fids: The feature ids of the values, in any order
+    :param np.ndarray values: One value per feature id (NaN for NULL)
+    """
+    lookup = np.full(len(index.fids) + 1, no_data, dtype=np.float64)
+    if len(fids) == 0:
+        return lookup
+
+    order = np.argsort(fids)
+    sorted_fids = np.asarray(fids, dtype=np.int64)[order]
+    sorted_values = np.asarray(values, dtype=np.float64)[order]
+    positions = np.minimum(np.searchsorted(sorted_fids, index.fids), len(sorted_fids) - 1)
+    found = sorted_fids[positions] == index.fids
+
+    zone_values = np.where(found, sorted_values[positions], np.nan)
+    lookup[1:] = np.where(np.isnan(zone_values), no_data, zone_values)
+    return lookup
+
+class LabelGatherStage(SourceStage):
+    """
+    Replaces every zone label by the value of its zone: lookup[labels]. A 2D lookup table
+    (one row per band) gathers all bands from a single read of the labels.
+    """
+    def __init__(self, inputs: dict[str, str | tuple[str, int]], grid: RasterGrid, lookup: np.ndarray):
+        super().__init__(inputs, grid)
+        self.lookup = lookup
+        self.bands = 1 if lookup.ndim == 1 else lookup.shape[0]
+        # Per pixel: the labels (float64 + mask, int64) and the float32 result
+        self.bytes_per_pixel = 9 + 8 + 4 * self.bands
+
+    def compute(self, window: Window) -> np.ndarray:
+        dataset, band = self.sources["labels"]
+        labels, _ = RasterCalculator().read_window(dataset, band, self.grid, *window)
+        return self.lookup[..., labels.astype(np.int64)].astype(np.float32)
+
+def gather_raster(
+    index: ZoneIndex,
+    lookup: np.ndarray,
+    output_path: str,
+    no_data: float = 0.0,
+    band_names: list[str] | None = None,
+    memory_budget_mb: float = 256,
+    workers: int = 1,
+) -> str:
+    """
+    Writes a Float32 raster on the grid of the zone index with the lookup value of every zone.
+    This is the rasterization of attributes without traversing the polygons again.
+
+    :param np.ndarray lookup: Value per label (see label_lookup), or one row of values per output band
+    :param list band_names: Description per band, for example the attribute names
+    :return: The output path
+    """
+    calculator = RasterCalculator(memory_budget_mb, workers)
+    inputs = {"labels": index.path}
+    sources = calculator.open_inputs(inputs)
+    stage = LabelGatherStage(inputs, index.grid, lookup)
+    calculator.run(stage, sources, output_path, gdal.GDT_Float32, no_data)
+
+    if band_names:
+        output = gdal.Open(output_path, gdal.GA_Update)
+        for band, name in enumerate(band_names, start=1):
+            output.GetRasterBand(band).SetDescription(name)
+        output = None
+
+    return output_path